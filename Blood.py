@@ -1,7 +1,24 @@
+import json
+
 import streamlit as st
-import sqlite3
 import pandas as pd
-from datetime import datetime, timedelta
+
+import archive
+import blood_db
+import federation
+import forecast
+import instrumentation
+import live
+import recall
+import shortage
+import sweeper
+import write_queue
+from allocation import allocate
+from bulk_import import CHUNK_SIZE, import_donations
+from donations import insert_donation, insert_request
+from export import export_widget
+from optimal_allocation import allocate_optimal
+from pagination import paginated_table
 
 # ====================== PAGE CONFIG ======================
 st.set_page_config(
@@ -145,75 +162,14 @@ st.markdown("<p style='text-align: center; color: #666; font-size: 1.2rem;'>Savi
 st.markdown("---")
 
 # ====================== DATABASE SETUP ======================
-DB_FILE = "blood_donation.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("PRAGMA foreign_keys = ON")
-
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS blood_types (
-        blood_type TEXT PRIMARY KEY,
-        can_donate_to TEXT NOT NULL,
-        can_receive_from TEXT NOT NULL
-    );
-
-    CREATE TABLE IF NOT EXISTS donors (
-        donor_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        blood_type TEXT NOT NULL REFERENCES blood_types(blood_type),
-        phone TEXT,
-        last_donation_date DATE
-    );
-
-    CREATE TABLE IF NOT EXISTS blood_inventory (
-        bag_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        blood_type TEXT NOT NULL REFERENCES blood_types(blood_type),
-        donor_id INTEGER REFERENCES donors(donor_id),
-        donation_date DATE NOT NULL DEFAULT (date('now')),
-        expiry_date DATE NOT NULL,
-        volume_ml INTEGER DEFAULT 450,
-        status TEXT CHECK(status IN ('available', 'used', 'expired', 'discarded')) DEFAULT 'available'
-    );
-
-    CREATE TABLE IF NOT EXISTS hospital_requests (
-        request_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        hospital_name TEXT NOT NULL,
-        blood_type TEXT NOT NULL REFERENCES blood_types(blood_type),
-        quantity_needed INTEGER NOT NULL,
-        request_date DATE DEFAULT (date('now')),
-        urgency TEXT CHECK(urgency IN ('routine', 'urgent', 'emergency')) DEFAULT 'routine',
-        status TEXT DEFAULT 'pending'
-    );
-    """)
-
-    cur.execute("SELECT COUNT(*) FROM blood_types")
-    if cur.fetchone()[0] == 0:
-        cur.executescript("""
-        INSERT INTO blood_types (blood_type, can_donate_to, can_receive_from) VALUES
-        ('A+', 'A+,AB+', 'A+,A-,O+,O-'),
-        ('A-', 'A+,A-,AB+,AB-', 'A-,O-'),
-        ('B+', 'B+,AB+', 'B+,B-,O+,O-'),
-        ('B-', 'B+,B-,AB+,AB-', 'B-,O-'),
-        ('AB+', 'AB+', 'A+,A-,B+,B-,AB+,AB-,O+,O-'),
-        ('AB-', 'AB+,AB-', 'A-,B-,AB-,O-'),
-        ('O+', 'A+,B+,AB+,O+', 'O+,O-'),
-        ('O-', 'A+,A-,B+,B-,AB+,AB-,O+,O-', 'O-');
-        """)
-
-    conn.commit()
-    conn.close()
-
-init_db()
-
-def get_conn():
-    conn = sqlite3.connect(DB_FILE)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-    return conn
-
-conn = get_conn()
+# Pooled connection; the schema is migrated once per process, not on every rerun
+conn = blood_db.get_conn()
+# Bags past their expiry date are marked 'expired' by a background thread, hourly
+sweeper.start_background()
+# The days-of-supply forecast is recomputed once a day, the first hour after midnight UTC
+forecast.start_background()
+# Finished bags and requests move to the archive database once a day, in small batches
+archive.start_background()
 
 # ====================== SIDEBAR NAVIGATION WITH SEARCH ======================
 with st.sidebar:
@@ -224,105 +180,208 @@ with st.sidebar:
         "",
         [
             "🏠 Dashboard",
+            "📈 Supply Forecast",
+            "🌐 Network",
             "➕ Add Donation",
+            "📥 Bulk Import",
             "🔍 Search Donor",           # NEW: Donor Search
             "📝 Add Hospital Request",
             "🩺 Blood Inventory",
             "🚨 Urgent Requests",
             "⏳ Expiring Soon",
             "👥 Donors",
-            "🏥 Hospital Requests"
+            "📞 Donor Recall",
+            "🏥 Hospital Requests",
+            "📤 Export Data"
         ],
         label_visibility="collapsed"
     )
 
+# SQL and section timings for this run; ?admin=1 shows them in the sidebar
+instrumentation.begin_run("Blood", page)
+
+# ====================== LIVE MODE ======================
+def live_controls(view):
+    """Live toggle and refresh interval for a wall-screen page; True when live."""
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        on = st.toggle("🔴 Live", key=f"{view}_live")
+    with col2:
+        st.number_input("Refresh every (seconds)", min_value=1.0, max_value=300.0, value=live.REFRESH_SECONDS,
+                        step=1.0, key=f"{view}_interval", disabled=not on)
+    if not on:
+        live.stop(view)
+    return on
+
+# ====================== SHORTAGE CHECK ======================
+def shortage_flags(conn, df):
+    """Shortage banner and demand vs stock table; returns the urgent list with an at_risk column."""
+    report = shortage.detect(conn)
+    flagged = {key: units for key, units in report["short"].items() if key[0] in shortage.FLAGGED}
+    if flagged:
+        st.error("⚠️ Compatible stock on hand cannot cover: " + ", ".join(
+            f"{units} unit(s) of {blood_type} ({urgency})"
+            for (urgency, blood_type), units in sorted(flagged.items(), key=lambda kv: shortage.URGENCIES.index(kv[0][0]))))
+    else:
+        st.success("✅ Compatible stock on hand covers every urgent and emergency request.")
+    with st.expander("🩸 Pending demand vs compatible stock", expanded=bool(flagged)):
+        st.dataframe(report["by_type"].rename(columns={
+            "blood_type": "Blood Type", "bags": "Bags on Hand", "compatible_bags": "Compatible Bags",
+            "emergency_units": "Emergency Units", "urgent_units": "Urgent Units", "routine_units": "Routine Units",
+            "emergency_short": "Emergency Short", "urgent_short": "Urgent Short", "routine_short": "Routine Short"}),
+            use_container_width=True, hide_index=True)
+    return df.assign(at_risk=df["request_id"].isin(report["at_risk"]))
+
 # ====================== PAGE CONTENT ======================
 if page == "🏠 Dashboard":
     st.header("📊 Dashboard Overview")
+    # Everything here comes from the trigger-maintained summary tables:
+    # a few hundred (blood_type, expiry_date) rows at most, however big the inventory gets.
+    counters = dict(blood_db.cache.fetchall(conn, blood_db.DASHBOARD_COUNTERS_SQL))
+    avail = blood_db.cache.read_sql(conn, blood_db.DASHBOARD_STOCK_SQL)
+
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        total = pd.read_sql("SELECT COUNT(*) FROM blood_inventory WHERE status='available'", conn).iloc[0,0]
-        st.metric("🩸 Available Bags", total)
+        st.metric("🩸 Available Bags", int(avail["bags"].sum()))
     with col2:
-        urgent = pd.read_sql("SELECT COUNT(*) FROM hospital_requests WHERE urgency IN ('urgent','emergency') AND status='pending'", conn).iloc[0,0]
-        st.metric("🚨 Urgent Requests", urgent)
+        st.metric("🚨 Urgent Requests", counters.get("urgent_pending", 0))
     with col3:
-        donors = pd.read_sql("SELECT COUNT(*) FROM donors", conn).iloc[0,0]
-        st.metric("👥 Registered Donors", donors)
+        st.metric("👥 Registered Donors", counters.get("donors", 0))
     with col4:
-        expiring = pd.read_sql("SELECT COUNT(*) FROM blood_inventory WHERE status='available' AND expiry_date <= date('now','+7 days')", conn).iloc[0,0]
-        st.metric("⏳ Expiring Soon", expiring)
+        st.metric("⏳ Expiring Soon", int(avail["expiring"].sum()))
 
     st.markdown("### 🩸 Available Blood by Type")
-    avail = pd.read_sql("""
-        SELECT blood_type, COUNT(*) as bags, SUM(volume_ml) as total_ml 
-        FROM blood_inventory WHERE status='available' 
-        GROUP BY blood_type
-        ORDER BY blood_type
-    """, conn)
     if avail.empty:
         st.info("No blood in inventory yet. Start by adding a donation! ➕")
     else:
-        st.dataframe(avail, use_container_width=True)
+        st.dataframe(avail[["blood_type", "bags", "total_ml"]], use_container_width=True)
+
+elif page == "📈 Supply Forecast":
+    st.header("📈 Days of Supply by Blood Type")
+    # Precomputed nightly by forecast.py; this page only reads its 8 rows.
+    df = blood_db.cache.read_sql(conn, blood_db.SUPPLY_FORECAST_SQL)
+    if st.button("🔄 Recompute now"):
+        forecast.refresh(conn)
+        st.rerun()
+    if df.empty:
+        st.info("No forecast yet. It is computed nightly, or press Recompute now.")
+    else:
+        st.caption(f"Computed {df['computed_at'].max()} UTC from the last {forecast.HISTORY_DAYS} days of donations "
+                   f"and requests. Stock-out day counts from today, first expiry first out, with donations continuing.")
+        st.dataframe(
+            df.drop(columns=["computed_at", "projection"]).rename(columns={
+                "blood_type": "Blood Type", "available_bags": "Bags on Hand", "daily_demand": "Demand / Day",
+                "daily_donations": "Donations / Day", "days_of_supply": "Days of Supply",
+                "stockout_day": "Projected Stock-out (day)", "expiring_unused": "Bags Expiring Unused"}),
+            use_container_width=True, hide_index=True)
+        st.markdown(f"### 🩸 Projected Stock, Next {forecast.HORIZON_DAYS} Days")
+        st.line_chart(pd.DataFrame({row.blood_type: json.loads(row.projection) for row in df.itertuples()}))
+
+elif page == "🌐 Network":
+    st.header("🌐 Network Stock Across Sites")
+    sites = federation.load_registry()
+    with st.expander("⚙️ Sites"):
+        st.caption(f"Registered in {federation.REGISTRY}. Each site's database is opened read-only.")
+        for name, path in sites.items():
+            col1, col2 = st.columns([4, 1])
+            col1.markdown(f"**{name}** — `{path}`")
+            if col2.button("Remove", key=f"remove_site_{name}"):
+                federation.remove_site(name)
+                st.rerun()
+        with st.form("add_site", clear_on_submit=True):
+            col1, col2 = st.columns(2)
+            name = col1.text_input("Site name")
+            path = col2.text_input("Database path")
+            if st.form_submit_button("➕ Add site") and name and path:
+                federation.add_site(name.strip(), path.strip())
+                st.rerun()
+
+    network = federation.read_network(sites)
+    status = network["status"]
+    ok = status.loc[status["status"] == "ok", "site"].tolist()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Sites Reachable", f"{len(ok)} / {len(status)}")
+    col2.metric("Available Bags", f"{int(network['stock']['bags'].sum()) if ok else 0:,}")
+    expiring_total = int(network["stock"]["expiring"].sum()) if ok else 0
+    col3.metric("Expiring in 7 Days", f"{expiring_total:,}")
+    if len(ok) < len(status):
+        st.warning("Some sites could not be read and are left out of the totals below.")
+        st.dataframe(status, use_container_width=True, hide_index=True)
+
+    st.markdown("### 🩸 Available Bags by Site")
+    st.dataframe(federation.by_type(network["stock"], "bags", ok), use_container_width=True)
+    st.markdown("### 🏥 Pending Units Requested by Site")
+    st.dataframe(federation.by_type(network["pending"], "units", ok), use_container_width=True)
+    st.markdown("### ⏳ Expiring Soon Across the Network")
+    if network["expiring"].empty:
+        st.success("No bags expiring in the next 7 days at any site.")
+    else:
+        expiring = network["expiring"].sort_values(["expiry_date", "site"]).head(federation.EXPIRING_LIMIT)
+        st.dataframe(expiring, use_container_width=True, hide_index=True)
+        if expiring_total > len(expiring):
+            st.caption(f"Showing the first {len(expiring)} of {expiring_total:,}.")
+    slowest = status["ms"].max() if ok else 0
+    st.caption(f"Read {len(ok)} site(s) in parallel in {network['ms']:.0f} ms "
+               f"(slowest site {slowest:.0f} ms, all sites one after another {status['ms'].sum():.0f} ms).")
 
 elif page == "🔍 Search Donor":
     st.header("🔍 Search Donor")
     search_term = st.text_input("Enter Donor Name or Phone Number", placeholder="e.g. John or 123-456")
 
     if search_term:
-        query = """
-        SELECT name, blood_type, phone, last_donation_date 
-        FROM donors 
-        WHERE LOWER(name) LIKE LOWER(?) 
-           OR phone LIKE ?
-        ORDER BY name
-        """
-        pattern = f"%{search_term}%"
-        results = pd.read_sql(query, conn, params=(pattern, pattern))
-        
+        match = blood_db.donor_search_match(search_term)
+        if match:
+            results = blood_db.cache.read_sql(conn, blood_db.SEARCH_DONORS_SQL, (match, blood_db.SEARCH_LIMIT))
+        else:
+            results = pd.DataFrame()
+
         if results.empty:
             st.warning("No donors found matching your search.")
         else:
-            st.success(f"Found {len(results)} donor(s)")
+            if len(results) == blood_db.SEARCH_LIMIT:
+                st.success(f"Showing the {blood_db.SEARCH_LIMIT} best matches — refine your search to narrow it down")
+            else:
+                st.success(f"Found {len(results)} donor(s)")
             st.dataframe(results, use_container_width=True)
     else:
         st.info("Type a name or phone number to search for donors.")
 
 elif page == "🩺 Blood Inventory":
     st.header("🩺 Blood Inventory")
-    df = pd.read_sql("SELECT bag_id, blood_type, donation_date, expiry_date, volume_ml, status FROM blood_inventory ORDER BY expiry_date", conn)
-    if df.empty:
-        st.info("Inventory is currently empty.")
-    else:
-        st.dataframe(df, use_container_width=True)
+    paginated_table(conn, "inventory", "Inventory is currently empty.")
 
 elif page == "🚨 Urgent Requests":
     st.header("🚨 Urgent & Emergency Requests")
-    df = pd.read_sql("""
-        SELECT hospital_name, blood_type, quantity_needed, urgency, request_date
-        FROM hospital_requests 
-        WHERE status='pending' AND urgency IN ('urgent', 'emergency')
-        ORDER BY CASE urgency WHEN 'emergency' THEN 1 ELSE 2 END
-    """, conn)
-    if df.empty:
-        st.success("🎉 No urgent requests at the moment!")
+    strategy = st.radio("Allocation strategy", ["First expiry first out", "Least waste (optimal)"], horizontal=True)
+    if st.button("🩸 Allocate available bags to pending requests"):
+        result = allocate(conn) if strategy == "First expiry first out" else allocate_optimal(conn)
+        st.success(f"Issued {result['bags_issued']} bag(s) — {result['requests_fulfilled']} of "
+                   f"{result['pending_requests']} pending request(s) fulfilled.")
+    if live_controls("urgent"):
+        live.live_table("urgent", "🎉 No urgent requests at the moment!", st.session_state["urgent_interval"],
+                        annotate=shortage_flags)
     else:
-        st.dataframe(df, use_container_width=True)
+        df = shortage_flags(conn, blood_db.cache.read_sql(conn, blood_db.URGENT_REQUESTS_SQL))
+        if df.empty:
+            st.success("🎉 No urgent requests at the moment!")
+        else:
+            st.dataframe(df.drop(columns=["request_id"]), use_container_width=True)
 
 elif page == "⏳ Expiring Soon":
     st.header("⏳ Blood Expiring in Next 7 Days")
-    df = pd.read_sql("""
-        SELECT bag_id, blood_type, donation_date, expiry_date,
-               ROUND(julianday(expiry_date) - julianday('now')) AS days_left
-        FROM blood_inventory 
-        WHERE status='available' AND expiry_date <= date('now','+7 days')
-        ORDER BY expiry_date
-    """, conn)
-    if df.empty:
-        st.success("All blood bags are fresh! No expirations soon. ✅")
+    if live_controls("expiring"):
+        live.live_table("expiring", "All blood bags are fresh! No expirations soon. ✅",
+                        st.session_state["expiring_interval"])
     else:
-        st.dataframe(df, use_container_width=True)
+        table = blood_db.cache.read_arrow(conn, blood_db.EXPIRING_SOON_SQL, types=blood_db.DISPLAY_TYPES)
+        if table.num_rows == 0:
+            st.success("All blood bags are fresh! No expirations soon. ✅")
+        else:
+            st.dataframe(table, use_container_width=True)
+    last_sweep = conn.execute(sweeper.LAST_SWEEP_SQL).fetchone()
+    if last_sweep:
+        st.caption(f"Last expiry sweep: {last_sweep['swept_at']} UTC — {last_sweep['bags']} bag(s) marked expired.")
 
 elif page == "➕ Add Donation":
     st.header("➕ Record New Blood Donation")
@@ -341,43 +400,62 @@ elif page == "➕ Add Donation":
             if not donor_name.strip():
                 st.error("Donor name is required!")
             else:
-                today = datetime.now().strftime('%Y-%m-%d')
-                expiry = (datetime.now() + timedelta(days=42)).strftime('%Y-%m-%d')
-
-                cur = conn.cursor()
-                cur.execute("SELECT donor_id FROM donors WHERE name = ? AND blood_type = ?", (donor_name.strip(), donor_blood))
-                row = cur.fetchone()
-
-                if row:
-                    donor_id = row[0]
-                    cur.execute("UPDATE donors SET last_donation_date = ?, phone = COALESCE(?, phone) WHERE donor_id = ?",
-                                (today, donor_phone or None, donor_id))
-                else:
-                    cur.execute("INSERT INTO donors (name, blood_type, phone, last_donation_date) VALUES (?, ?, ?, ?)",
-                                (donor_name.strip(), donor_blood, donor_phone or None, today))
-                    donor_id = cur.lastrowid
-
-                cur.execute("INSERT INTO blood_inventory (blood_type, donor_id, donation_date, expiry_date, volume_ml) VALUES (?, ?, ?, ?, ?)",
-                            (donor_blood, donor_id, today, expiry, volume))
-                conn.commit()
+                # Committed by the intake queue together with whatever else was submitted meanwhile
+                _, _, expiry = write_queue.intake.call(
+                    insert_donation, donor_name, donor_blood, donor_phone.strip(), volume)
                 st.success(f"✅ Donation recorded! Bag expires on {expiry}")
                 st.rerun()
 
+elif page == "📥 Bulk Import":
+    st.header("📥 Bulk Import Donations")
+    st.markdown("Upload a CSV or Excel file with one donation per row. Columns: **name**, **blood_type**, "
+                "and optionally phone, donation_date, volume_ml, expiry_date.")
+    upload = st.file_uploader("Blood drive file", type=["csv", "xlsx"])
+    if upload and st.button("📥 Import donations"):
+        progress = st.empty()
+        summary, rejected = import_donations(
+            conn, upload, chunk_size=CHUNK_SIZE,
+            progress=lambda s: progress.info(f"⏳ {s['rows_read']} rows read — {s['bags_imported']} bags imported, "
+                                             f"{s['rejected']} rejected"))
+        progress.empty()
+        st.success(f"✅ Imported {summary['bags_imported']} bag(s) and {summary['new_donors']} new donor(s) "
+                   f"from {summary['rows_read']} row(s) in {summary['seconds']}s")
+        if len(rejected):
+            st.warning(f"{len(rejected)} row(s) were rejected")
+            st.dataframe(rejected.head(1000), use_container_width=True)
+            st.download_button("⬇️ Download rejected rows", rejected.to_csv(index=False),
+                               file_name="rejected_rows.csv", mime="text/csv")
+
 elif page == "👥 Donors":
     st.header("👥 Registered Donors")
-    df = pd.read_sql("SELECT name, blood_type, phone, last_donation_date FROM donors ORDER BY name", conn)
+    paginated_table(conn, "donors", "No donors registered yet.")
+
+elif page == "📞 Donor Recall":
+    st.header("📞 Donor Recall")
+    st.markdown(f"Donors who can give blood to the short type and last donated at least "
+                f"{recall.DEFERRAL_DAYS} days ago, most recently eligible first.")
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        short_type = st.selectbox("🩸 Short Blood Type", blood_db.BLOOD_TYPES, key="recall_type")
+    counts = recall.recall_counts(conn, short_type)
+    with col2:
+        st.metric("Eligible Donors", f"{sum(counts.values()):,}",
+                  " · ".join(f"{t}: {n:,}" for t, n in counts.items()), delta_color="off")
+    df = recall.recall_list(conn, short_type)
     if df.empty:
-        st.info("No donors registered yet.")
+        st.info("No eligible donors for this blood type right now.")
     else:
-        st.dataframe(df, use_container_width=True)
+        st.dataframe(df.drop(columns="donor_id"), use_container_width=True, hide_index=True)
+        st.caption(f"Showing the first {len(df)}; download the whole list below.")
+        fmt = st.selectbox("Format", ["csv", "parquet"], key="recall_format")
+        st.download_button(
+            "⬇️ Download recall list", data=lambda: recall.recall_file(short_type, fmt),
+            file_name=f"recall_{short_type}.{fmt}", mime="text/csv" if fmt == "csv" else "application/vnd.apache.parquet",
+            key="recall_download", on_click="ignore")
 
 elif page == "🏥 Hospital Requests":
     st.header("🏥 All Hospital Requests")
-    df = pd.read_sql("SELECT hospital_name, blood_type, quantity_needed, urgency, status, request_date FROM hospital_requests ORDER BY request_date DESC", conn)
-    if df.empty:
-        st.info("No hospital requests yet.")
-    else:
-        st.dataframe(df, use_container_width=True)
+    paginated_table(conn, "requests", "No hospital requests yet.")
 
 elif page == "📝 Add Hospital Request":
     st.header("📝 Add New Hospital Request")
@@ -396,13 +474,18 @@ elif page == "📝 Add Hospital Request":
             if not hospital.strip():
                 st.error("Hospital name is required!")
             else:
-                cur = conn.cursor()
-                cur.execute("INSERT INTO hospital_requests (hospital_name, blood_type, quantity_needed, urgency) VALUES (?, ?, ?, ?)",
-                            (hospital.strip(), blood_type, quantity, urgency))
-                conn.commit()
+                write_queue.intake.call(insert_request, hospital.strip(), blood_type, quantity, urgency)
                 st.success("Hospital request submitted successfully!")
                 st.rerun()
 
+elif page == "📤 Export Data":
+    st.header("📤 Export Data")
+    st.markdown("Download a full or filtered extract as CSV or Parquet. Large tables are written in chunks, "
+                "so this works for millions of rows.")
+    st.caption(f"Finished bags and requests older than {archive.ARCHIVE_AFTER_DAYS} days move to the archive; "
+               f"the *_history tables include them.")
+    export_widget(["inventory", "donors", "requests", "inventory_history", "requests_history"], key="export")
+
 # ====================== FOOTER ======================
 st.markdown("---")
 st.markdown("""
@@ -412,4 +495,6 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-conn.close()
+instrumentation.admin_panel()
+instrumentation.end_run()
+blood_db.release_conn(conn)
@@ -1,9 +1,11 @@
 # app.py - Hospital Management System with Plots, Colors, Icons & Full CRUD
 import streamlit as st
-import sqlite3
-import pandas as pd
 import plotly.express as px
-from datetime import datetime
+
+import hms_db
+import instrumentation
+from export import export_widget
+from instrumentation import timed
 
 # --------------------- Page Config & Custom CSS ---------------------
 st.set_page_config(
@@ -23,66 +25,52 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --------------------- Database Setup ---------------------
-DB_FILE = "hospital.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.executescript('''
-        CREATE TABLE IF NOT EXISTS Patients (pat_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, age INTEGER, gender TEXT, phone TEXT, address TEXT, email TEXT, registration_date TEXT DEFAULT (date('now')));
-        CREATE TABLE IF NOT EXISTS Doctors (doc_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, specialty TEXT, dept_id INTEGER, phone TEXT, email TEXT);
-        CREATE TABLE IF NOT EXISTS Appointments (app_id INTEGER PRIMARY KEY AUTOINCREMENT, pat_id INTEGER, doc_id INTEGER, app_date TEXT, app_time TEXT, status TEXT DEFAULT 'Scheduled');
-        CREATE TABLE IF NOT EXISTS MedicalRecords (record_id INTEGER PRIMARY KEY AUTOINCREMENT, pat_id INTEGER, doc_id INTEGER, diagnosis TEXT, treatment TEXT, prescription TEXT);
-        CREATE TABLE IF NOT EXISTS Billings (bill_id INTEGER PRIMARY KEY AUTOINCREMENT, pat_id INTEGER, amount REAL, details TEXT, payment_status TEXT DEFAULT 'Pending', bill_date TEXT DEFAULT (date('now')));
-    ''')
-    conn.commit()
-    conn.close()
-
-init_db()
+# Connections come from a process-wide pool (WAL, busy_timeout, statement cache);
+# the schema is migrated the first time the pool is used, not on every rerun.
+connection = hms_db.connection
 
 # --------------------- Helper Functions ---------------------
+# List views come back as Arrow tables (arrow_tables.py) and go to st.dataframe as is.
+@timed
 def get_data(table_name):
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-    conn.close()
-    return df
+    with connection() as conn:
+        return hms_db.cache.read_arrow(conn, f"SELECT * FROM {table_name}", types=hms_db.DISPLAY_TYPES)
 
 def insert_record(table_name, fields, values):
-    conn = sqlite3.connect(DB_FILE)
     placeholders = ', '.join(['?' for _ in values])
     columns = ', '.join(fields)
     sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-    conn.execute(sql, values)
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute(sql, values)
+        conn.commit()
 
 def delete_record(table_name, id_column, record_id):
-    conn = sqlite3.connect(DB_FILE)
-    conn.execute(f"DELETE FROM {table_name} WHERE {id_column} = ?", (record_id,))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute(f"DELETE FROM {table_name} WHERE {id_column} = ?", (record_id,))
+        conn.commit()
 
 def update_record(table_name, id_column, record_id, fields, values):
-    conn = sqlite3.connect(DB_FILE)
     set_clause = ', '.join([f"{f} = ?" for f in fields])
     sql = f"UPDATE {table_name} SET {set_clause} WHERE {id_column} = ?"
     values.append(record_id)
-    conn.execute(sql, values)
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute(sql, values)
+        conn.commit()
 
 def get_record(table_name, id_column, record_id):
-    conn = sqlite3.connect(DB_FILE)
-    row = conn.execute(f"SELECT * FROM {table_name} WHERE {id_column} = ?", (record_id,)).fetchone()
-    conn.close()
-    return row
+    with connection() as conn:
+        return conn.execute(f"SELECT * FROM {table_name} WHERE {id_column} = ?", (record_id,)).fetchone()
+
+@timed
+def query_data(sql, params=()):
+    with connection() as conn:
+        return hms_db.cache.read_sql(conn, sql, params)
 
+@timed
 def search_records(table_name, column, query):
-    conn = sqlite3.connect(DB_FILE)
     query_sql = f"SELECT * FROM {table_name} WHERE {column} LIKE ?"
-    df = pd.read_sql_query(query_sql, conn, params=(f"%{query}%",))
-    conn.close()
-    return df
+    with connection() as conn:
+        return hms_db.cache.read_arrow(conn, query_sql, (f"%{query}%",), hms_db.DISPLAY_TYPES)
 
 # --------------------- Sidebar Navigation ---------------------
 st.sidebar.image("https://img.icons8.com/fluency/96/000000/hospital.png", width=100)
@@ -93,19 +81,25 @@ choice = st.sidebar.radio("**Navigation**",
     ["🏠 Home", "👥 Patients", "👨‍⚕️ Doctors", "🗓️ Appointments", "📋 Medical Records", "💰 Billings"],
     label_visibility="collapsed")
 
+# SQL and section timings for this run; ?admin=1 shows them in the sidebar
+instrumentation.begin_run("HMS", choice)
+
 # --------------------- PLOTS FOR HOME PAGE ---------------------
 def show_plots():
-    patients = get_data("Patients")
-    appointments = get_data("Appointments")
-    doctors = get_data("Doctors")
-    bills = get_data("Billings")
+    # Aggregated in SQL so each chart reads an index instead of loading whole tables
+    growth = query_data(hms_db.PATIENT_GROWTH_SQL)
+    status_count = query_data(hms_db.APPOINTMENT_STATUS_SQL)
+    busy = query_data(hms_db.BUSY_DOCTORS_SQL)
+    revenue = query_data(hms_db.MONTHLY_REVENUE_SQL)
 
+    render_charts(growth, status_count, busy, revenue)
+
+@timed
+def render_charts(growth, status_count, busy, revenue):
     col1, col2 = st.columns(2)
     with col1:
         # 1. Patients Growth Over Time
-        if not patients.empty:
-            patients['registration_date'] = pd.to_datetime(patients['registration_date'])
-            growth = patients.groupby(patients['registration_date'].dt.strftime('%Y-%m')).size().reset_index(name='New Patients')
+        if not growth.empty:
             fig1 = px.line(growth, x='registration_date', y='New Patients', title="📈 Patients Growth Over Time",
                            markers=True, color_discrete_sequence=['#1E88E5'])
             fig1.update_layout(height=300)
@@ -114,8 +108,7 @@ def show_plots():
             st.info("No patient data for growth chart yet")
 
         # 2. Appointments by Status
-        if not appointments.empty:
-            status_count = appointments['status'].value_counts().reset_index()
+        if not status_count.empty:
             fig2 = px.pie(status_count, values='count', names='status', title="🗓️ Appointments by Status",
                           color_discrete_sequence=px.colors.qualitative.Set2)
             fig2.update_layout(height=300)
@@ -125,9 +118,7 @@ def show_plots():
 
     with col2:
         # 3. Top 5 Busy Doctors
-        if not appointments.empty and not doctors.empty:
-            busy = appointments['doc_id'].value_counts().head(5).reset_index()
-            busy = busy.merge(doctors[['doc_id', 'name']], on='doc_id')
+        if not busy.empty:
             fig3 = px.bar(busy, x='name', y='count', title="🏆 Top 5 Busy Doctors",
                           color='count', color_continuous_scale='Blues')
             fig3.update_layout(height=300)
@@ -136,9 +127,7 @@ def show_plots():
             st.info("No appointment data for doctor ranking")
 
         # 4. Monthly Revenue
-        if not bills.empty:
-            bills['bill_date'] = pd.to_datetime(bills['bill_date'])
-            revenue = bills.groupby(bills['bill_date'].dt.strftime('%Y-%m'))['amount'].sum().reset_index()
+        if not revenue.empty:
             fig4 = px.line(revenue, x='bill_date', y='amount', title="💰 Monthly Revenue ($)",
                            markers=True, color_discrete_sequence=['#43A047'])
             fig4.update_layout(height=300)
@@ -151,15 +140,16 @@ if choice == "🏠 Home":
     st.markdown('<div class="big-title">🏥 Hospital Management System</div>', unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; font-size: 1.3rem;'>A modern, efficient, and user-friendly healthcare dashboard</p>", unsafe_allow_html=True)
     
+    totals = query_data(hms_db.HOME_TOTALS_SQL).iloc[0]
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Patients", len(get_data("Patients")))
+        st.metric("Total Patients", int(totals["patients"]))
     with col2:
-        st.metric("Doctors", len(get_data("Doctors")))
+        st.metric("Doctors", int(totals["doctors"]))
     with col3:
-        st.metric("Appointments", len(get_data("Appointments")))
+        st.metric("Appointments", int(totals["appointments"]))
     with col4:
-        st.metric("Total Revenue", f"${get_data('Billings')['amount'].sum():,.2f}")
+        st.metric("Total Revenue", f"${totals['revenue']:,.2f}")
 
     st.markdown("### 📊 Live Dashboard")
     show_plots()
@@ -175,7 +165,7 @@ elif choice == "👥 Patients":
     with tab1:
         search_query = st.text_input("🔍 Search by Name or Phone", "")
         df = search_records("Patients", "name", search_query) if search_query else get_data("Patients")
-        if df.empty:
+        if df.num_rows == 0:
             st.info("😔 No patients found.")
         else:
             st.dataframe(df, use_container_width=True)
@@ -254,6 +244,9 @@ elif choice == "💰 Billings":
     st.markdown('<div class="module-header">💰 Billings Management</div>', unsafe_allow_html=True)
     tab1, tab2 = st.tabs(["📋 View & Manage", "➕ Create New Bill"])
     # Same full CRUD
+    with tab1:
+        st.subheader("📤 Export Billings")
+        export_widget(["billings"], key="billings_export")
 
 # --------------------- Footer ---------------------
 st.markdown("---")
@@ -262,3 +255,6 @@ st.markdown("""
     Built with ❤️ using <strong>Streamlit</strong> • Live Plots • Full CRUD • Data in <code>hospital.db</code>
 </div>
 """, unsafe_allow_html=True)
+
+instrumentation.admin_panel()
+instrumentation.end_run()
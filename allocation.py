@@ -0,0 +1,128 @@
+# allocation.py - batch FEFO allocation of available bags to pending hospital requests
+#
+# Usage:  python allocation.py               allocate once and print a summary
+#         python allocation.py --every 300   keep allocating every 5 minutes
+#         python allocation.py --dry-run     plan only, change nothing
+#
+# Requests are served emergency > urgent > routine, oldest first. Each takes
+# bags of its own type first, then compatible substitutes, and always the bags
+# that expire soonest (first-expiry-first-out). A request that cannot be filled
+# completely keeps the bags it got and stays pending for the next run.
+#
+# Bags come off the in-memory expiry heaps (inventory_index.py), synced inside
+# the run's write transaction, one heap pop per bag issued.
+import argparse
+import time
+
+import blood_db
+from compatibility import get_compatibility
+from inventory_index import day_number, inventory, unpack, utc_today
+
+PENDING_REQUESTS_SQL = """
+    SELECT hospital_requests.request_id, hospital_requests.blood_type, hospital_requests.urgency,
+           hospital_requests.quantity_needed - COUNT(blood_inventory.bag_id) AS outstanding
+    FROM hospital_requests
+    LEFT JOIN blood_inventory ON blood_inventory.request_id = hospital_requests.request_id
+    WHERE hospital_requests.status = 'pending'
+    GROUP BY hospital_requests.request_id
+    ORDER BY CASE hospital_requests.urgency WHEN 'emergency' THEN 0 WHEN 'urgent' THEN 1 ELSE 2 END,
+             hospital_requests.request_date, hospital_requests.request_id
+"""
+
+
+def substitution_order(compat, recipient):
+    """Compatible types for `recipient`: its own type, then the least versatile
+    substitutes, so universal O- is the last resort."""
+    donors = compat.donors_for(recipient)
+    own = [t for t in donors if t == recipient]
+    others = sorted((t for t in donors if t != recipient), key=lambda t: bin(compat.donate_mask[t]).count("1"))
+    return own + others
+
+
+def plan_allocation(requests, take, compat):
+    """Match requests (in priority order) to bags (per type, in expiry order).
+
+    `requests` yields (request_id, blood_type, urgency, outstanding); take(donor_type, n)
+    hands out up to n bag ids of a type, earliest expiry first. Returns the
+    (request_id, bag_id) assignments and the ids of requests filled completely.
+    """
+    orders = {}
+    exhausted = set()
+    assignments, fulfilled = [], []
+    for request_id, blood_type, _, outstanding in requests:
+        if blood_type not in orders:
+            orders[blood_type] = substitution_order(compat, blood_type)
+        for donor_type in orders[blood_type]:
+            if outstanding <= 0:
+                break
+            if donor_type in exhausted:
+                continue
+            bags = take(donor_type, outstanding)
+            if len(bags) < outstanding:
+                exhausted.add(donor_type)
+            assignments.extend((request_id, bag_id) for bag_id in bags)
+            outstanding -= len(bags)
+        if outstanding <= 0:
+            fulfilled.append(request_id)
+    return assignments, fulfilled
+
+
+def apply_allocation(conn, assignments, fulfilled):
+    conn.executemany(
+        "UPDATE blood_inventory SET status = 'used', request_id = ? WHERE bag_id = ?", assignments)
+    conn.executemany(
+        "UPDATE hospital_requests SET status = 'fulfilled' WHERE request_id = ?",
+        ((request_id,) for request_id in fulfilled))
+
+
+def allocate(conn, dry_run=False, index=inventory):
+    """Plan and apply one allocation run in a single write transaction.
+
+    Holding the write lock from the read to the commit means no bag can be
+    issued twice; WAL readers carry on meanwhile.
+    """
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    taken = []
+    try:
+        compat = get_compatibility()
+        requests = conn.execute(PENDING_REQUESTS_SQL).fetchall()
+        index.sync(conn)
+        today = day_number(utc_today())
+
+        def take(donor_type, n):
+            # Expired-but-not-yet-swept bags are never issued.
+            bags = index.take([donor_type], n, min_day=today)
+            taken.extend(bags)
+            return [unpack(key)[1] for _, key in bags]
+
+        assignments, fulfilled = plan_allocation(requests, take, compat)
+        if not dry_run:
+            apply_allocation(conn, assignments, fulfilled)
+            conn.commit()
+        else:
+            conn.rollback()
+            index.restore(taken)
+    except Exception:
+        conn.rollback()
+        index.restore(taken)
+        raise
+    return {
+        "pending_requests": len(requests),
+        "bags_issued": len(assignments),
+        "requests_fulfilled": len(fulfilled),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Allocate available blood bags to pending hospital requests.")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="repeat on this interval")
+    parser.add_argument("--dry-run", action="store_true", help="plan only, change nothing")
+    args = parser.parse_args()
+    while True:
+        with blood_db.connection() as conn:
+            print(allocate(conn, dry_run=args.dry_run), flush=True)
+        if not args.every:
+            break
+        time.sleep(args.every)
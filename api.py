@@ -0,0 +1,288 @@
+# api.py - asyncio HTTP/JSON API for hospital systems, next to the Streamlit UI
+#
+# Usage:  python api.py                                   serve on 127.0.0.1:8600
+#         python api.py --host 0.0.0.0 --port 8080
+#         python api.py --load-test http://127.0.0.1:8600 --requests 20000 --concurrency 64
+#
+# Endpoints (JSON in, JSON out):
+#   GET  /availability[?blood_type=O-]  bags / ml / expiring-in-7-days per type, plus the
+#                                       compatible supply each type can draw on
+#   POST /donations  {"name", "blood_type", "phone"?, "volume_ml"?}  -> donor_id, bag_id, expiry_date
+#   POST /requests   {"hospital_name", "blood_type", "quantity_needed", "urgency"?}  -> request_id
+#
+# Stdlib only: an asyncio stream server speaking HTTP/1.1 with keep-alive. Reads run
+# on the default thread pool with pooled connections. Writes go through the same
+# group-commit queue as the Streamlit forms (write_queue.py): one writer thread
+# commits them in shared transactions, with a SAVEPOINT per item so a bad item fails alone.
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import parse_qs, quote, urlsplit
+
+import blood_db
+import write_queue
+from compatibility import get_compatibility
+from donations import insert_donation, insert_request
+from inventory_index import day_number, inventory, utc_today
+
+MAX_BODY = 64 * 1024
+URGENCIES = ["routine", "urgent", "emergency"]
+VOLUME_RANGE = (300, 550)
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ---- validation ----
+def require_blood_type(value):
+    if value not in blood_db.BLOOD_TYPES:
+        raise HTTPError(400, f"blood_type must be one of {', '.join(blood_db.BLOOD_TYPES)}")
+    return value
+
+
+def require_text(body, field):
+    value = body.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise HTTPError(400, f"{field} is required")
+    return value.strip()
+
+
+def optional_text(body, field):
+    value = body.get(field)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise HTTPError(400, f"{field} must be a string")
+    return value.strip() or None
+
+
+def require_int(body, field, default, low, high):
+    value = body.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise HTTPError(400, f"{field} must be an integer from {low} to {high}")
+    return value
+
+
+# ---- database work (runs in threads) ----
+def read_availability(blood_type=None):
+    # Counts straight from the in-memory inventory index, after applying what changed since the last call.
+    with blood_db.connection() as conn:
+        inventory.sync(conn)
+    horizon = day_number(utc_today()) + 7
+    stock = {t: {"bags": bags, "total_ml": ml, "expiring_7_days": expiring}
+             for t, (bags, ml, expiring) in inventory.summary(horizon).items()}
+    compat = get_compatibility()
+    empty = {"bags": 0, "total_ml": 0, "expiring_7_days": 0}
+    return {t: {**stock.get(t, empty),
+                "compatible_bags": sum(stock.get(d, empty)["bags"] for d in compat.donors_for(t))}
+            for t in ([blood_type] if blood_type else blood_db.BLOOD_TYPES)}
+
+
+class WriteBatcher:
+    """The asyncio side of write_queue.intake: writes from every handler share its group commits."""
+
+    def __init__(self, queue=write_queue.intake):
+        self.queue = queue
+
+    def start(self):
+        self.queue.start()
+
+    async def submit(self, function, *args):
+        return await asyncio.wrap_future(self.queue.submit(function, *args))
+
+
+# ---- handlers ----
+async def get_availability(query, body, batcher):
+    blood_type = query.get("blood_type", [None])[0]
+    if blood_type:
+        require_blood_type(blood_type)
+    return 200, await asyncio.to_thread(read_availability, blood_type)
+
+
+async def post_donation(query, body, batcher):
+    args = (require_text(body, "name"), require_blood_type(body.get("blood_type")), optional_text(body, "phone"),
+            require_int(body, "volume_ml", 450, *VOLUME_RANGE))
+    donor_id, bag_id, expiry = await batcher.submit(insert_donation, *args)
+    return 201, {"donor_id": donor_id, "bag_id": bag_id, "expiry_date": expiry}
+
+
+async def post_request(query, body, batcher):
+    urgency = body.get("urgency", "routine")
+    if urgency not in URGENCIES:
+        raise HTTPError(400, f"urgency must be one of {', '.join(URGENCIES)}")
+    args = (require_text(body, "hospital_name"), require_blood_type(body.get("blood_type")),
+            require_int(body, "quantity_needed", None, 1, 1000), urgency)
+    return 201, {"request_id": await batcher.submit(insert_request, *args)}
+
+
+ROUTES = {
+    "/availability": {"GET": get_availability},
+    "/donations": {"POST": post_donation},
+    "/requests": {"POST": post_request},
+}
+
+
+# ---- HTTP ----
+async def read_request(reader):
+    """(method, target, headers, body) or None when the client closed the connection."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3 or not all(parts):
+        raise HTTPError(400, "malformed request line")
+    method, target, _ = parts
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Content-Length must be a number")
+    if length < 0:
+        raise HTTPError(400, "Content-Length must not be negative")
+    if length > MAX_BODY:
+        raise HTTPError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def response(status, payload, keep_alive):
+    data = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + data
+
+
+async def dispatch(method, target, body, batcher):
+    url = urlsplit(target)
+    methods = ROUTES.get(url.path.rstrip("/") or "/")
+    if methods is None:
+        raise HTTPError(404, f"no such endpoint: {url.path}")
+    handler = methods.get(method)
+    if handler is None:
+        raise HTTPError(405, f"use {' or '.join(methods)}")
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        raise HTTPError(400, "body must be JSON")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "body must be a JSON object")
+    return await handler(parse_qs(url.query), data, batcher)
+
+
+def serve(batcher):
+    async def handle(reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, payload = await dispatch(method, target, body, batcher)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                writer.write(response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def main(host, port):
+    batcher = WriteBatcher()
+    batcher.start()
+    await asyncio.to_thread(blood_db.get_pool)  # migrate before the first request
+    server = await asyncio.start_server(serve(batcher), host, port, backlog=1024)
+    print(f"Serving on http://{host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+# ---- load test ----
+async def load_test(base_url, total, concurrency):
+    """Mixed traffic over keep-alive connections: 80% availability reads, 10% each write."""
+    url = urlsplit(base_url)
+    latencies, errors = [], 0
+    remaining = [total]
+
+    async def call(reader, writer, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {url.hostname}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int([line for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")][0]
+                     .split(b":")[1])
+        await reader.readexactly(length)
+        return int(head.split(b" ", 2)[1])
+
+    async def client(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        try:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                roll, blood_type = rng.random(), rng.choice(blood_db.BLOOD_TYPES)
+                started = time.perf_counter()
+                if roll < 0.8:
+                    status = await call(reader, writer, "GET", f"/availability?blood_type={quote(blood_type)}")
+                elif roll < 0.9:
+                    status = await call(reader, writer, "POST", "/donations",
+                                        {"name": f"Load Donor {rng.randrange(5000)}", "blood_type": blood_type})
+                else:
+                    status = await call(reader, writer, "POST", "/requests",
+                                        {"hospital_name": "Load Test Hospital", "blood_type": blood_type,
+                                         "quantity_needed": rng.randint(1, 4), "urgency": rng.choice(URGENCIES)})
+                latencies.append(time.perf_counter() - started)
+                errors += status >= 400
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(seed) for seed in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(json.dumps({
+        "requests": len(latencies), "errors": errors, "seconds": round(elapsed, 2),
+        "requests_per_second": round(len(latencies) / elapsed),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the blood bank.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--load-test", metavar="URL", help="drive a running instance instead of serving")
+    parser.add_argument("--requests", type=int, default=20000, help="load test: total requests")
+    parser.add_argument("--concurrency", type=int, default=64, help="load test: keep-alive connections")
+    args = parser.parse_args()
+    if args.load_test:
+        asyncio.run(load_test(args.load_test, args.requests, args.concurrency))
+    else:
+        asyncio.run(main(args.host, args.port))
@@ -0,0 +1,212 @@
+# archive.py - moves finished bags and requests out of the hot tables into an archive database
+#
+# Usage:  python archive.py                    archive everything older than ARCHIVE_AFTER_DAYS
+#         python archive.py --days 730         ... or older than this many days
+#         python archive.py --every 86400      keep doing so once a day
+#
+# Blood.py also runs start_background(), so a running app archives on its own.
+#
+# Bags that are used, expired or discarded and past their expiry date by the archive
+# age, and fulfilled requests older than it, are copied into the same tables in
+# ARCHIVE_DB (attached as "archive") and deleted from the main database, BATCH_SIZE
+# rows per write transaction so the app's writers never wait long. The page
+# queries, summaries and triggers only ever see the hot working set.
+#
+# attached() gives a connection the archive plus two TEMP views, inventory_history and
+# requests_history, that UNION ALL the hot and archived rows (archived_at is NULL for
+# hot ones); the history exports read those. Pooled connections go back to the pool
+# after the with-block, so it drops the views and detaches the archive on the way out.
+#
+# Main is in WAL mode, so a transaction spanning both files commits each file on its
+# own. Archived rows are written with INSERT OR REPLACE: after a crash between the two
+# commits, the next run copies the same rows again and finishes the delete.
+#
+# Environment:  ARCHIVE_DB=blood_archive.db   archive database file
+#               ARCHIVE_AFTER_DAYS=365        age at which finished rows move
+#               ARCHIVE_BATCH=2000            rows per transaction
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import blood_db
+import forecast
+from db_pool import write_transaction
+
+ARCHIVE_DB = os.environ.get("ARCHIVE_DB", "blood_archive.db")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 365))
+BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH", 2000))
+# Between batches, so queued writers get the lock.
+BATCH_PAUSE = 0.05
+ARCHIVE_INTERVAL = 86400
+# The forecast re-derives this much history from the hot tables every night.
+MIN_AGE_DAYS = forecast.HISTORY_DAYS + 1
+
+# table -> what is archived and how it is read back. `select` picks one batch of keys
+# (idx_inventory_status_expiry / idx_requests_status_date make it a range scan).
+# A bag still counted against a request that is not fulfilled stays: deleting it
+# would give its unit back to pending_demand.
+ARCHIVED = {
+    "blood_inventory": {
+        "key": "bag_id",
+        "view": "inventory_history",
+        "select": """
+            SELECT bag_id FROM main.blood_inventory b
+            WHERE status IN ('used', 'expired', 'discarded') AND expiry_date < date('now', :age)
+              AND (b.request_id IS NULL OR EXISTS (SELECT 1 FROM main.hospital_requests r
+                                                   WHERE r.request_id = b.request_id AND r.status = 'fulfilled'))
+            LIMIT :limit
+        """,
+        "indexes": {"expiry": "expiry_date", "donation_date": "donation_date, blood_type",
+                    "request": "request_id"},
+    },
+    "hospital_requests": {
+        "key": "request_id",
+        "view": "requests_history",
+        # A request still referenced by a hot bag stays until the bag is archived.
+        "select": """
+            SELECT request_id FROM main.hospital_requests r
+            WHERE status = 'fulfilled' AND request_date < date('now', :age)
+              AND NOT EXISTS (SELECT 1 FROM main.blood_inventory b WHERE b.request_id = r.request_id)
+            LIMIT :limit
+        """,
+        "indexes": {"date": "request_date", "type_date": "blood_type, request_date"},
+    },
+}
+
+
+def stored_columns(conn, schema, table):
+    """(name, declared type, primary key) of each stored column of schema.table."""
+    return [(row[1], row[2], row[5]) for row in conn.execute(f"PRAGMA {schema}.table_xinfo({table})") if row[6] == 0]
+
+
+def prepare(conn):
+    """Create or extend the archive tables to match the hot ones. Idempotent."""
+    conn.execute("PRAGMA archive.journal_mode = WAL")
+    conn.execute("PRAGMA archive.synchronous = NORMAL")
+    for table, spec in ARCHIVED.items():
+        hot = stored_columns(conn, "main", table)
+        archived = {name for name, _, _ in stored_columns(conn, "archive", table)}
+        if not archived:
+            # No constraints besides the key: the archive records what was, checks were done on the way in.
+            columns = [f"{name} {decl} PRIMARY KEY" if pk else f"{name} {decl}" for name, decl, pk in hot]
+            conn.execute(f"""
+                CREATE TABLE archive.{table} (
+                    {", ".join(columns)},
+                    archived_at TEXT NOT NULL DEFAULT (datetime('now'))
+                )
+            """)
+        else:
+            # Columns a later migration added to the hot table.
+            for name, decl, _ in hot:
+                if name not in archived:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {decl}")
+        for suffix, columns in spec["indexes"].items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_archive_{table}_{suffix} ON {table}({columns})")
+    if conn.in_transaction:
+        conn.commit()
+
+
+@contextmanager
+def attached(conn, path=None):
+    """Attach the archive to a connection and create its history views for a with-block.
+
+    Nested blocks share the attachment; the outermost one drops the views and
+    detaches, so the connection goes back to the pool as it came.
+    """
+    if any(row[1] == "archive" for row in conn.execute("PRAGMA database_list")):
+        yield conn
+        return
+    conn.execute("ATTACH DATABASE ? AS archive", (path or ARCHIVE_DB,))
+    try:
+        prepare(conn)
+        for table, spec in ARCHIVED.items():
+            columns = ", ".join(name for name, _, _ in stored_columns(conn, "main", table))
+            conn.execute(f"""
+                CREATE TEMP VIEW IF NOT EXISTS {spec['view']} AS
+                SELECT {columns}, NULL AS archived_at FROM main.{table}
+                UNION ALL
+                SELECT {columns}, archived_at FROM archive.{table}
+            """)
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        for spec in ARCHIVED.values():
+            conn.execute(f"DROP VIEW IF EXISTS temp.{spec['view']}")
+        conn.execute("DETACH DATABASE archive")
+
+
+def archive_table(conn, table, age_days, batch_size=BATCH_SIZE):
+    """Move the finished rows of one table, batch by batch; returns how many moved."""
+    spec = ARCHIVED[table]
+    columns = ", ".join(name for name, _, _ in stored_columns(conn, "main", table))
+    params = {"age": f"-{age_days} days", "limit": batch_size}
+
+    def move(conn):
+        ids = json.dumps([row[0] for row in conn.execute(spec["select"], params)])
+        conn.execute(f"""
+            INSERT OR REPLACE INTO archive.{table} ({columns})
+            SELECT {columns} FROM main.{table} WHERE {spec['key']} IN (SELECT value FROM json_each(?))
+        """, (ids,))
+        return conn.execute(f"DELETE FROM main.{table} WHERE {spec['key']} IN (SELECT value FROM json_each(?))",
+                            (ids,)).rowcount
+
+    moved = 0
+    while True:
+        n = write_transaction(conn, move)
+        moved += n
+        if n < batch_size:
+            return moved
+        time.sleep(BATCH_PAUSE)
+
+
+def archive(conn, age_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE):
+    """Archive bags, then the requests they no longer hold back; returns {table: rows moved}."""
+    if age_days < MIN_AGE_DAYS:
+        raise ValueError(f"archive age must be at least {MIN_AGE_DAYS} days, the forecast reads that far back")
+    with attached(conn):
+        return {table: archive_table(conn, table, age_days, batch_size) for table in ARCHIVED}
+
+
+def run_forever(interval):
+    while True:
+        try:
+            with blood_db.connection() as conn:
+                archive(conn)
+        except Exception as e:
+            print(f"archival failed: {e}", flush=True)
+        time.sleep(interval)
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def start_background(interval=ARCHIVE_INTERVAL):
+    """Start the archival thread once per process (Streamlit reruns call this every time)."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_forever, args=(interval,), name="archiver", daemon=True)
+            _thread.start()
+    return _thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move finished bags and requests into the archive database.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive rows older than this")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="repeat on this interval")
+    args = parser.parse_args()
+    while True:
+        started = time.perf_counter()
+        with blood_db.connection() as conn:
+            moved = archive(conn, args.days, args.batch_size)
+        print(", ".join(f"{n} row(s) from {table}" for table, n in moved.items()) +
+              f" archived in {time.perf_counter() - started:.2f}s", flush=True)
+        if not args.every:
+            break
+        time.sleep(args.every)
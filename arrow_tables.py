@@ -0,0 +1,137 @@
+# arrow_tables.py - query results straight into compact Arrow tables for st.dataframe
+#
+# Usage:  python arrow_tables.py blood_inventory          pandas vs Arrow memory and time for a whole table
+#         python arrow_tables.py Patients --db hms
+#
+# pd.read_sql() keeps every TEXT value as text and every integer as int64: a blood
+# type, status or date costs 10-18 bytes a row, an id or a volume 8. Here the cursor
+# is read fetchmany() chunk by chunk into Arrow arrays instead. Columns named in
+# `types` as "category" (blood_type, status, urgency...) become dictionary arrays, a
+# one-byte index per row for a handful of values; "date" columns become date32, 4
+# bytes a row; integers take the narrowest width their values fit; the rest keep the
+# type SQLite returned (double, string). The resulting pyarrow.Table goes to
+# st.dataframe as is: Streamlit serialises Arrow tables without a pandas round trip.
+# Select only the columns the page shows; the SQL is the projection.
+import argparse
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CHUNK_SIZE = 50_000
+
+
+def column_array(values):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # SQLite lets a column hold mixed types; show those as text.
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def chunk_arrays(rows, row_type):
+    """One array per column for a fetchmany() chunk.
+
+    `row_type` is the struct of the previous chunk's column types: rows that fit it
+    convert in one pass, without transposing them into per-column tuples first.
+    """
+    if row_type is not None:
+        try:
+            return pa.array(rows, row_type).flatten()
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    return [column_array(values) for values in zip(*rows)]
+
+
+def combine(chunks):
+    """One array from per-chunk arrays whose inferred types may differ."""
+    kinds = {chunk.type for chunk in chunks} - {pa.null()}
+    if not kinds:
+        return pa.nulls(sum(len(chunk) for chunk in chunks))
+    if len(kinds) == 1:
+        kind = kinds.pop()
+    elif kinds <= {pa.int64(), pa.float64()}:
+        kind = pa.float64()
+    else:
+        kind = pa.string()
+    return pa.chunked_array([chunk.cast(kind) for chunk in chunks], kind).combine_chunks()
+
+
+def smallest_int(low, high):
+    for kind in (pa.int8(), pa.int16(), pa.int32()):
+        bits = kind.bit_width - 1
+        if -(1 << bits) <= low and high < (1 << bits):
+            return kind
+    return pa.int64()
+
+
+def convert(array, kind):
+    if kind == "category" and pa.types.is_string(array.type):
+        encoded = array.dictionary_encode()
+        index = smallest_int(0, len(encoded.dictionary))
+        return encoded.cast(pa.dictionary(index, encoded.dictionary.type))
+    if kind == "date" and pa.types.is_string(array.type):
+        parsed = pc.strptime(array, format="%Y-%m-%d", unit="s", error_is_null=True)
+        # Anything that is not a plain date stays text rather than turning into blanks.
+        if parsed.null_count == array.null_count:
+            return parsed.cast(pa.date32())
+    if pa.types.is_int64(array.type) and array.null_count < len(array):
+        # Ids, quantities and volumes rarely need 8 bytes.
+        bounds = pc.min_max(array)
+        return array.cast(smallest_int(bounds["min"].as_py(), bounds["max"].as_py()))
+    return array
+
+
+def read_arrow(conn, sql, params=(), types=None, chunk_size=CHUNK_SIZE):
+    """Run `sql` and return its rows as a pyarrow.Table; `types` maps column -> "category" / "date"."""
+    types = types or {}
+    # A plain cursor: tuples, not the pool's row factory.
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    try:
+        cursor.execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        chunks = [[] for _ in names]
+        row_type = None
+        while rows := cursor.fetchmany(chunk_size):
+            arrays = chunk_arrays(rows, row_type)
+            for column, array in zip(chunks, arrays):
+                column.append(array)
+            if all(array.type != pa.null() for array in arrays):
+                row_type = pa.struct([(str(i), array.type) for i, array in enumerate(arrays)])
+    finally:
+        cursor.close()
+    arrays = [convert(combine(column), types.get(name)) if column else pa.array([], pa.string())
+              for name, column in zip(names, chunks)]
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+if __name__ == "__main__":
+    from streamlit.dataframe_util import convert_anything_to_arrow_bytes
+
+    import blood_db
+    import hms_db
+
+    parser = argparse.ArgumentParser(description="Compare pandas and Arrow loading of one table.")
+    parser.add_argument("table")
+    parser.add_argument("--db", choices=["blood", "hms"], default="blood")
+    args = parser.parse_args()
+    db = blood_db if args.db == "blood" else hms_db
+
+    sql = f"SELECT * FROM {args.table}"
+    with db.connection() as conn:
+        started = time.perf_counter()
+        df = pd.read_sql(sql, conn)
+        payload = convert_anything_to_arrow_bytes(df)
+        pandas_s = time.perf_counter() - started
+        started = time.perf_counter()
+        table = read_arrow(conn, sql, types=db.DISPLAY_TYPES)
+        arrow_payload = convert_anything_to_arrow_bytes(table)
+        arrow_s = time.perf_counter() - started
+    pandas_bytes = df.memory_usage(index=True, deep=True).sum()
+    print(f"{len(df):,} rows")
+    print(f"pandas: {pandas_bytes / 2**20:8.1f} MiB in memory, {len(payload) / 2**20:6.1f} MiB sent, "
+          f"{pandas_s:.2f}s to load and serialise")
+    print(f"arrow:  {table.nbytes / 2**20:8.1f} MiB in memory, {len(arrow_payload) / 2**20:6.1f} MiB sent, "
+          f"{arrow_s:.2f}s to load and serialise ({pandas_bytes / max(table.nbytes, 1):.1f}x smaller)")
@@ -0,0 +1,102 @@
+# benchmark_intake.py - donation intake throughput: group-commit queue vs a commit per form
+#
+# Usage:  python benchmark_intake.py                              1 2 4 8 16 32 64 sessions, 5 s each
+#         python benchmark_intake.py --sessions 8 64 --seconds 10 --delay-ms 50
+#
+# Each session is a thread that records a donation, waits for its confirmation and
+# immediately records the next, against a fresh database file with synchronous = FULL
+# in both modes. "direct" is every session committing through its own pooled
+# connection, as the forms did before write_queue.py; "queue" is every session
+# submitting to one WriteQueue. A session's error is any call that raised (e.g.
+# "database is locked"). One JSON line per (mode, sessions) run.
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import blood_db
+from db_pool import PRAGMAS, ConnectionPool
+from donations import insert_donation, record_donation
+from migrations import migrate
+from write_queue import MAX_BATCH, MAX_DELAY, WriteQueue
+
+DURABLE_PRAGMAS = PRAGMAS + ("PRAGMA synchronous = FULL",)
+
+
+def session(record, seed, seconds, latencies, errors, barrier):
+    rng = random.Random(seed)
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    while (started := time.perf_counter()) < deadline:
+        try:
+            record(f"Drive Donor {rng.randrange(100_000)}", rng.choice(blood_db.BLOOD_TYPES))
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(repr(e))
+
+
+def run(mode, sessions, seconds, delay):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "intake.db")
+        conn = sqlite3.connect(path)
+        migrate(conn, blood_db.MIGRATIONS)
+        conn.close()
+
+        if mode == "direct":
+            pool = ConnectionPool(path, size=sessions, pragmas=DURABLE_PRAGMAS)
+
+            def record(name, blood_type):
+                with pool.connection() as conn:
+                    return record_donation(conn, name, blood_type)
+        else:
+            def connect():
+                conn = sqlite3.connect(path)
+                for pragma in DURABLE_PRAGMAS:
+                    conn.execute(pragma)
+                return conn
+
+            queue = WriteQueue(connect, max_batch=MAX_BATCH, max_delay=delay)
+
+            def record(name, blood_type):
+                return queue.call(insert_donation, name, blood_type)
+
+        latencies, errors = [], []
+        barrier = threading.Barrier(sessions)
+        threads = [threading.Thread(target=session, args=(record, seed, seconds, latencies, errors, barrier))
+                   for seed in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        conn = sqlite3.connect(path)
+        bags = conn.execute("SELECT COUNT(*) FROM blood_inventory").fetchone()[0]
+        conn.close()
+
+    latencies.sort()
+    result = {"mode": mode, "sessions": sessions, "donations": len(latencies), "errors": len(errors),
+              "per_second": round(len(latencies) / seconds),
+              "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+              "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None,
+              "bags_written": bags}
+    if mode == "queue":
+        result["batches"] = queue.batches
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark concurrent donation intake.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--delay-ms", type=float, default=MAX_DELAY * 1000, help="queue: extra wait for more items")
+    parser.add_argument("--modes", nargs="+", choices=["direct", "queue"], default=["direct", "queue"])
+    args = parser.parse_args()
+    for sessions in args.sessions:
+        for mode in args.modes:
+            print(json.dumps(run(mode, sessions, args.seconds, args.delay_ms / 1000)), flush=True)
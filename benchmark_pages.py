@@ -0,0 +1,131 @@
+# benchmark_pages.py - time every page query of both apps at several data sizes
+#
+# Usage:  python benchmark_pages.py                                 scales 0.001 0.01 0.1, fresh data
+#         python benchmark_pages.py --scales 0.01 1 --output report.json
+#         python benchmark_pages.py --blood-db blood_donation.db --hms-db hospital.db   existing data
+#         python benchmark_pages.py --compare baseline.json                 exit 1 on a regression
+#
+# For each scale, generate_data.py fills a fresh pair of databases in a temporary
+# directory. Then each query in blood_db.PAGE_QUERIES, hms_db.PAGE_QUERIES and
+# HMS_CRUD_QUERIES runs --repeat times on a pooled connection (same PRAGMAs as the
+# apps) and its rows are fetched. The JSON report has one entry per scale and
+# query: row count, first / min / median / max milliseconds.
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import blood_db
+import hms_db
+from db_pool import ConnectionPool
+from generate_data import generate, scaled_sizes
+
+# The HMS CRUD pages read through get_data() / search_records() rather than PAGE_QUERIES.
+HMS_CRUD_QUERIES = {
+    "Patients list": ("SELECT * FROM Patients", ()),
+    "Patients search": ("SELECT * FROM Patients WHERE name LIKE ?", ("%khan%",)),
+}
+
+
+def time_query(conn, sql, params, repeat):
+    timings, rows = [], 0
+    for _ in range(repeat + 1):
+        started = time.perf_counter()
+        rows = len(conn.execute(sql, params).fetchall())
+        timings.append((time.perf_counter() - started) * 1000)
+    first, rest = timings[0], timings[1:]
+    return {"rows": rows, "first_ms": round(first, 3), "min_ms": round(min(rest), 3),
+            "median_ms": round(statistics.median(rest), 3), "max_ms": round(max(rest), 3)}
+
+
+def run_queries(path, queries, prefix, repeat):
+    pool = ConnectionPool(path, size=1)
+    results = {}
+    with pool.connection() as conn:
+        for name, (sql, params) in queries.items():
+            results[f"{prefix}: {name}"] = time_query(conn, sql, params, repeat)
+    return results
+
+
+def benchmark(blood_path, hms_path, repeat):
+    results = run_queries(blood_path, blood_db.PAGE_QUERIES, "blood", repeat)
+    results.update(run_queries(hms_path, {**hms_db.PAGE_QUERIES, **HMS_CRUD_QUERIES}, "hms", repeat))
+    return results
+
+
+def row_counts(blood_path, hms_path):
+    counts = {}
+    for path, tables in [(blood_path, ["donors", "blood_inventory", "hospital_requests"]),
+                         (hms_path, ["Patients", "Doctors", "Appointments", "Billings"])]:
+        conn = sqlite3.connect(path)
+        counts.update({table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables})
+        conn.close()
+    return counts
+
+
+def compare(report, baseline, threshold):
+    """Print median changes against a previous report; returns the regressions."""
+    before = {(run["label"], name): q["median_ms"] for run in baseline["runs"] for name, q in run["queries"].items()}
+    regressions = []
+    for run in report["runs"]:
+        for name, q in run["queries"].items():
+            old = before.get((run["label"], name))
+            if old is None:
+                continue
+            ratio = q["median_ms"] / old if old else float("inf") if q["median_ms"] else 1.0
+            flag = ratio > threshold and q["median_ms"] - old > 1.0
+            print(f"{'SLOWER' if flag else 'ok':6}  {run['label']:>10}  {name:45} {old:10.3f} -> {q['median_ms']:10.3f} ms")
+            if flag:
+                regressions.append((run["label"], name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the page queries of Blood.py and HMS.py.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.001, 0.01, 0.1],
+                        help="data sizes as fractions of generate_data.FULL_SIZES")
+    parser.add_argument("--blood-db", help="benchmark this existing database instead of generating data")
+    parser.add_argument("--hms-db", help="benchmark this existing database instead of generating data")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--compare", metavar="REPORT", help="previous report to compare medians against")
+    parser.add_argument("--threshold", type=float, default=1.5, help="median ratio that counts as a regression")
+    args = parser.parse_args()
+
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "sqlite": sqlite3.sqlite_version, "machine": platform.machine(), "runs": []}
+    if args.blood_db or args.hms_db:
+        blood_path, hms_path = args.blood_db or blood_db.DB_FILE, args.hms_db or hms_db.DB_FILE
+        report["runs"].append({"label": "existing", "rows": row_counts(blood_path, hms_path),
+                               "queries": benchmark(blood_path, hms_path, args.repeat)})
+    else:
+        for scale in args.scales:
+            with tempfile.TemporaryDirectory() as tmp:
+                blood_path, hms_path = os.path.join(tmp, "blood.db"), os.path.join(tmp, "hospital.db")
+                seconds = generate(scaled_sizes(scale), blood_path, hms_path, args.seed)
+                report["runs"].append({"label": f"scale {scale:g}", "generate_seconds": round(seconds, 1),
+                                       "rows": row_counts(blood_path, hms_path),
+                                       "queries": benchmark(blood_path, hms_path, args.repeat)})
+            print(f"scale {scale:g} done", flush=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
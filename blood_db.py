@@ -0,0 +1,854 @@
+# blood_db.py - schema, migrations and page queries for the blood bank app (Blood.py)
+import re
+import sqlite3
+import threading
+
+import instrumentation
+from db_pool import ConnectionPool
+from migrations import migrate, run_script
+from query_cache import QueryCache, track_table_versions
+
+DB_FILE = "blood_donation.db"
+
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+# Typical share of the population by blood type, used for synthetic data and benchmarks.
+BLOOD_TYPE_FREQUENCIES = {'A+': 0.357, 'A-': 0.063, 'B+': 0.085, 'B-': 0.015,
+                          'AB+': 0.034, 'AB-': 0.006, 'O+': 0.374, 'O-': 0.066}
+
+# ====================== MIGRATIONS ======================
+BASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blood_types (
+    blood_type TEXT PRIMARY KEY,
+    can_donate_to TEXT NOT NULL,
+    can_receive_from TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS donors (
+    donor_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    blood_type TEXT NOT NULL REFERENCES blood_types(blood_type),
+    phone TEXT,
+    last_donation_date DATE
+);
+
+CREATE TABLE IF NOT EXISTS blood_inventory (
+    bag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    blood_type TEXT NOT NULL REFERENCES blood_types(blood_type),
+    donor_id INTEGER REFERENCES donors(donor_id),
+    donation_date DATE NOT NULL DEFAULT (date('now')),
+    expiry_date DATE NOT NULL,
+    volume_ml INTEGER DEFAULT 450,
+    status TEXT CHECK(status IN ('available', 'used', 'expired', 'discarded')) DEFAULT 'available'
+);
+
+CREATE TABLE IF NOT EXISTS hospital_requests (
+    request_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hospital_name TEXT NOT NULL,
+    blood_type TEXT NOT NULL REFERENCES blood_types(blood_type),
+    quantity_needed INTEGER NOT NULL,
+    request_date DATE DEFAULT (date('now')),
+    urgency TEXT CHECK(urgency IN ('routine', 'urgent', 'emergency')) DEFAULT 'routine',
+    status TEXT DEFAULT 'pending'
+);
+
+INSERT OR IGNORE INTO blood_types (blood_type, can_donate_to, can_receive_from) VALUES
+('A+', 'A+,AB+', 'A+,A-,O+,O-'),
+('A-', 'A+,A-,AB+,AB-', 'A-,O-'),
+('B+', 'B+,AB+', 'B+,B-,O+,O-'),
+('B-', 'B+,B-,AB+,AB-', 'B-,O-'),
+('AB+', 'AB+', 'A+,A-,B+,B-,AB+,AB-,O+,O-'),
+('AB-', 'AB+,AB-', 'A-,B-,AB-,O-'),
+('O+', 'A+,B+,AB+,O+', 'O+,O-'),
+('O-', 'A+,A-,B+,B-,AB+,AB-,O+,O-', 'O-');
+"""
+
+# Dashboard aggregates, kept current by the triggers below so the
+# dashboard never has to scan blood_inventory / donors / hospital_requests.
+DASHBOARD_SUMMARY = """
+CREATE TABLE IF NOT EXISTS available_stock (
+    blood_type TEXT NOT NULL,
+    expiry_date DATE NOT NULL,
+    bags INTEGER NOT NULL DEFAULT 0,
+    total_ml INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (blood_type, expiry_date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS stock_after_insert AFTER INSERT ON blood_inventory
+WHEN NEW.status = 'available'
+BEGIN
+    INSERT INTO available_stock (blood_type, expiry_date, bags, total_ml)
+    VALUES (NEW.blood_type, NEW.expiry_date, 1, COALESCE(NEW.volume_ml, 0))
+    ON CONFLICT (blood_type, expiry_date)
+    DO UPDATE SET bags = bags + 1, total_ml = total_ml + excluded.total_ml;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stock_after_delete AFTER DELETE ON blood_inventory
+WHEN OLD.status = 'available'
+BEGIN
+    UPDATE available_stock SET bags = bags - 1, total_ml = total_ml - COALESCE(OLD.volume_ml, 0)
+    WHERE blood_type = OLD.blood_type AND expiry_date = OLD.expiry_date;
+    DELETE FROM available_stock
+    WHERE blood_type = OLD.blood_type AND expiry_date = OLD.expiry_date AND bags <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stock_after_update_old
+AFTER UPDATE OF status, blood_type, expiry_date, volume_ml ON blood_inventory
+WHEN OLD.status = 'available'
+BEGIN
+    UPDATE available_stock SET bags = bags - 1, total_ml = total_ml - COALESCE(OLD.volume_ml, 0)
+    WHERE blood_type = OLD.blood_type AND expiry_date = OLD.expiry_date;
+    DELETE FROM available_stock
+    WHERE blood_type = OLD.blood_type AND expiry_date = OLD.expiry_date AND bags <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stock_after_update_new
+AFTER UPDATE OF status, blood_type, expiry_date, volume_ml ON blood_inventory
+WHEN NEW.status = 'available'
+BEGIN
+    INSERT INTO available_stock (blood_type, expiry_date, bags, total_ml)
+    VALUES (NEW.blood_type, NEW.expiry_date, 1, COALESCE(NEW.volume_ml, 0))
+    ON CONFLICT (blood_type, expiry_date)
+    DO UPDATE SET bags = bags + 1, total_ml = total_ml + excluded.total_ml;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_count_insert AFTER INSERT ON donors
+BEGIN
+    UPDATE dashboard_counters SET value = value + 1 WHERE name = 'donors';
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_count_delete AFTER DELETE ON donors
+BEGIN
+    UPDATE dashboard_counters SET value = value - 1 WHERE name = 'donors';
+END;
+
+CREATE TRIGGER IF NOT EXISTS urgent_count_insert AFTER INSERT ON hospital_requests
+BEGIN
+    UPDATE dashboard_counters
+    SET value = value + (NEW.status = 'pending' AND NEW.urgency IN ('urgent', 'emergency'))
+    WHERE name = 'urgent_pending';
+END;
+
+CREATE TRIGGER IF NOT EXISTS urgent_count_delete AFTER DELETE ON hospital_requests
+BEGIN
+    UPDATE dashboard_counters
+    SET value = value - (OLD.status = 'pending' AND OLD.urgency IN ('urgent', 'emergency'))
+    WHERE name = 'urgent_pending';
+END;
+
+CREATE TRIGGER IF NOT EXISTS urgent_count_update AFTER UPDATE OF status, urgency ON hospital_requests
+BEGIN
+    UPDATE dashboard_counters
+    SET value = value - (OLD.status = 'pending' AND OLD.urgency IN ('urgent', 'emergency'))
+                      + (NEW.status = 'pending' AND NEW.urgency IN ('urgent', 'emergency'))
+    WHERE name = 'urgent_pending';
+END;
+"""
+
+HOT_PATH_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_inventory_status_expiry ON blood_inventory(status, expiry_date);
+CREATE INDEX IF NOT EXISTS idx_inventory_expiry ON blood_inventory(expiry_date);
+CREATE INDEX IF NOT EXISTS idx_requests_status_urgency ON hospital_requests(status, urgency);
+CREATE INDEX IF NOT EXISTS idx_requests_date ON hospital_requests(request_date);
+CREATE INDEX IF NOT EXISTS idx_donors_name_type ON donors(name, blood_type);
+"""
+
+
+# Full-text donor search: name tokens plus a digits-only copy of the phone,
+# in an external-content FTS5 index that the triggers keep in step with donors.
+PHONE_DIGITS = """replace(replace(replace(replace(replace(replace(replace(
+        phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', '')"""
+
+DONOR_SEARCH_INDEX = f"""
+ALTER TABLE donors ADD COLUMN phone_digits TEXT GENERATED ALWAYS AS (
+    {PHONE_DIGITS}
+) VIRTUAL;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS donors_fts USING fts5(
+    name, phone_digits,
+    content='donors', content_rowid='donor_id',
+    prefix='1 2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donors_fts (rowid, name, phone_digits) VALUES (NEW.donor_id, NEW.name, NEW.phone_digits);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_delete AFTER DELETE ON donors
+BEGIN
+    INSERT INTO donors_fts (donors_fts, rowid, name, phone_digits)
+    VALUES ('delete', OLD.donor_id, OLD.name, OLD.phone_digits);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_update AFTER UPDATE OF name, phone ON donors
+BEGIN
+    INSERT INTO donors_fts (donors_fts, rowid, name, phone_digits)
+    VALUES ('delete', OLD.donor_id, OLD.name, OLD.phone_digits);
+    INSERT INTO donors_fts (rowid, name, phone_digits) VALUES (NEW.donor_id, NEW.name, NEW.phone_digits);
+END;
+
+INSERT INTO donors_fts (donors_fts) VALUES ('rebuild');
+"""
+
+
+# Keep each filtered listing in sort order straight off an index (see LISTINGS).
+LISTING_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_inventory_type_expiry ON blood_inventory(blood_type, expiry_date);
+CREATE INDEX IF NOT EXISTS idx_donors_type_name ON donors(blood_type, name);
+CREATE INDEX IF NOT EXISTS idx_requests_status_date ON hospital_requests(status, request_date);
+CREATE INDEX IF NOT EXISTS idx_requests_type_date ON hospital_requests(blood_type, request_date);
+"""
+
+
+# blood_types keeps compatibility as comma-separated lists; this is the same
+# information as one (donor_type, recipient_type) row per compatible pair, so SQL
+# can join on it. The triggers rebuild it whenever blood_types changes.
+COMPATIBILITY_TABLE = """
+CREATE TABLE IF NOT EXISTS blood_compatibility (
+    donor_type TEXT NOT NULL,
+    recipient_type TEXT NOT NULL,
+    PRIMARY KEY (donor_type, recipient_type)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_compatibility_recipient ON blood_compatibility(recipient_type, donor_type);
+
+CREATE TRIGGER IF NOT EXISTS compatibility_after_insert AFTER INSERT ON blood_types
+BEGIN
+    DELETE FROM blood_compatibility;
+    INSERT INTO blood_compatibility (donor_type, recipient_type)
+    SELECT d.blood_type, r.blood_type FROM blood_types d JOIN blood_types r
+    ON instr(',' || d.can_donate_to || ',', ',' || r.blood_type || ',') > 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS compatibility_after_update AFTER UPDATE ON blood_types
+BEGIN
+    DELETE FROM blood_compatibility;
+    INSERT INTO blood_compatibility (donor_type, recipient_type)
+    SELECT d.blood_type, r.blood_type FROM blood_types d JOIN blood_types r
+    ON instr(',' || d.can_donate_to || ',', ',' || r.blood_type || ',') > 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS compatibility_after_delete AFTER DELETE ON blood_types
+BEGIN
+    DELETE FROM blood_compatibility;
+    INSERT INTO blood_compatibility (donor_type, recipient_type)
+    SELECT d.blood_type, r.blood_type FROM blood_types d JOIN blood_types r
+    ON instr(',' || d.can_donate_to || ',', ',' || r.blood_type || ',') > 0;
+END;
+
+DELETE FROM blood_compatibility;
+INSERT INTO blood_compatibility (donor_type, recipient_type)
+SELECT d.blood_type, r.blood_type FROM blood_types d JOIN blood_types r
+ON instr(',' || d.can_donate_to || ',', ',' || r.blood_type || ',') > 0;
+"""
+
+
+# Which request an issued bag went to (set by allocation.py).
+BAG_ALLOCATION = """
+ALTER TABLE blood_inventory ADD COLUMN request_id INTEGER REFERENCES hospital_requests(request_id);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_request ON blood_inventory(request_id) WHERE request_id IS NOT NULL;
+"""
+
+# One row per run of sweeper.py.
+EXPIRY_SWEEPS = """
+CREATE TABLE IF NOT EXISTS expiry_sweeps (
+    sweep_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    swept_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    bags INTEGER NOT NULL,
+    seconds REAL NOT NULL
+);
+"""
+
+# One donor per (name ignoring case and outer spaces, blood type, phone digits).
+# Existing duplicates are merged into the oldest record before the index is built.
+DONOR_KEY = "lower(trim(name)), blood_type, COALESCE(phone_digits, '')"
+
+DONOR_IDENTITY = f"""
+CREATE TEMP TABLE donor_merge AS
+SELECT donor_id, MIN(donor_id) OVER (PARTITION BY {DONOR_KEY}) AS keep_id FROM donors;
+
+DELETE FROM donor_merge WHERE donor_id = keep_id;
+
+UPDATE blood_inventory
+SET donor_id = (SELECT keep_id FROM donor_merge WHERE donor_merge.donor_id = blood_inventory.donor_id)
+WHERE donor_id IN (SELECT donor_id FROM donor_merge);
+
+UPDATE donors SET last_donation_date = (
+    SELECT MAX(d.last_donation_date) FROM donors d
+    WHERE d.donor_id = donors.donor_id
+       OR d.donor_id IN (SELECT donor_id FROM donor_merge WHERE keep_id = donors.donor_id)
+)
+WHERE donor_id IN (SELECT keep_id FROM donor_merge);
+
+DELETE FROM donors WHERE donor_id IN (SELECT donor_id FROM donor_merge);
+
+DROP TABLE donor_merge;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_donors_identity ON donors({DONOR_KEY});
+"""
+
+
+# Days-of-supply forecasting (forecast.py). inventory_snapshots has one row per
+# (day, blood type): that day's flows, plus the stock on hand for days the nightly
+# run saw. supply_forecast is the nightly result, one row per type.
+SUPPLY_FORECAST = """
+CREATE TABLE IF NOT EXISTS inventory_snapshots (
+    snapshot_date DATE NOT NULL,
+    blood_type TEXT NOT NULL,
+    donated INTEGER NOT NULL DEFAULT 0,
+    requested INTEGER NOT NULL DEFAULT 0,
+    expired INTEGER NOT NULL DEFAULT 0,
+    available_bags INTEGER,
+    available_ml INTEGER,
+    PRIMARY KEY (snapshot_date, blood_type)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS supply_forecast (
+    blood_type TEXT PRIMARY KEY,
+    computed_at TEXT NOT NULL DEFAULT (datetime('now')),
+    available_bags INTEGER NOT NULL,
+    daily_demand REAL NOT NULL,
+    daily_donations REAL NOT NULL,
+    days_of_supply REAL,
+    stockout_day REAL,
+    expiring_unused REAL NOT NULL,
+    projection TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_inventory_donation_date ON blood_inventory(donation_date, blood_type);
+"""
+
+
+# Donor recall (recall.py): the donors of one type who are past the deferral
+# interval are one range of this index. It carries name and phone so recall lists
+# are read from the index alone, without a table lookup per donor.
+RECALL_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_donors_type_last_donation ON donors(blood_type, last_donation_date, name, phone);
+"""
+
+
+# Live mode (live.py) polls this for what changed on the Urgent Requests and
+# Expiring Soon pages. Only rows that are, or were, on one of those pages are
+# logged; the sweeper prunes entries older than a day.
+CHANGE_LOG = """
+CREATE TABLE IF NOT EXISTS change_log (
+    change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE TRIGGER IF NOT EXISTS requests_log_insert AFTER INSERT ON hospital_requests
+WHEN NEW.status = 'pending' AND NEW.urgency IN ('urgent', 'emergency')
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('hospital_requests', NEW.request_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_log_update AFTER UPDATE ON hospital_requests
+WHEN (OLD.status = 'pending' AND OLD.urgency IN ('urgent', 'emergency'))
+  OR (NEW.status = 'pending' AND NEW.urgency IN ('urgent', 'emergency'))
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('hospital_requests', NEW.request_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS requests_log_delete AFTER DELETE ON hospital_requests
+WHEN OLD.status = 'pending' AND OLD.urgency IN ('urgent', 'emergency')
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('hospital_requests', OLD.request_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_log_insert AFTER INSERT ON blood_inventory
+WHEN NEW.status = 'available' AND NEW.expiry_date <= date('now', '+7 days')
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('blood_inventory', NEW.bag_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_log_update AFTER UPDATE ON blood_inventory
+WHEN (OLD.status = 'available' AND OLD.expiry_date <= date('now', '+7 days'))
+  OR (NEW.status = 'available' AND NEW.expiry_date <= date('now', '+7 days'))
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('blood_inventory', NEW.bag_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_log_delete AFTER DELETE ON blood_inventory
+WHEN OLD.status = 'available' AND OLD.expiry_date <= date('now', '+7 days')
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('blood_inventory', OLD.bag_id);
+END;
+"""
+
+# Entries are in change_id order, which is time order: delete up to the first one from the last day.
+PRUNE_CHANGE_LOG_SQL = """
+    DELETE FROM change_log WHERE change_id < COALESCE(
+        (SELECT change_id FROM change_log WHERE changed_at >= datetime('now', '-1 day') ORDER BY change_id LIMIT 1),
+        (SELECT MAX(change_id) + 1 FROM change_log))
+"""
+
+
+# The in-memory inventory index (inventory_index.py) packs each available bag into
+# one 64-bit heap key: expiry day (days since 1970-01-01) << 44 | bag_id << 12 | volume_ml.
+def bag_key(row):
+    return (f"((CAST(julianday({row}.expiry_date) - 2440587.5 AS INTEGER) << 44) | ({row}.bag_id << 12)"
+            f" | MIN(MAX(COALESCE({row}.volume_ml, 0), 0), 4095))")
+
+
+# One row per bag entering or leaving the available stock, with its key before and
+# after, so the index can follow every writer without re-reading the table. Pruned
+# like change_log; an index that falls behind the pruning reloads.
+INVENTORY_CHANGES = f"""
+CREATE TABLE IF NOT EXISTS inventory_changes (
+    change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    removed_type TEXT,
+    removed_key INTEGER,
+    added_type TEXT,
+    added_key INTEGER,
+    changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE TRIGGER IF NOT EXISTS inventory_changes_insert AFTER INSERT ON blood_inventory
+WHEN NEW.status = 'available'
+BEGIN
+    INSERT INTO inventory_changes (added_type, added_key) VALUES (NEW.blood_type, {bag_key("NEW")});
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_changes_update
+AFTER UPDATE OF status, blood_type, expiry_date, volume_ml ON blood_inventory
+WHEN OLD.status = 'available' OR NEW.status = 'available'
+BEGIN
+    INSERT INTO inventory_changes (removed_type, removed_key, added_type, added_key) VALUES (
+        CASE WHEN OLD.status = 'available' THEN OLD.blood_type END,
+        CASE WHEN OLD.status = 'available' THEN {bag_key("OLD")} END,
+        CASE WHEN NEW.status = 'available' THEN NEW.blood_type END,
+        CASE WHEN NEW.status = 'available' THEN {bag_key("NEW")} END);
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_changes_delete AFTER DELETE ON blood_inventory
+WHEN OLD.status = 'available'
+BEGIN
+    INSERT INTO inventory_changes (removed_type, removed_key) VALUES (OLD.blood_type, {bag_key("OLD")});
+END;
+"""
+
+PRUNE_INVENTORY_CHANGES_SQL = """
+    DELETE FROM inventory_changes WHERE change_id < COALESCE(
+        (SELECT change_id FROM inventory_changes WHERE changed_at >= datetime('now', '-1 day') ORDER BY change_id LIMIT 1),
+        (SELECT MAX(change_id) + 1 FROM inventory_changes))
+"""
+
+
+# Units still owed to a request: what it asked for, less the bags already issued to it.
+def outstanding_units(row):
+    return f"{row}.quantity_needed - (SELECT COUNT(*) FROM blood_inventory WHERE request_id = {row}.request_id)"
+
+
+# Pending demand per (blood type, urgency) for the shortage check (shortage.py), kept
+# by triggers on the requests and on bags being issued to them (allocation.py sets
+# request_id, then marks the request fulfilled once nothing is outstanding).
+PENDING_DEMAND = f"""
+CREATE TABLE IF NOT EXISTS pending_demand (
+    blood_type TEXT NOT NULL,
+    urgency TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (blood_type, urgency)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_requests_pending_type
+ON hospital_requests(blood_type, urgency, request_date) WHERE status = 'pending';
+
+CREATE TRIGGER IF NOT EXISTS demand_after_insert AFTER INSERT ON hospital_requests
+WHEN NEW.status = 'pending'
+BEGIN
+    INSERT INTO pending_demand (blood_type, urgency, requests, units)
+    VALUES (NEW.blood_type, COALESCE(NEW.urgency, 'routine'), 1, {outstanding_units("NEW")})
+    ON CONFLICT (blood_type, urgency)
+    DO UPDATE SET requests = requests + 1, units = units + excluded.units;
+END;
+
+CREATE TRIGGER IF NOT EXISTS demand_after_delete AFTER DELETE ON hospital_requests
+WHEN OLD.status = 'pending'
+BEGIN
+    UPDATE pending_demand SET requests = requests - 1, units = units - ({outstanding_units("OLD")})
+    WHERE blood_type = OLD.blood_type AND urgency = COALESCE(OLD.urgency, 'routine');
+    DELETE FROM pending_demand
+    WHERE blood_type = OLD.blood_type AND urgency = COALESCE(OLD.urgency, 'routine') AND requests <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS demand_after_update_old
+AFTER UPDATE OF status, blood_type, urgency, quantity_needed ON hospital_requests
+WHEN OLD.status = 'pending'
+BEGIN
+    UPDATE pending_demand SET requests = requests - 1, units = units - ({outstanding_units("OLD")})
+    WHERE blood_type = OLD.blood_type AND urgency = COALESCE(OLD.urgency, 'routine');
+    DELETE FROM pending_demand
+    WHERE blood_type = OLD.blood_type AND urgency = COALESCE(OLD.urgency, 'routine') AND requests <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS demand_after_update_new
+AFTER UPDATE OF status, blood_type, urgency, quantity_needed ON hospital_requests
+WHEN NEW.status = 'pending'
+BEGIN
+    INSERT INTO pending_demand (blood_type, urgency, requests, units)
+    VALUES (NEW.blood_type, COALESCE(NEW.urgency, 'routine'), 1, {outstanding_units("NEW")})
+    ON CONFLICT (blood_type, urgency)
+    DO UPDATE SET requests = requests + 1, units = units + excluded.units;
+END;
+
+CREATE TRIGGER IF NOT EXISTS demand_bag_insert AFTER INSERT ON blood_inventory
+WHEN NEW.request_id IS NOT NULL
+BEGIN
+    UPDATE pending_demand SET units = units - 1
+    WHERE (blood_type, urgency) = (SELECT blood_type, COALESCE(urgency, 'routine') FROM hospital_requests
+                                   WHERE request_id = NEW.request_id AND status = 'pending');
+END;
+
+CREATE TRIGGER IF NOT EXISTS demand_bag_delete AFTER DELETE ON blood_inventory
+WHEN OLD.request_id IS NOT NULL
+BEGIN
+    UPDATE pending_demand SET units = units + 1
+    WHERE (blood_type, urgency) = (SELECT blood_type, COALESCE(urgency, 'routine') FROM hospital_requests
+                                   WHERE request_id = OLD.request_id AND status = 'pending');
+END;
+
+CREATE TRIGGER IF NOT EXISTS demand_bag_update AFTER UPDATE OF request_id ON blood_inventory
+WHEN OLD.request_id IS NOT NEW.request_id
+BEGIN
+    UPDATE pending_demand SET units = units + 1
+    WHERE (blood_type, urgency) = (SELECT blood_type, COALESCE(urgency, 'routine') FROM hospital_requests
+                                   WHERE request_id = OLD.request_id AND status = 'pending');
+    UPDATE pending_demand SET units = units - 1
+    WHERE (blood_type, urgency) = (SELECT blood_type, COALESCE(urgency, 'routine') FROM hospital_requests
+                                   WHERE request_id = NEW.request_id AND status = 'pending');
+END;
+"""
+
+
+def rebuild_dashboard_summary(conn):
+    conn.execute("DELETE FROM available_stock")
+    conn.execute("""
+        INSERT INTO available_stock (blood_type, expiry_date, bags, total_ml)
+        SELECT blood_type, expiry_date, COUNT(*), SUM(COALESCE(volume_ml, 0))
+        FROM blood_inventory WHERE status='available'
+        GROUP BY blood_type, expiry_date
+    """)
+    conn.execute("DELETE FROM dashboard_counters")
+    conn.execute("""
+        INSERT INTO dashboard_counters (name, value) VALUES
+        ('donors', (SELECT COUNT(*) FROM donors)),
+        ('urgent_pending', (SELECT COUNT(*) FROM hospital_requests
+                            WHERE urgency IN ('urgent','emergency') AND status='pending'))
+    """)
+
+
+def add_dashboard_summary(conn):
+    run_script(conn, DASHBOARD_SUMMARY)
+    rebuild_dashboard_summary(conn)
+
+
+def rebuild_pending_demand(conn):
+    conn.execute("DELETE FROM pending_demand")
+    conn.execute(f"""
+        INSERT INTO pending_demand (blood_type, urgency, requests, units)
+        SELECT r.blood_type, COALESCE(r.urgency, 'routine'), COUNT(*), SUM({outstanding_units("r")})
+        FROM hospital_requests r WHERE r.status = 'pending'
+        GROUP BY r.blood_type, COALESCE(r.urgency, 'routine')
+    """)
+
+
+def add_pending_demand(conn):
+    run_script(conn, PENDING_DEMAND)
+    rebuild_pending_demand(conn)
+
+
+# Append only: a database at version N has had exactly MIGRATIONS[:N] applied.
+MIGRATIONS = [
+    BASE_SCHEMA,
+    add_dashboard_summary,
+    HOT_PATH_INDEXES,
+    DONOR_SEARCH_INDEX,
+    LISTING_INDEXES,
+    COMPATIBILITY_TABLE,
+    BAG_ALLOCATION,
+    EXPIRY_SWEEPS,
+    DONOR_IDENTITY,
+    track_table_versions,
+    SUPPLY_FORECAST,
+    track_table_versions,
+    RECALL_INDEX,
+    CHANGE_LOG,
+    INVENTORY_CHANGES,
+    add_pending_demand,
+    track_table_versions,
+]
+
+# Tables bounded by the number of blood types / expiry dates; scanning them is fine.
+SMALL_TABLES = {"blood_types", "blood_compatibility", "available_stock", "dashboard_counters", "supply_forecast",
+                "pending_demand"}
+
+
+def init_db():
+    conn = sqlite3.connect(DB_FILE)
+    conn.execute("PRAGMA foreign_keys = ON")
+    migrate(conn, MIGRATIONS)
+    conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Migrations run once per process, the first time anything needs the database.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            init_db()
+            _pool = ConnectionPool(DB_FILE, row_factory=sqlite3.Row, connect=instrumentation.connect)
+    return _pool
+
+
+# Page reads go through this; the search index only changes with donors.
+cache = QueryCache(derived={"donors_fts": ["donors"]})
+
+
+def get_conn():
+    return get_pool().acquire()
+
+
+def release_conn(conn):
+    get_pool().release(conn)
+
+
+def connection():
+    return get_pool().connection()
+
+
+# ====================== PAGE QUERIES ======================
+# How the list pages load these columns (arrow_tables.read_arrow); the rest keep SQLite's types.
+DISPLAY_TYPES = {
+    "blood_type": "category", "status": "category", "urgency": "category",
+    "donation_date": "date", "expiry_date": "date", "request_date": "date", "last_donation_date": "date",
+}
+
+DASHBOARD_COUNTERS_SQL = "SELECT name, value FROM dashboard_counters"
+
+DASHBOARD_STOCK_SQL = """
+    SELECT blood_type, SUM(bags) AS bags, SUM(total_ml) AS total_ml,
+           SUM(CASE WHEN expiry_date <= date('now','+7 days') THEN bags ELSE 0 END) AS expiring
+    FROM available_stock
+    GROUP BY blood_type
+    ORDER BY blood_type
+"""
+
+SEARCH_LIMIT = 50
+
+SEARCH_DONORS_SQL = """
+    SELECT donors.name, donors.blood_type, donors.phone, donors.last_donation_date
+    FROM donors_fts
+    JOIN donors ON donors.donor_id = donors_fts.rowid
+    WHERE donors_fts MATCH ?
+    ORDER BY donors_fts.rank
+    LIMIT ?
+"""
+
+
+def donor_search_match(term):
+    """Turn a search box entry into an FTS5 MATCH expression, or None if it has nothing to search.
+
+    Words match name tokens by prefix ("jo smi" finds "John Smith"); digits match
+    the start of the phone number whatever its punctuation ("0300-12" finds "0300 1234567").
+    """
+    tokens = re.findall(r"[^\W_]+", term)
+    words = [t for t in tokens if not t.isdigit()]
+    digits = "".join(t for t in tokens if t.isdigit())
+    parts = []
+    if words:
+        parts.append("name : (" + " AND ".join(f'"{w}"*' for w in words) + ")")
+    if digits:
+        parts.append(f'phone_digits : "{digits}"*')
+    return " AND ".join(parts) or None
+
+
+
+URGENT_REQUESTS_SQL = """
+    SELECT request_id, hospital_name, blood_type, quantity_needed, urgency, request_date
+    FROM hospital_requests
+    WHERE status='pending' AND urgency IN ('urgent', 'emergency')
+    ORDER BY CASE urgency WHEN 'emergency' THEN 1 ELSE 2 END
+"""
+
+# Shortage check (shortage.py): demand and supply come from the trigger-kept summaries.
+PENDING_DEMAND_SQL = "SELECT blood_type, urgency, requests, units FROM pending_demand"
+
+USABLE_STOCK_SQL = """
+    SELECT blood_type, SUM(bags) AS bags
+    FROM available_stock
+    WHERE expiry_date >= date('now')
+    GROUP BY blood_type
+"""
+
+# Newest first: the allocator serves each type's requests oldest first, so these go short first.
+REQUESTS_AT_RISK_SQL = f"""
+    SELECT r.request_id, {outstanding_units("r")} AS outstanding
+    FROM hospital_requests r
+    WHERE r.status = 'pending' AND r.blood_type = :blood_type AND r.urgency = :urgency
+    ORDER BY r.request_date DESC, r.request_id DESC
+"""
+
+EXPIRING_SOON_SQL = """
+    SELECT bag_id, blood_type, donation_date, expiry_date,
+           ROUND(julianday(expiry_date) - julianday('now')) AS days_left
+    FROM blood_inventory
+    WHERE status='available' AND expiry_date <= date('now','+7 days')
+    ORDER BY expiry_date
+"""
+
+SUPPLY_FORECAST_SQL = """
+    SELECT blood_type, computed_at, available_bags, daily_demand, daily_donations,
+           days_of_supply, stockout_day, expiring_unused, projection
+    FROM supply_forecast
+    ORDER BY blood_type
+"""
+
+# Donor Recall: donors whose blood `recipient_type` can receive and whose last
+# donation was on or before the cutoff (today minus recall.DEFERRAL_DAYS).
+RECALL_SQL = """
+    SELECT d.donor_id, d.name, d.blood_type, d.phone, d.last_donation_date
+    FROM blood_compatibility c
+    JOIN donors d ON d.blood_type = c.donor_type AND d.last_donation_date <= :cutoff
+    WHERE c.recipient_type = :recipient_type
+"""
+
+RECALL_COUNTS_SQL = """
+    SELECT c.donor_type AS blood_type, COUNT(*) AS donors
+    FROM blood_compatibility c
+    JOIN donors d ON d.blood_type = c.donor_type AND d.last_donation_date <= :cutoff
+    WHERE c.recipient_type = :recipient_type
+    GROUP BY c.donor_type
+"""
+
+# One donor type at a time: each is an index range already in date order.
+RECALL_TOP_SQL = """
+    SELECT donor_id, name, blood_type, phone, last_donation_date
+    FROM donors
+    WHERE blood_type = :blood_type AND last_donation_date <= :cutoff
+    ORDER BY last_donation_date DESC
+    LIMIT :limit
+"""
+
+# Add Donation: find-or-create the donor and get its id back in one statement.
+UPSERT_DONOR_SQL = f"""
+    INSERT INTO donors (name, blood_type, phone, last_donation_date) VALUES (?, ?, ?, ?)
+    ON CONFLICT ({DONOR_KEY})
+    DO UPDATE SET last_donation_date = MAX(COALESCE(last_donation_date, ''), excluded.last_donation_date)
+    RETURNING donor_id
+"""
+
+INSERT_BAG_SQL = """
+    INSERT INTO blood_inventory (blood_type, donor_id, donation_date, expiry_date, volume_ml)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+INSERT_REQUEST_SQL = "INSERT INTO hospital_requests (hospital_name, blood_type, quantity_needed, urgency) VALUES (?, ?, ?, ?)"
+
+# ====================== LISTING PAGES ======================
+# Blood Inventory, Donors and Hospital Requests are read one page at a time with
+# keyset (seek) pagination: the next page starts after the last row's sort key,
+# so every page costs the same index seek however deep into the table it is.
+# The last sort column is the primary key, which makes the key unique.
+LISTINGS = {
+    "inventory": {
+        "table": "blood_inventory",
+        "columns": ["bag_id", "blood_type", "donation_date", "expiry_date", "volume_ml", "status"],
+        "sort": ["expiry_date", "bag_id"],
+        "descending": False,
+        "date_column": "expiry_date",
+        "statuses": ["available", "used", "expired", "discarded"],
+    },
+    "donors": {
+        "table": "donors",
+        "columns": ["name", "blood_type", "phone", "last_donation_date"],
+        "sort": ["name", "blood_type", "donor_id"],
+        "descending": False,
+        "date_column": "last_donation_date",
+        "statuses": [],
+    },
+    "requests": {
+        "table": "hospital_requests",
+        "columns": ["hospital_name", "blood_type", "quantity_needed", "urgency", "status", "request_date"],
+        "sort": ["request_date", "request_id"],
+        "descending": True,
+        "date_column": "request_date",
+        "statuses": ["pending", "fulfilled"],
+    },
+}
+
+
+def listing_query(listing, blood_type=None, status=None, date_from=None, date_to=None, after=None, limit=50):
+    """Build the SQL and parameters for one page of a listing.
+
+    `after` is the sort key of the last row on the previous page (None for the
+    first page). One extra row is fetched so the caller knows whether a next page exists.
+    """
+    spec = LISTINGS[listing]
+    where, params = [], []
+    if blood_type:
+        where.append("blood_type = ?")
+        params.append(blood_type)
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if date_from:
+        where.append(f"{spec['date_column']} >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append(f"{spec['date_column']} <= ?")
+        params.append(str(date_to))
+    if after is not None:
+        keys = ", ".join(spec["sort"])
+        marks = ", ".join("?" for _ in spec["sort"])
+        where.append(f"({keys}) {'<' if spec['descending'] else '>'} ({marks})")
+        params.extend(after)
+
+    direction = " DESC" if spec["descending"] else ""
+    columns = spec["columns"] + [c for c in spec["sort"] if c not in spec["columns"]]
+    sql = f"SELECT {', '.join(columns)} FROM {spec['table']}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(c + direction for c in spec["sort"]) + " LIMIT ?"
+    params.append(limit + 1)
+    return sql, tuple(params)
+
+# Every query behind a sidebar page, with sample parameters (see check_query_plans.py).
+PAGE_QUERIES = {
+    "Dashboard counters": (DASHBOARD_COUNTERS_SQL, ()),
+    "Dashboard stock": (DASHBOARD_STOCK_SQL, ()),
+    "Search Donor": (SEARCH_DONORS_SQL, (donor_search_match("john"), SEARCH_LIMIT)),
+    "Blood Inventory": listing_query("inventory"),
+    "Blood Inventory next page": listing_query("inventory", after=("2026-01-01", 100)),
+    "Blood Inventory by status": listing_query("inventory", status="available", after=("2026-01-01", 100)),
+    "Blood Inventory by type": listing_query("inventory", blood_type="O-", date_from="2026-01-01", date_to="2026-02-01"),
+    "Urgent Requests": (URGENT_REQUESTS_SQL, ()),
+    "Urgent Requests demand": (PENDING_DEMAND_SQL, ()),
+    "Urgent Requests supply": (USABLE_STOCK_SQL, ()),
+    "Urgent Requests at risk": (REQUESTS_AT_RISK_SQL, {"blood_type": "O-", "urgency": "emergency"}),
+    "Expiring Soon": (EXPIRING_SOON_SQL, ()),
+    "Supply Forecast": (SUPPLY_FORECAST_SQL, ()),
+    "Donors": listing_query("donors"),
+    "Donors next page": listing_query("donors", after=("John", "A+", 100)),
+    "Donors by type": listing_query("donors", blood_type="O-", after=("John", "O-", 100)),
+    "Donor Recall counts": (RECALL_COUNTS_SQL, {"cutoff": "2026-01-01", "recipient_type": "AB+"}),
+    "Donor Recall list": (RECALL_TOP_SQL, {"blood_type": "O-", "cutoff": "2026-01-01", "limit": 100}),
+    "Donor Recall export": (RECALL_SQL, {"cutoff": "2026-01-01", "recipient_type": "AB+"}),
+    "Hospital Requests": listing_query("requests"),
+    "Hospital Requests next page": listing_query("requests", after=("2026-01-01", 100)),
+    "Hospital Requests by status": listing_query("requests", status="pending", date_from="2026-01-01"),
+    "Hospital Requests by type": listing_query("requests", blood_type="O-", after=("2026-01-01", 100)),
+}
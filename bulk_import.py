@@ -0,0 +1,224 @@
+# bulk_import.py - streaming CSV / Excel import of donations from a blood drive
+#
+# Usage:  python bulk_import.py drive.csv
+#         python bulk_import.py drive.xlsx --rejects rejected.csv --chunk-size 20000
+#
+# One row per donation. Columns (header names are case-insensitive):
+#   name (or donor_name), blood_type   required
+#   phone, donation_date, volume_ml    optional; date defaults to today, volume to 450
+#   expiry_date                        optional; defaults to donation_date + 42 days
+#
+# The file is read in chunks and each chunk is one transaction: the rows go into a
+# TEMP staging table with executemany, donors are matched or created with one
+# set-based upsert, and the bags are inserted in one INSERT ... SELECT.
+# Rows that fail validation are skipped and reported with their line number.
+import argparse
+import os
+import time
+from datetime import date
+
+import pandas as pd
+
+import blood_db
+from db_pool import write_transaction
+
+CHUNK_SIZE = 10_000
+SHELF_LIFE_DAYS = 42
+DEFAULT_VOLUME = 450
+VOLUME_RANGE = (300, 550)
+
+COLUMNS = ["name", "blood_type", "phone", "donation_date", "expiry_date", "volume_ml"]
+ALIASES = {"donor_name": "name", "donor": "name", "type": "blood_type", "volume": "volume_ml"}
+
+STAGING_TABLE = f"""
+CREATE TEMP TABLE IF NOT EXISTS import_staging (
+    line INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    blood_type TEXT NOT NULL,
+    phone TEXT,
+    donation_date DATE NOT NULL,
+    expiry_date DATE NOT NULL,
+    volume_ml INTEGER NOT NULL,
+    phone_digits TEXT GENERATED ALWAYS AS ({blood_db.PHONE_DIGITS}) VIRTUAL
+)
+"""
+
+# One upsert per distinct donor in the chunk, on the same key as the Add Donation
+# form (blood_db.DONOR_KEY). "WHERE true" keeps ON CONFLICT from parsing as a join.
+UPSERT_DONORS_SQL = f"""
+    INSERT INTO donors (name, blood_type, phone, last_donation_date)
+    SELECT MIN(name), blood_type, MIN(phone), MAX(donation_date)
+    FROM import_staging
+    WHERE true
+    GROUP BY {blood_db.DONOR_KEY}
+    ON CONFLICT ({blood_db.DONOR_KEY})
+    DO UPDATE SET last_donation_date = MAX(COALESCE(last_donation_date, ''), excluded.last_donation_date)
+"""
+
+INSERT_BAGS_SQL = """
+    INSERT INTO blood_inventory (blood_type, donor_id, donation_date, expiry_date, volume_ml)
+    SELECT blood_type,
+           (SELECT donor_id FROM donors
+            WHERE lower(trim(donors.name)) = lower(trim(import_staging.name))
+              AND donors.blood_type = import_staging.blood_type
+              AND COALESCE(donors.phone_digits, '') = COALESCE(import_staging.phone_digits, '')),
+           donation_date, expiry_date, volume_ml
+    FROM import_staging
+    ORDER BY line
+"""
+
+DONOR_COUNT_SQL = "SELECT value FROM dashboard_counters WHERE name = 'donors'"
+
+
+def normalize_header(column):
+    column = str(column).strip().lower().replace(" ", "_")
+    return ALIASES.get(column, column)
+
+
+def read_chunks(source, kind=None, chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of at most chunk_size rows, all values as read (strings for CSV).
+
+    `source` is a path or a file object; `kind` is "csv" or "xlsx" and is taken
+    from the file name when not given.
+    """
+    if kind is None:
+        name = source if isinstance(source, str) else getattr(source, "name", "")
+        kind = "xlsx" if name.lower().endswith((".xlsx", ".xlsm")) else "csv"
+    if kind == "csv":
+        yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_size)
+        return
+
+    # openpyxl's read-only mode streams the sheet row by row instead of loading it whole.
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def clean_chunk(df, first_line, blood_types, today):
+    """Validate one chunk. Returns (rows ready for staging, rejected rows with a reason)."""
+    df = df.rename(columns=normalize_header)
+    for column in COLUMNS:
+        if column not in df:
+            df[column] = None
+    df.index = pd.RangeIndex(first_line, first_line + len(df), name="line")
+    raw = {column: df[column].replace("", None) for column in COLUMNS}
+    today = pd.Timestamp(today)
+
+    name = raw["name"].astype("string").str.strip().replace("", pd.NA)
+    blood_type = raw["blood_type"].astype("string").str.strip().str.upper()
+    phone = raw["phone"].astype("string").str.strip().replace("", pd.NA)
+    donation_date = pd.to_datetime(raw["donation_date"], format="ISO8601", errors="coerce").dt.normalize()
+    donation_date = donation_date.where(raw["donation_date"].notna(), today)
+    expiry_date = pd.to_datetime(raw["expiry_date"], format="ISO8601", errors="coerce").dt.normalize()
+    volume = pd.to_numeric(raw["volume_ml"], errors="coerce")
+
+    reason = pd.Series(pd.NA, index=df.index, dtype="string")
+    for bad, message in [
+        (name.isna(), "missing name"),
+        (~blood_type.isin(blood_types).fillna(False), "unknown blood type"),
+        (donation_date.isna(), "bad donation_date"),
+        (donation_date > today, "donation_date in the future"),
+        (raw["expiry_date"].notna() & expiry_date.isna(), "bad expiry_date"),
+        (expiry_date.notna() & (expiry_date < donation_date), "expiry_date before donation_date"),
+        (raw["volume_ml"].notna() & ~(volume.between(*VOLUME_RANGE) & (volume % 1 == 0)),
+         "volume_ml must be an integer from %d to %d" % VOLUME_RANGE),
+    ]:
+        reason[bad & reason.isna()] = message
+
+    ok = reason.isna()
+    expiry_date = expiry_date.where(raw["expiry_date"].notna(), donation_date + pd.Timedelta(days=SHELF_LIFE_DAYS))
+    clean = pd.DataFrame({
+        "line": df.index,
+        "name": name,
+        "blood_type": blood_type,
+        "phone": phone,
+        "donation_date": donation_date.dt.strftime("%Y-%m-%d"),
+        "expiry_date": expiry_date.dt.strftime("%Y-%m-%d"),
+        "volume_ml": volume.fillna(DEFAULT_VOLUME),
+    })[ok]
+    rejected = df.loc[~ok, COLUMNS].assign(reason=reason[~ok]).reset_index()
+    return clean, rejected
+
+
+def staging_rows(clean):
+    # Plain Python values: numpy scalars would bind as BLOBs and pd.NA not at all.
+    for line, name, blood_type, phone, donation_date, expiry_date, volume in clean.itertuples(index=False):
+        yield (int(line), name, blood_type, None if pd.isna(phone) else phone,
+               donation_date, expiry_date, int(volume))
+
+
+def load_chunk(conn, clean):
+    def work(conn):
+        conn.execute("DELETE FROM import_staging")
+        conn.executemany("INSERT INTO import_staging (line, name, blood_type, phone, donation_date, expiry_date, "
+                         "volume_ml) VALUES (?, ?, ?, ?, ?, ?, ?)", staging_rows(clean))
+        donors_before = conn.execute(DONOR_COUNT_SQL).fetchone()[0]
+        conn.execute(UPSERT_DONORS_SQL)
+        new_donors = conn.execute(DONOR_COUNT_SQL).fetchone()[0] - donors_before
+        bags = conn.execute(INSERT_BAGS_SQL).rowcount
+        conn.execute("DELETE FROM import_staging")
+        return new_donors, bags
+
+    return write_transaction(conn, work)
+
+
+def import_donations(conn, source, kind=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Import a CSV / XLSX file of donations; returns (summary dict, rejected rows DataFrame).
+
+    `progress`, if given, is called after every chunk with the running summary.
+    """
+    started = time.perf_counter()
+    conn.execute(STAGING_TABLE)
+    blood_types = [row[0] for row in conn.execute("SELECT blood_type FROM blood_types")]
+    today = date.fromisoformat(conn.execute("SELECT date('now')").fetchone()[0])
+    summary = {"rows_read": 0, "bags_imported": 0, "new_donors": 0, "rejected": 0, "seconds": 0.0}
+    rejected = []
+    line = 2  # line 1 is the header
+    for chunk in read_chunks(source, kind, chunk_size):
+        clean, bad = clean_chunk(chunk, line, blood_types, today)
+        line += len(chunk)
+        if len(clean):
+            new_donors, bags = load_chunk(conn, clean)
+            summary["new_donors"] += new_donors
+            summary["bags_imported"] += bags
+        if len(bad):
+            rejected.append(bad)
+        summary["rows_read"] += len(chunk)
+        summary["rejected"] += len(bad)
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        if progress:
+            progress(summary)
+    rejected = pd.concat(rejected, ignore_index=True) if rejected else pd.DataFrame(columns=["line", "reason"])
+    return summary, rejected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import blood drive donations from a CSV or Excel file.")
+    parser.add_argument("file", help="a .csv or .xlsx file")
+    parser.add_argument("--rejects", metavar="CSV", help="write rejected rows here (default: <file>.rejected.csv)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per transaction")
+    args = parser.parse_args()
+    with blood_db.connection() as conn:
+        summary, rejected = import_donations(
+            conn, args.file, chunk_size=args.chunk_size,
+            progress=lambda s: print(f"{s['rows_read']} rows read, {s['bags_imported']} imported, "
+                                     f"{s['rejected']} rejected", flush=True))
+    print(summary)
+    if len(rejected):
+        path = args.rejects or os.path.splitext(args.file)[0] + ".rejected.csv"
+        rejected.to_csv(path, index=False)
+        print(f"{len(rejected)} rejected row(s) written to {path}")
@@ -0,0 +1,90 @@
+# check_donation_upsert.py - hammer record_donation() from many threads and check the result
+#
+# Usage:  python check_donation_upsert.py [--threads 32] [--donations 200]
+#
+# Every thread records donations for the same small set of people, spelled with
+# different case, spacing and phone punctuation, each through its own pooled
+# connection against a fresh database file. Exits non-zero unless there is
+# exactly one donor per person and one bag per call, with no call failing.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+
+import blood_db
+from db_pool import ConnectionPool
+from donations import record_donation
+from migrations import migrate
+
+PEOPLE = [("Amina Yusuf", "O-", "0300-1234567"), ("John Smith", "A+", None), ("Li Wei", "B+", "(042) 555 0101"),
+          ("Sara Khan", "AB-", "+92 321 7654321"), ("Omar Ali", "O+", None)]
+
+
+def spellings(name, phone):
+    """The same person as different clerks might type them."""
+    names = [name, name.upper(), name.lower(), f"  {name} "]
+    phones = [phone] if phone is None else [phone, phone.replace(" ", ""), phone.replace("-", " ")]
+    return names, phones
+
+
+def hammer(pool, donations, seed, errors, barrier):
+    rng = random.Random(seed)
+    barrier.wait()
+    with pool.connection() as conn:
+        for _ in range(donations):
+            name, blood_type, phone = rng.choice(PEOPLE)
+            names, phones = spellings(name, phone)
+            try:
+                record_donation(conn, rng.choice(names), blood_type, rng.choice(phones))
+            except Exception as e:
+                errors.append(repr(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency check for the donation upsert.")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--donations", type=int, default=200, help="per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hammer.db")
+        conn = sqlite3.connect(path)
+        migrate(conn, blood_db.MIGRATIONS)
+        conn.close()
+
+        pool = ConnectionPool(path, size=args.threads)
+        errors = []
+        barrier = threading.Barrier(args.threads)
+        threads = [threading.Thread(target=hammer, args=(pool, args.donations, seed, errors, barrier))
+                   for seed in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with pool.connection() as conn:
+            donors = conn.execute("SELECT COUNT(*) FROM donors").fetchone()[0]
+            bags = conn.execute("SELECT COUNT(*) FROM blood_inventory").fetchone()[0]
+            orphans = conn.execute("SELECT COUNT(*) FROM blood_inventory WHERE donor_id IS NULL").fetchone()[0]
+            counter = conn.execute("SELECT value FROM dashboard_counters WHERE name = 'donors'").fetchone()[0]
+
+    expected = args.threads * args.donations
+    failures = []
+    if errors:
+        failures.append(f"{len(errors)} call(s) failed, e.g. {errors[0]}")
+    if donors != len(PEOPLE) or counter != len(PEOPLE):
+        failures.append(f"{donors} donor row(s) / counter {counter}, expected {len(PEOPLE)}")
+    if bags != expected or orphans:
+        failures.append(f"{bags} bag(s) ({orphans} without a donor), expected {expected}")
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"ok    {args.threads} threads x {args.donations} donations -> {donors} donors, {bags} bags")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# check_query_plans.py - fail if a page query falls back to a full table scan
+#
+# Usage:  python check_query_plans.py
+#
+# Builds each app's schema in memory through its migrations, runs
+# EXPLAIN QUERY PLAN on every entry of PAGE_QUERIES and exits non-zero if any
+# plan contains a bare "SCAN <table>" step (SCAN ... USING INDEX is fine).
+import re
+import sqlite3
+import sys
+
+import blood_db
+import hms_db
+from migrations import migrate
+
+BARE_SCAN = re.compile(r"^SCAN (\w+)$")
+# "FROM blood_inventory b", "JOIN donors AS d", "FROM main.hospital_requests r"
+SOURCE = re.compile(r"\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+NOT_ALIASES = {"where", "join", "left", "inner", "cross", "natural", "on", "using", "group", "order", "limit",
+               "union", "except", "intersect", "window", "indexed", "not"}
+
+
+def aliases(sql):
+    """alias -> table for every FROM / JOIN source of `sql` (each table is its own alias too)."""
+    names = {}
+    for table, alias in SOURCE.findall(sql):
+        names[table.lower()] = table.lower()
+        if alias and alias.lower() not in NOT_ALIASES:
+            names[alias.lower()] = table.lower()
+    return names
+
+
+def full_scans(conn, sql, params, small_tables):
+    tables = {row[0].lower() for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    allowed = {t.lower() for t in small_tables}
+    sources = aliases(sql)
+    scans = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+        match = BARE_SCAN.match(row[3])
+        if not match:
+            continue
+        # Aliased tables plan as "SCAN <alias>"; subqueries and CTEs as "SCAN <name>" too,
+        # and those map to no real table.
+        table = sources.get(match.group(1).lower(), match.group(1).lower())
+        if table in tables and table not in allowed:
+            scans.append(row[3] if table == match.group(1).lower() else f"{row[3]} ({table})")
+    return scans
+
+
+def check(module):
+    conn = sqlite3.connect(":memory:")
+    migrate(conn, module.MIGRATIONS)
+    failures = 0
+    for name, (sql, params) in module.PAGE_QUERIES.items():
+        scans = full_scans(conn, sql, params, module.SMALL_TABLES)
+        if not scans:
+            print(f"ok    {module.__name__}: {name}")
+        else:
+            print(f"FAIL  {module.__name__}: {name}: {'; '.join(scans)}")
+            failures += 1
+    conn.close()
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if sum(check(m) for m in (blood_db, hms_db)) else 0)
@@ -0,0 +1,80 @@
+# compatibility.py - blood type compatibility as bitmasks and an 8x8 matrix
+#
+# Loaded once per process from blood_compatibility (the parsed form of
+# blood_types.can_donate_to), so no caller has to split comma-separated strings.
+import numpy as np
+import pandas as pd
+
+import blood_db
+
+
+class Compatibility:
+    """Who can give blood to whom.
+
+    matrix[d, r] is True when blood type d can be given to a recipient of type r;
+    rows and columns follow `types`. donate_mask[t] / receive_mask[t] are the same
+    rows and columns as bitmasks (bit i stands for types[i]).
+    """
+
+    def __init__(self, types, pairs):
+        self.types = list(types)
+        self.index = {t: i for i, t in enumerate(self.types)}
+        self.matrix = np.zeros((len(self.types), len(self.types)), dtype=bool)
+        for donor, recipient in pairs:
+            self.matrix[self.index[donor], self.index[recipient]] = True
+        bits = 1 << np.arange(len(self.types))
+        self.donate_mask = {t: int(bits[self.matrix[i]].sum()) for i, t in enumerate(self.types)}
+        self.receive_mask = {t: int(bits[self.matrix[:, i]].sum()) for i, t in enumerate(self.types)}
+
+    def can_donate(self, donor, recipient):
+        return bool(self.donate_mask[donor] >> self.index[recipient] & 1)
+
+    def donors_for(self, recipient):
+        """Types whose blood `recipient` can receive, the identical type first."""
+        mask = self.receive_mask[recipient]
+        others = [t for i, t in enumerate(self.types) if mask >> i & 1 and t != recipient]
+        return [recipient] + others if mask >> self.index[recipient] & 1 else others
+
+    def recipients_for(self, donor):
+        mask = self.donate_mask[donor]
+        return [t for i, t in enumerate(self.types) if mask >> i & 1]
+
+    def codes(self, blood_types):
+        """Matrix indexes for a list / Series / array of blood type strings."""
+        codes = pd.Categorical(blood_types, categories=self.types).codes
+        if (codes < 0).any():
+            raise ValueError("unknown blood type in input")
+        return codes
+
+    def bags_serving(self, bag_types, recipient):
+        """Boolean mask over bags: True where the bag can go to a `recipient` patient."""
+        return self.matrix[self.codes(bag_types), self.index[recipient]]
+
+    def compatible_supply(self, request_types, supply):
+        """Bags of compatible stock for each request in a batch.
+
+        `supply` maps blood type -> available bags; the answer is one matrix-vector
+        product, however many requests there are.
+        """
+        stock = np.array([supply.get(t, 0) for t in self.types])
+        return self.matrix[:, self.codes(request_types)].T @ stock
+
+
+def load(conn):
+    types = [row[0] for row in conn.execute("SELECT blood_type FROM blood_types")]
+    order = {t: i for i, t in enumerate(blood_db.BLOOD_TYPES)}
+    types.sort(key=lambda t: (order.get(t, len(order)), t))
+    pairs = conn.execute("SELECT donor_type, recipient_type FROM blood_compatibility").fetchall()
+    return Compatibility(types, pairs)
+
+
+_compatibility = None
+
+
+def get_compatibility():
+    # blood_types is reference data, so one load per process is enough.
+    global _compatibility
+    if _compatibility is None:
+        with blood_db.connection() as conn:
+            _compatibility = load(conn)
+    return _compatibility
@@ -0,0 +1,137 @@
+# db_pool.py - process-wide SQLite connection pool shared by the Streamlit worker threads
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Applied to every pooled connection. WAL lets readers keep reading while a
+# donation is being written; busy_timeout makes writers queue instead of failing.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+# Compiled statements kept per connection, so repeated page queries skip parsing.
+CACHED_STATEMENTS = 256
+
+# BEGIN IMMEDIATE attempts before giving up; each one already waits busy_timeout.
+BUSY_RETRIES = 5
+
+
+def write_transaction(conn, work, retries=BUSY_RETRIES):
+    """Run work(conn) in a BEGIN IMMEDIATE transaction and commit; returns its result.
+
+    Taking the write lock up front means the transaction can never fail half-way
+    on a lock. If the lock is still busy after busy_timeout, back off and retry.
+    """
+    for attempt in range(retries):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            if e.sqlite_errorcode != sqlite3.SQLITE_BUSY or attempt == retries - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+    try:
+        result = work(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
+
+
+class ConnectionPool:
+    """A bounded pool of connections to one SQLite file.
+
+    A thread holds at most one connection: acquire() from a thread that already
+    holds one returns the same connection. Streamlit runs every rerun in a fresh
+    thread, and st.rerun() / st.stop() can end a run before it releases its
+    connection, so connections held by finished threads are reclaimed too.
+    `connect` opens each connection; the apps pass instrumentation.connect.
+    `pragmas` run on every new connection.
+    """
+
+    def __init__(self, path, size=8, row_factory=None, timeout=30, connect=sqlite3.connect, pragmas=PRAGMAS):
+        self.path = path
+        self.connect = connect
+        self.pragmas = pragmas
+        self.size = size
+        self.row_factory = row_factory
+        self.timeout = timeout
+        self._idle = []
+        self._leases = {}
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        conn = self.connect(self.path, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        return conn
+
+    def _reclaim(self):
+        for ident, (thread, conn) in list(self._leases.items()):
+            if not thread.is_alive():
+                del self._leases[ident]
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.append(conn)
+
+    def _lease(self):
+        lease = self._leases.get(threading.get_ident())
+        if lease and lease[0] is threading.current_thread():
+            return lease[1]
+        return None
+
+    def acquire(self):
+        thread = threading.current_thread()
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            conn = self._lease()
+            if conn is not None:
+                return conn
+            while True:
+                self._reclaim()
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    conn = self._connect()
+                    self._created += 1
+                    break
+                if time.monotonic() > deadline:
+                    raise sqlite3.OperationalError(f"no free connection to {self.path} after {self.timeout}s")
+                # Finished threads never notify, so wake up now and then to reclaim.
+                self._cond.wait(0.1)
+            self._leases[thread.ident] = (thread, conn)
+            return conn
+
+    def release(self, conn):
+        with self._cond:
+            if any(idle is conn for idle in self._idle):
+                return
+            for ident, (_, held) in list(self._leases.items()):
+                if held is conn:
+                    del self._leases[ident]
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for a with-block; nested blocks share one connection."""
+        held = self._lease() is not None
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            if not held:
+                self.release(conn)
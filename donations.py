@@ -0,0 +1,33 @@
+# donations.py - recording a donation (donor find-or-create plus the new bag, atomically) or a hospital request
+from datetime import date, timedelta
+
+import blood_db
+from db_pool import write_transaction
+
+SHELF_LIFE_DAYS = 42
+
+
+def insert_donation(conn, name, blood_type, phone=None, volume_ml=450, donation_date=None):
+    """The donor upsert and the bag insert, in the caller's transaction.
+
+    The donor is matched on blood_db.DONOR_KEY, which a unique index enforces, so
+    concurrent sessions recording the same person can never create two donors.
+    Returns (donor_id, bag_id, expiry_date).
+    """
+    donation_date = donation_date or date.today()
+    expiry = (donation_date + timedelta(days=SHELF_LIFE_DAYS)).isoformat()
+    donor_id = conn.execute(blood_db.UPSERT_DONOR_SQL,
+                            (name.strip(), blood_type, phone or None, donation_date.isoformat())).fetchone()[0]
+    bag_id = conn.execute(blood_db.INSERT_BAG_SQL,
+                          (blood_type, donor_id, donation_date.isoformat(), expiry, volume_ml)).lastrowid
+    return donor_id, bag_id, expiry
+
+
+def record_donation(conn, name, blood_type, phone=None, volume_ml=450, donation_date=None):
+    """insert_donation() in its own BEGIN IMMEDIATE transaction."""
+    return write_transaction(conn, lambda conn: insert_donation(conn, name, blood_type, phone, volume_ml, donation_date))
+
+
+def insert_request(conn, hospital_name, blood_type, quantity_needed, urgency):
+    """A new pending hospital request, in the caller's transaction; returns its request_id."""
+    return conn.execute(blood_db.INSERT_REQUEST_SQL, (hospital_name, blood_type, quantity_needed, urgency)).lastrowid
@@ -0,0 +1,175 @@
+# export.py - chunked CSV / Parquet extracts of the blood bank and HMS tables
+#
+# Usage:  python export.py inventory inventory.csv
+#         python export.py requests requests.parquet --from 2026-01-01 --to 2026-01-31 --status pending
+#         python export.py billings billings.parquet --chunk-size 100000
+#         python export.py requests_history history.csv --from 2020-01-01    hot and archived rows
+#
+# Rows are read from an SQLite cursor with fetchmany() and written chunk by chunk,
+# so memory use stays at one chunk however big the table is. The format comes
+# from the file extension (.csv or .parquet).
+import argparse
+import csv
+import io
+import tempfile
+from contextlib import nullcontext
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import archive
+import blood_db
+import hms_db
+
+CHUNK_SIZE = 50_000
+
+# date_column is what --from / --to filter on; status_column is what --status filters on.
+# The *_history exports read archive.py's views over the hot and the archived rows.
+EXPORTS = {
+    "inventory": {"db": blood_db, "table": "blood_inventory", "date_column": "donation_date",
+                  "status_column": "status"},
+    "donors": {"db": blood_db, "table": "donors", "date_column": "last_donation_date", "status_column": None},
+    "requests": {"db": blood_db, "table": "hospital_requests", "date_column": "request_date",
+                 "status_column": "status"},
+    "inventory_history": {"db": blood_db, "table": "inventory_history", "date_column": "donation_date",
+                          "status_column": "status", "archive": True},
+    "requests_history": {"db": blood_db, "table": "requests_history", "date_column": "request_date",
+                         "status_column": "status", "archive": True},
+    "billings": {"db": hms_db, "table": "Billings", "date_column": "bill_date", "status_column": "payment_status"},
+}
+
+# Declared SQLite column type -> Parquet type. Dates are TEXT in both databases and stay strings.
+ARROW_TYPES = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+
+
+def table_columns(conn, table):
+    """(name, declared type) of each stored column; generated columns are left out."""
+    return [(row[1], row[2].upper()) for row in conn.execute(f"PRAGMA table_xinfo({table})") if row[6] == 0]
+
+
+def export_query(name, columns, date_from=None, date_to=None, status=None):
+    spec = EXPORTS[name]
+    where, params = [], []
+    if date_from:
+        where.append(f"{spec['date_column']} >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append(f"{spec['date_column']} <= ?")
+        params.append(str(date_to))
+    if status and spec["status_column"]:
+        where.append(f"{spec['status_column']} = ?")
+        params.append(status)
+    sql = f"SELECT {', '.join(columns)} FROM {spec['table']}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # No ORDER BY: sorting a filtered extract would need a temp B-tree as big as the result.
+    return sql, params
+
+
+def write_csv(cursor, columns, out, chunk_size):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    rows = 0
+    while chunk := cursor.fetchmany(chunk_size):
+        writer.writerows(chunk)
+        rows += len(chunk)
+    return rows
+
+
+def write_parquet(cursor, columns, types, out, chunk_size):
+    schema = pa.schema([(column, ARROW_TYPES.get(t, pa.string())) for column, t in zip(columns, types)])
+    rows = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        while chunk := cursor.fetchmany(chunk_size):
+            # Each chunk becomes one row group; the fixed schema keeps all-NULL chunks typed.
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+def export_table(name, out, fmt, date_from=None, date_to=None, status=None, chunk_size=CHUNK_SIZE):
+    """Write one table (optionally filtered) to `out`, a path or a file object; returns the row count."""
+    spec = EXPORTS[name]
+    with spec["db"].connection() as conn, archive.attached(conn) if spec.get("archive") else nullcontext():
+        columns, types = zip(*table_columns(conn, spec["table"]))
+        sql, params = export_query(name, columns, date_from, date_to, status)
+        # A plain cursor, not the pool's row factory: tuples are all the writers need.
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        try:
+            return write_rows(cursor, columns, types, out, fmt, chunk_size)
+        finally:
+            cursor.close()
+
+
+def write_rows(cursor, columns, types, out, fmt, chunk_size=CHUNK_SIZE):
+    """Stream an executed cursor to `out`, a path or a file object; returns the row count."""
+    if fmt == "csv":
+        if isinstance(out, str):
+            with open(out, "w", newline="", encoding="utf-8") as f:
+                return write_csv(cursor, columns, f, chunk_size)
+        return write_csv(cursor, columns, out, chunk_size)
+    return write_parquet(cursor, columns, types, out, chunk_size)
+
+
+def temp_export(write, fmt):
+    """Run write(out) into an anonymous temporary file and hand it back rewound, for st.download_button."""
+    f = tempfile.TemporaryFile()
+    if fmt == "csv":
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        write(text)
+        text.flush()
+        text.detach()
+    else:
+        write(f)
+    f.seek(0)
+    return f
+
+
+def export_file(name, fmt, **filters):
+    return temp_export(lambda out: export_table(name, out, fmt, **filters), fmt)
+
+
+def export_widget(names, key):
+    """Filters and a download button; the file is only built when the button is clicked."""
+    import streamlit as st
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        name = st.selectbox("Table", names, key=f"{key}_table")
+    spec = EXPORTS[name]
+    with col2:
+        date_from = st.date_input("📅 From", value=None, key=f"{key}_date_from")
+    with col3:
+        date_to = st.date_input("📅 To", value=None, key=f"{key}_date_to")
+    with col4:
+        status = st.text_input("📌 Status", key=f"{key}_status", disabled=not spec["status_column"],
+                               placeholder=spec["status_column"] or "no status column")
+    with col5:
+        fmt = st.selectbox("Format", ["csv", "parquet"], key=f"{key}_format")
+    st.caption(f"Filters apply to `{spec['date_column']}`" +
+               (f" and `{spec['status_column']}`." if spec["status_column"] else "."))
+    filters = {"date_from": date_from, "date_to": date_to, "status": status.strip() or None}
+    st.download_button(
+        "⬇️ Download export", data=lambda: export_file(name, fmt, **filters),
+        file_name=f"{name}.{fmt}", mime="text/csv" if fmt == "csv" else "application/vnd.apache.parquet",
+        key=f"{key}_download", on_click="ignore")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a table to CSV or Parquet in bounded memory.")
+    parser.add_argument("table", choices=sorted(EXPORTS))
+    parser.add_argument("file", help="output path ending in .csv or .parquet")
+    parser.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+    parser.add_argument("--status")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per fetch / row group")
+    args = parser.parse_args()
+    if args.status and not EXPORTS[args.table]["status_column"]:
+        parser.error(f"{args.table} has no status column")
+    fmt = "parquet" if args.file.lower().endswith(".parquet") else "csv"
+    rows = export_table(args.table, args.file, fmt, date_from=args.date_from, date_to=args.date_to,
+                        status=args.status, chunk_size=args.chunk_size)
+    print(f"{rows} row(s) written to {args.file}")
@@ -0,0 +1,204 @@
+# federation.py - network-wide view over several collection centres' blood bank databases
+#
+# Usage:  python federation.py add "North Centre" /srv/north/blood_donation.db
+#         python federation.py remove "North Centre"
+#         python federation.py list
+#         python federation.py report          stock, expiring bags and pending requests across all sites
+#
+# The registry is a JSON file (FEDERATION_SITES, default sites.json) mapping site
+# name -> database path; without one, the network is just this site. Each site is
+# opened read-only through its own small connection pool and query cache. A network
+# read hands one task per site to a thread pool; SQLite releases the GIL while a
+# query runs, so the sites are read side by side and the whole read takes about as
+# long as the slowest site. That holds only while the time goes into SQLite: the
+# counting and the row limit are done in SQL, the site threads fetch plain rows, and
+# the frames are built once, after the merge, instead of per site under the GIL. A site that fails or runs past SITE_TIMEOUT is reported
+# as such and left out, instead of holding up the others.
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+import pandas as pd
+
+import blood_db
+import instrumentation
+from db_pool import ConnectionPool
+from query_cache import QueryCache
+
+REGISTRY = os.environ.get("FEDERATION_SITES", "sites.json")
+SITE_TIMEOUT = 10
+MAX_WORKERS = 16
+# available_stock, the dashboard summary the stock query reads, arrived in migration 2.
+MIN_SCHEMA_VERSION = 2
+
+# Sites are somebody else's database: never write, never change the journal mode.
+READ_ONLY_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA query_only = ON",
+)
+
+PENDING_SQL = """
+    SELECT blood_type, urgency, COUNT(*) AS requests, SUM(quantity_needed) AS units
+    FROM hospital_requests
+    WHERE status = 'pending'
+    GROUP BY blood_type, urgency
+"""
+
+# The page lists this many expiring bags; no site can contribute more than that to it.
+EXPIRING_LIMIT = 200
+
+# Counts per type come with the stock (DASHBOARD_STOCK_SQL's `expiring`).
+EXPIRING_SQL = blood_db.EXPIRING_SOON_SQL + f"    LIMIT {EXPIRING_LIMIT}\n"
+
+# query name -> (sql, its columns)
+SITE_QUERIES = {
+    "stock": (blood_db.DASHBOARD_STOCK_SQL, ["blood_type", "bags", "total_ml", "expiring"]),
+    "expiring": (EXPIRING_SQL, ["bag_id", "blood_type", "donation_date", "expiry_date", "days_left"]),
+    "pending": (PENDING_SQL, ["blood_type", "urgency", "requests", "units"]),
+}
+
+
+# ---- registry ----
+def load_registry(path=REGISTRY):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"This site": blood_db.DB_FILE}
+
+
+def save_registry(sites, path=REGISTRY):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(sites, f, indent=2)
+
+
+def add_site(name, db_path, path=REGISTRY):
+    sites = load_registry(path)
+    sites[name] = db_path
+    save_registry(sites, path)
+    return sites
+
+
+def remove_site(name, path=REGISTRY):
+    sites = load_registry(path)
+    sites.pop(name, None)
+    save_registry(sites, path)
+    return sites
+
+
+# ---- reading one site ----
+def read_only_connect(path, **kwargs):
+    return instrumentation.connect(Path(path).absolute().as_uri() + "?mode=ro", uri=True, **kwargs)
+
+
+class Site:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.pool = ConnectionPool(path, size=2, connect=read_only_connect, pragmas=READ_ONLY_PRAGMAS)
+        self.cache = QueryCache(max_entries=len(SITE_QUERIES) * 2)
+
+    def read(self):
+        """{query name: rows} for SITE_QUERIES, and the milliseconds it took."""
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < MIN_SCHEMA_VERSION:
+                raise RuntimeError(f"schema version {version}; open it once with Blood.py to migrate it")
+            rows = {name: self.cache.fetchall(conn, sql) for name, (sql, _) in SITE_QUERIES.items()}
+        return rows, (time.perf_counter() - started) * 1000
+
+
+_sites = {}
+_sites_lock = threading.Lock()
+_executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="federation")
+
+
+def get_site(name, path):
+    # Pools and caches outlive Streamlit reruns; re-registering a name under a new path replaces them.
+    with _sites_lock:
+        site = _sites.get(name)
+        if site is None or site.path != path:
+            site = _sites[name] = Site(name, path)
+        return site
+
+
+# ---- the network ----
+def read_network(sites=None, timeout=SITE_TIMEOUT):
+    """Read every site in parallel and merge the results.
+
+    Returns {"status": one row per site, "stock" / "expiring" / "pending": the site
+    frames stacked with a site column, "ms": wall-clock milliseconds for the lot}.
+    "expiring" holds each site's EXPIRING_LIMIT soonest bags; the counts are in "stock".
+    """
+    sites = load_registry() if sites is None else sites
+    started = time.perf_counter()
+    futures = {name: _executor.submit(get_site(name, path).read) for name, path in sites.items()}
+    wait(futures.values(), timeout=timeout)
+
+    status, merged = [], {name: [] for name in SITE_QUERIES}
+    for name, future in futures.items():
+        if not future.done():
+            status.append({"site": name, "status": f"timed out after {timeout}s", "ms": None})
+            continue
+        try:
+            rows, ms = future.result()
+        except Exception as e:
+            status.append({"site": name, "status": f"error: {e}", "ms": None})
+            continue
+        status.append({"site": name, "status": "ok", "ms": round(ms, 1)})
+        for query, site_rows in rows.items():
+            merged[query].extend((*row, name) for row in site_rows)
+
+    result = {"status": pd.DataFrame(status, columns=["site", "status", "ms"])}
+    for query, records in merged.items():
+        result[query] = pd.DataFrame.from_records(records, columns=SITE_QUERIES[query][1] + ["site"])
+    result["ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def by_type(df, value, sites):
+    """blood type x site table of `value`, with a network total column."""
+    table = (df.pivot_table(index="blood_type", columns="site", values=value, aggfunc="sum")
+             .reindex(index=blood_db.BLOOD_TYPES, columns=sites).fillna(0).astype(int)) if not df.empty else \
+        pd.DataFrame(0, index=blood_db.BLOOD_TYPES, columns=sites)
+    return table.assign(Network=table.sum(axis=1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage and read the network of blood bank databases.")
+    parser.add_argument("--registry", default=REGISTRY)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="register a site")
+    add.add_argument("name")
+    add.add_argument("path")
+    remove = commands.add_parser("remove", help="unregister a site")
+    remove.add_argument("name")
+    commands.add_parser("list", help="show the registered sites")
+    commands.add_parser("report", help="read every site and print the network summary")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        add_site(args.name, args.path, args.registry)
+    elif args.command == "remove":
+        remove_site(args.name, args.registry)
+    sites = load_registry(args.registry)
+    if args.command in ("add", "remove", "list"):
+        for name, path in sites.items():
+            print(f"{name:30} {path}")
+    else:
+        network = read_network(sites)
+        print(network["status"].to_string(index=False))
+        ok = [row.site for row in network["status"].itertuples() if row.status == "ok"]
+        print("\nAvailable bags\n" + by_type(network["stock"], "bags", ok).to_string())
+        print("\nPending units\n" + by_type(network["pending"], "units", ok).to_string())
+        status = network["status"]
+        print(f"\n{int(network['stock']['expiring'].sum()) if ok else 0} bag(s) expiring within 7 days; "
+              f"read in {network['ms']:.0f} ms (slowest site {status['ms'].max():.0f} ms, "
+              f"one after another {status['ms'].sum():.0f} ms)")
@@ -0,0 +1,217 @@
+# forecast.py - days of supply per blood type, precomputed nightly
+#
+# Usage:  python forecast.py                  snapshot today and recompute the forecast
+#         python forecast.py --every 3600     keep doing so whenever the forecast is from an earlier day
+#
+# Blood.py also runs start_background(), so a running app refreshes it after midnight.
+#
+# Each run re-derives the last HISTORY_DAYS of daily flows per blood type (bags
+# donated, units requested, bags expired) into inventory_snapshots and records
+# today's stock on hand. Donation and demand rates are exponentially weighted daily
+# means over that history. The stock on hand is then run forward HORIZON_DAYS,
+# first expiry first out, for all 8 types at once: each day the bags past their
+# expiry date are written off, demand takes the oldest bags first and the day's
+# donations top the stock up. The result lands in supply_forecast, so the
+# dashboard page reads 8 small rows.
+import argparse
+import json
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import blood_db
+from db_pool import write_transaction
+from donations import SHELF_LIFE_DAYS
+from inventory_index import utc_today
+
+HISTORY_DAYS = 56
+HALFLIFE_DAYS = 7
+HORIZON_DAYS = SHELF_LIFE_DAYS
+CHECK_INTERVAL = 3600
+
+DONATED_SQL = """
+    SELECT donation_date AS day, blood_type, COUNT(*) AS n
+    FROM blood_inventory WHERE donation_date BETWEEN ? AND ?
+    GROUP BY donation_date, blood_type
+"""
+REQUESTED_SQL = """
+    SELECT request_date AS day, blood_type, SUM(quantity_needed) AS n
+    FROM hospital_requests WHERE request_date BETWEEN ? AND ?
+    GROUP BY request_date, blood_type
+"""
+# A bag is lost the day after its expiry date, when the sweeper marks it.
+EXPIRED_SQL = """
+    SELECT date(expiry_date, '+1 day') AS day, blood_type, COUNT(*) AS n
+    FROM blood_inventory WHERE status = 'expired' AND expiry_date BETWEEN date(?, '-1 day') AND date(?, '-1 day')
+    GROUP BY expiry_date, blood_type
+"""
+STOCK_BY_EXPIRY_SQL = "SELECT blood_type, expiry_date, bags, total_ml FROM available_stock"
+
+UPSERT_SNAPSHOT_SQL = """
+    INSERT INTO inventory_snapshots (snapshot_date, blood_type, donated, requested, expired, available_bags, available_ml)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (snapshot_date, blood_type) DO UPDATE SET
+        donated = excluded.donated, requested = excluded.requested, expired = excluded.expired,
+        available_bags = COALESCE(excluded.available_bags, available_bags),
+        available_ml = COALESCE(excluded.available_ml, available_ml)
+"""
+LAST_FORECAST_SQL = "SELECT MAX(computed_at) FROM supply_forecast"
+
+
+def daily_matrix(rows, days):
+    """Rows of (day, blood_type, n) as a days x BLOOD_TYPES frame, zero where absent."""
+    df = pd.DataFrame(rows, columns=["day", "blood_type", "n"])
+    return (df.pivot_table(index="day", columns="blood_type", values="n", aggfunc="sum")
+            .reindex(index=days, columns=blood_db.BLOOD_TYPES).fillna(0).astype(float))
+
+
+def take_snapshot(conn, today):
+    """Rewrite the flows of the history window and today's stock.
+
+    Returns ({"donated" | "requested" | "expired": days x types frame}, stock by expiry date).
+    """
+    start = today - timedelta(days=HISTORY_DAYS)
+    days = [(start + timedelta(days=i)).isoformat() for i in range(HISTORY_DAYS + 1)]
+    window = (days[0], days[-1])
+    flows = {name: daily_matrix(conn.execute(sql, window).fetchall(), days)
+             for name, sql in [("donated", DONATED_SQL), ("requested", REQUESTED_SQL), ("expired", EXPIRED_SQL)]}
+    stock = pd.DataFrame(conn.execute(STOCK_BY_EXPIRY_SQL).fetchall(),
+                         columns=["blood_type", "expiry_date", "bags", "total_ml"]).astype({"bags": "int64", "total_ml": "int64"})
+
+    rows = pd.concat({name: frame.stack() for name, frame in flows.items()}, axis=1)
+    current = (stock.groupby("blood_type")[["bags", "total_ml"]].sum().reindex(blood_db.BLOOD_TYPES).fillna(0)
+               .set_axis(pd.MultiIndex.from_product([[days[-1]], blood_db.BLOOD_TYPES], names=rows.index.names)))
+    rows = rows.join(current).reset_index()
+    # Plain Python values, None for the days without a stock count: numpy scalars would bind as BLOBs.
+    conn.executemany(UPSERT_SNAPSHOT_SQL, rows.astype(object).where(rows.notna(), None).to_numpy().tolist())
+    return flows, stock
+
+
+def daily_rates(flows):
+    """EWM daily (donations, demand) per type over the finished days (today is still running)."""
+    return [flows[name].iloc[:-1].ewm(halflife=HALFLIFE_DAYS).mean().iloc[-1].to_numpy()
+            for name in ("donated", "requested")]
+
+
+def project(stock, today, donations, demand, horizon=HORIZON_DAYS):
+    """Run the stock forward `horizon` days, first expiry first out, all types at once.
+
+    Returns (end-of-day stock per type and day, bags written off, first day with unmet
+    demand or NaN). Old stock is tracked as the size of its consumed-or-expired prefix
+    in expiry order; new donations outlive the horizon, so they are a plain balance.
+    Bags already past expiry but not yet swept count as written off, never as stock.
+    """
+    types = blood_db.BLOOD_TYPES
+    offsets = (pd.to_datetime(stock["expiry_date"]) - pd.Timestamp(today)).dt.days.to_numpy()
+    rows = pd.Categorical(stock["blood_type"], categories=types).codes
+    # expiring[t, d]: bags of type t whose last usable day is d (d = horizon: later than that).
+    expiring = np.zeros((len(types), horizon + 1))
+    bags = stock["bags"].to_numpy()
+    expired = (rows >= 0) & (offsets < 0)
+    keep = (rows >= 0) & (offsets >= 0)
+    np.add.at(expiring, (rows[keep], np.minimum(offsets[keep], horizon)), bags[keep])
+    gone_by = np.concatenate([np.zeros((len(types), 1)), np.cumsum(expiring, axis=1)[:, :-1]], axis=1)
+    on_hand = expiring.sum(axis=1)
+
+    removed = np.zeros(len(types))      # prefix of old stock consumed or written off
+    fresh = np.zeros(len(types))        # bags donated from today on, not yet used
+    wasted = np.bincount(rows[expired], weights=bags[expired], minlength=len(types)).astype(float)
+    stockout = np.full(len(types), np.nan)
+    levels = np.empty((len(types), horizon))
+    for day in range(horizon):
+        written_off = np.maximum(gone_by[:, day] - removed, 0)
+        wasted += written_off
+        removed += written_off
+        from_old = np.minimum(demand, on_hand - removed)
+        removed += from_old
+        fresh += donations
+        from_new = np.minimum(demand - from_old, fresh)
+        fresh -= from_new
+        short = demand - from_old - from_new
+        first = np.isnan(stockout) & (short > 1e-9)
+        # Fractional day: the share of the day's demand that could still be met.
+        stockout[first] = day + (from_old + from_new)[first] / demand[first]
+        levels[:, day] = on_hand - removed + fresh
+    return levels, wasted, stockout
+
+
+def refresh(conn, today=None):
+    """Snapshot, forecast and store, in one write transaction; returns the forecast frame."""
+    # UTC, like date('now') in the queries and is_stale().
+    today = today or utc_today()
+
+    def work(conn):
+        flows, stock = take_snapshot(conn, today)
+        donations, demand = daily_rates(flows)
+        levels, wasted, stockout = project(stock, today, donations, demand)
+        on_hand = stock.groupby("blood_type")["bags"].sum().reindex(blood_db.BLOOD_TYPES).fillna(0).to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            days_of_supply = np.where(demand > 0, on_hand / demand, np.nan)
+        forecast = pd.DataFrame({
+            "blood_type": blood_db.BLOOD_TYPES, "available_bags": on_hand.astype(int),
+            "daily_demand": demand.round(2), "daily_donations": donations.round(2),
+            "days_of_supply": days_of_supply.round(1), "stockout_day": stockout.round(1),
+            "expiring_unused": wasted.round(1),
+            "projection": [json.dumps(row) for row in levels.round(1).tolist()],
+        })
+        conn.execute("DELETE FROM supply_forecast")
+        records = forecast.astype(object).where(forecast.notna(), None).to_dict("records")
+        conn.executemany("""
+            INSERT INTO supply_forecast (blood_type, available_bags, daily_demand, daily_donations,
+                                         days_of_supply, stockout_day, expiring_unused, projection)
+            VALUES (:blood_type, :available_bags, :daily_demand, :daily_donations,
+                    :days_of_supply, :stockout_day, :expiring_unused, :projection)
+        """, records)
+        return forecast
+
+    return write_transaction(conn, work)
+
+
+def is_stale(conn):
+    last = conn.execute(LAST_FORECAST_SQL).fetchone()[0]
+    # computed_at is UTC, like every datetime('now') in the schema.
+    return last is None or last[:10] < utc_today().isoformat()
+
+
+def run_forever(interval):
+    while True:
+        try:
+            with blood_db.connection() as conn:
+                if is_stale(conn):
+                    refresh(conn)
+        except Exception as e:
+            print(f"supply forecast failed: {e}", flush=True)
+        time.sleep(interval)
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def start_background(interval=CHECK_INTERVAL):
+    """Start the nightly forecast thread once per process (Streamlit reruns call this every time)."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_forever, args=(interval,), name="supply-forecast", daemon=True)
+            _thread.start()
+    return _thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot inventory flows and forecast days of supply per blood type.")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="check on this interval, refresh once a day")
+    args = parser.parse_args()
+    while True:
+        with blood_db.connection() as conn:
+            if not args.every or is_stale(conn):
+                started = time.perf_counter()
+                forecast = refresh(conn)
+                print(forecast.drop(columns="projection").to_string(index=False))
+                print(f"done in {time.perf_counter() - started:.2f}s", flush=True)
+        if not args.every:
+            break
+        time.sleep(args.every)
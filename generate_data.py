@@ -0,0 +1,177 @@
+# generate_data.py - fill blood_donation.db and hospital.db with realistic synthetic data
+#
+# Usage:  python generate_data.py --scale 0.01              1% of the full volumes below
+#         python generate_data.py --donors 200000 --bags 1000000 --appointments 0 --bills 0
+#         python generate_data.py --blood-db /tmp/b.db --hms-db /tmp/h.db --seed 7
+#
+# Full volumes (--scale 1): 1M donors, 5M bags, 200k requests, 500k patients,
+# 300 doctors, 2M appointments and 5M bills. Blood types follow population
+# frequencies; dates spread over the last year(s), weighted towards recent ones.
+# Rows go in through the normal schema and triggers, so the summary tables and
+# the donor search index come out consistent. Existing rows are kept.
+import argparse
+import sqlite3
+import time
+from datetime import date
+
+import numpy as np
+
+import blood_db
+import hms_db
+from migrations import migrate
+
+FULL_SIZES = {"donors": 1_000_000, "bags": 5_000_000, "requests": 200_000, "patients": 500_000,
+              "doctors": 300, "appointments": 2_000_000, "bills": 5_000_000}
+BATCH = 100_000
+
+FIRST_NAMES = ["Muhammad", "Ahmed", "Ali", "Fatima", "Ayesha", "Zainab", "Hassan", "Hussain", "Omar", "Sara",
+               "John", "Mary", "James", "Linda", "David", "Maria", "Wei", "Mei", "Ravi", "Priya", "Noah", "Emma"]
+LAST_NAMES = ["Khan", "Ahmed", "Malik", "Butt", "Sheikh", "Qureshi", "Smith", "Johnson", "Brown", "Garcia",
+              "Chen", "Wang", "Patel", "Singh", "Ali", "Hussain", "Iqbal", "Raza", "Williams", "Lopez"]
+HOSPITALS = ["City General", "Mercy Hospital", "St. Mary's", "University Hospital", "Children's Hospital",
+             "Northside Clinic", "Central Trauma Center", "Lakeside Medical"]
+CITIES = ["Lahore", "Karachi", "Islamabad", "Multan", "Peshawar", "Faisalabad", "Quetta"]
+SPECIALTIES = ["Cardiology", "Neurology", "Orthopedics", "Pediatrics", "Oncology", "General Surgery",
+               "Dermatology", "Gynecology", "Emergency Medicine", "Internal Medicine"]
+
+
+def days_ago(rng, n, span, recent_bias=1.0):
+    """n ISO dates within the last `span` days; recent_bias > 1 crowds them towards today."""
+    offsets = np.floor(span * rng.random(n) ** recent_bias).astype("int64")
+    return np.datetime64(date.today()) - offsets.astype("timedelta64[D]")
+
+
+def iso(dates):
+    return np.datetime_as_string(dates, unit="D")
+
+
+def names(rng, n):
+    return np.char.add(np.char.add(rng.choice(FIRST_NAMES, n), " "), rng.choice(LAST_NAMES, n))
+
+
+def insert(conn, sql, columns):
+    """executemany() over parallel numpy columns, BATCH rows per transaction."""
+    total = len(columns[0])
+    for start in range(0, total, BATCH):
+        rows = zip(*(column[start:start + BATCH].tolist() for column in columns))
+        conn.execute("BEGIN")
+        conn.executemany(sql, rows)
+        conn.commit()
+    return total
+
+
+def open_db(path, migrations):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn, migrations)
+    # A throwaway bulk load: durability does not matter, speed does.
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+    return conn
+
+
+def generate_blood(path, sizes, rng):
+    conn = open_db(path, blood_db.MIGRATIONS)
+    types = np.array(list(blood_db.BLOOD_TYPE_FREQUENCIES))
+    weights = np.array(list(blood_db.BLOOD_TYPE_FREQUENCIES.values()))
+    weights = weights / weights.sum()
+    first_donor = conn.execute("SELECT COALESCE(MAX(donor_id), 0) + 1 FROM donors").fetchone()[0]
+
+    n = sizes["donors"]
+    donor_types = rng.choice(types, n, p=weights)
+    # Phones derived from the row number, so no two generated donors share an identity key.
+    phones = np.char.add("03", np.char.mod("%09d", first_donor + np.arange(n)))
+    insert(conn, "INSERT INTO donors (name, blood_type, phone, last_donation_date) VALUES (?, ?, ?, ?)",
+           [names(rng, n), donor_types, phones, iso(days_ago(rng, n, 730, 1.5))])
+
+    n = sizes["bags"] if sizes["donors"] else 0
+    donors = rng.integers(0, sizes["donors"], n) if n else np.zeros(0, dtype="int64")
+    donated = days_ago(rng, n, 365)
+    expiry = donated + np.timedelta64(42, "D")
+    today = np.datetime64(date.today())
+    fresh = expiry >= today
+    status = np.where(fresh, np.where(rng.random(n) < 0.7, "available", "used"),
+                      np.where(rng.random(n) < 0.6, "used", "expired"))
+    volume = np.where(rng.random(n) < 0.8, 450, rng.integers(30, 55, n) * 10)
+    insert(conn, "INSERT INTO blood_inventory (blood_type, donor_id, donation_date, expiry_date, volume_ml, status) "
+                 "VALUES (?, ?, ?, ?, ?, ?)",
+           [donor_types[donors], donors + first_donor, iso(donated), iso(expiry), volume, status])
+
+    n = sizes["requests"]
+    requested = days_ago(rng, n, 365)
+    pending = (requested >= today - np.timedelta64(14, "D")) & (rng.random(n) < 0.5)
+    insert(conn, "INSERT INTO hospital_requests (hospital_name, blood_type, quantity_needed, request_date, urgency, "
+                 "status) VALUES (?, ?, ?, ?, ?, ?)",
+           [rng.choice(HOSPITALS, n), rng.choice(types, n, p=weights), rng.integers(1, 7, n), iso(requested),
+            rng.choice(["routine", "urgent", "emergency"], n, p=[0.7, 0.2, 0.1]),
+            np.where(pending, "pending", "fulfilled")])
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+
+def generate_hms(path, sizes, rng):
+    conn = open_db(path, hms_db.MIGRATIONS)
+    first_patient = conn.execute("SELECT COALESCE(MAX(pat_id), 0) + 1 FROM Patients").fetchone()[0]
+    first_doctor = conn.execute("SELECT COALESCE(MAX(doc_id), 0) + 1 FROM Doctors").fetchone()[0]
+
+    n = sizes["doctors"]
+    insert(conn, "INSERT INTO Doctors (name, specialty, dept_id, phone, email) VALUES (?, ?, ?, ?, ?)",
+           [np.char.add("Dr. ", names(rng, n)), rng.choice(SPECIALTIES, n), rng.integers(1, 11, n),
+            np.char.add("042", np.char.mod("%07d", np.arange(n))),
+            np.char.add(np.char.add("doctor", np.arange(first_doctor, first_doctor + n).astype(str)), "@hms.example")])
+
+    n = sizes["patients"]
+    ids = np.arange(first_patient, first_patient + n).astype(str)
+    insert(conn, "INSERT INTO Patients (name, age, gender, phone, address, email, registration_date) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?)",
+           [names(rng, n), rng.integers(0, 95, n), rng.choice(["Male", "Female", "Other"], n, p=[0.49, 0.49, 0.02]),
+            np.char.add("03", np.char.mod("%09d", np.arange(first_patient, first_patient + n))), rng.choice(CITIES, n), np.char.add(ids, "@mail.example"),
+            iso(days_ago(rng, n, 5 * 365, 0.8))])
+
+    patients = max(sizes["patients"], 1)
+    doctors = max(sizes["doctors"], 1)
+    n = sizes["appointments"]
+    # A few doctors see far more patients than the rest.
+    doctor = np.minimum(rng.zipf(1.6, n), doctors) - 1
+    insert(conn, "INSERT INTO Appointments (pat_id, doc_id, app_date, app_time, status) VALUES (?, ?, ?, ?, ?)",
+           [rng.integers(0, patients, n) + first_patient, doctor + first_doctor, iso(days_ago(rng, n, 3 * 365)),
+            np.char.add(np.char.mod("%02d", rng.integers(8, 18, n)), ":00"),
+            rng.choice(["Scheduled", "Completed", "Cancelled"], n, p=[0.2, 0.7, 0.1])])
+
+    n = sizes["bills"]
+    insert(conn, "INSERT INTO Billings (pat_id, amount, details, payment_status, bill_date) VALUES (?, ?, ?, ?, ?)",
+           [rng.integers(0, patients, n) + first_patient, np.round(rng.lognormal(4.5, 1.0, n), 2),
+            rng.choice(["Consultation", "Lab tests", "Pharmacy", "Surgery", "Radiology"], n),
+            rng.choice(["Paid", "Pending"], n, p=[0.8, 0.2]), iso(days_ago(rng, n, 3 * 365))])
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+
+def generate(sizes, blood_path=blood_db.DB_FILE, hms_path=hms_db.DB_FILE, seed=0):
+    """Add sizes[...] rows to both databases; returns the seconds taken."""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    generate_blood(blood_path, sizes, rng)
+    generate_hms(hms_path, sizes, rng)
+    return time.perf_counter() - started
+
+
+def scaled_sizes(scale=1.0, **overrides):
+    sizes = {name: max(int(count * scale), 1 if name == "doctors" else 0) for name, count in FULL_SIZES.items()}
+    sizes.update({name: count for name, count in overrides.items() if count is not None})
+    return sizes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic blood bank and hospital data.")
+    parser.add_argument("--scale", type=float, default=1.0, help="fraction of the full volumes")
+    for name, count in FULL_SIZES.items():
+        parser.add_argument(f"--{name}", type=int, help=f"rows to add (full scale: {count:,})")
+    parser.add_argument("--blood-db", default=blood_db.DB_FILE)
+    parser.add_argument("--hms-db", default=hms_db.DB_FILE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sizes = scaled_sizes(args.scale, **{name: getattr(args, name) for name in FULL_SIZES})
+    print(sizes, flush=True)
+    seconds = generate(sizes, args.blood_db, args.hms_db, args.seed)
+    print(f"done in {seconds:.1f}s")
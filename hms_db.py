@@ -0,0 +1,114 @@
+# hms_db.py - schema, migrations and page queries for the hospital app (HMS.py)
+import sqlite3
+import threading
+
+import instrumentation
+from db_pool import ConnectionPool
+from migrations import migrate
+from query_cache import QueryCache, track_table_versions
+
+DB_FILE = "hospital.db"
+
+# --------------------- Migrations ---------------------
+BASE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS Patients (pat_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, age INTEGER, gender TEXT, phone TEXT, address TEXT, email TEXT, registration_date TEXT DEFAULT (date('now')));
+    CREATE TABLE IF NOT EXISTS Doctors (doc_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, specialty TEXT, dept_id INTEGER, phone TEXT, email TEXT);
+    CREATE TABLE IF NOT EXISTS Appointments (app_id INTEGER PRIMARY KEY AUTOINCREMENT, pat_id INTEGER, doc_id INTEGER, app_date TEXT, app_time TEXT, status TEXT DEFAULT 'Scheduled');
+    CREATE TABLE IF NOT EXISTS MedicalRecords (record_id INTEGER PRIMARY KEY AUTOINCREMENT, pat_id INTEGER, doc_id INTEGER, diagnosis TEXT, treatment TEXT, prescription TEXT);
+    CREATE TABLE IF NOT EXISTS Billings (bill_id INTEGER PRIMARY KEY AUTOINCREMENT, pat_id INTEGER, amount REAL, details TEXT, payment_status TEXT DEFAULT 'Pending', bill_date TEXT DEFAULT (date('now')));
+'''
+
+# Billings carries amount so the monthly revenue chart is answered from the index alone.
+HOT_PATH_INDEXES = '''
+    CREATE INDEX IF NOT EXISTS idx_appointments_doc_date ON Appointments(doc_id, app_date);
+    CREATE INDEX IF NOT EXISTS idx_appointments_status ON Appointments(status);
+    CREATE INDEX IF NOT EXISTS idx_billings_date ON Billings(bill_date, amount);
+    CREATE INDEX IF NOT EXISTS idx_patients_registration ON Patients(registration_date);
+'''
+
+# Append only: a database at version N has had exactly MIGRATIONS[:N] applied.
+MIGRATIONS = [
+    BASE_SCHEMA,
+    HOT_PATH_INDEXES,
+    track_table_versions,
+]
+
+# Bounded by staff numbers; scanning it is fine.
+SMALL_TABLES = {"Doctors"}
+
+
+def init_db():
+    conn = sqlite3.connect(DB_FILE)
+    migrate(conn, MIGRATIONS)
+    conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Migrations run once per process, the first time anything needs the database.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            init_db()
+            _pool = ConnectionPool(DB_FILE, connect=instrumentation.connect)
+    return _pool
+
+
+# HMS.py's read helpers go through this; CRUD writes invalidate it via table_versions.
+cache = QueryCache()
+
+
+def connection():
+    return get_pool().connection()
+
+
+# --------------------- Page Queries ---------------------
+# How the list pages load these columns (arrow_tables.read_arrow); the rest keep SQLite's types.
+DISPLAY_TYPES = {
+    "gender": "category", "specialty": "category", "status": "category", "payment_status": "category",
+    "registration_date": "date", "app_date": "date", "bill_date": "date",
+}
+
+HOME_TOTALS_SQL = '''
+    SELECT (SELECT COUNT(*) FROM Patients) AS patients,
+           (SELECT COUNT(*) FROM Doctors) AS doctors,
+           (SELECT COUNT(*) FROM Appointments) AS appointments,
+           (SELECT COALESCE(SUM(amount), 0) FROM Billings) AS revenue
+'''
+
+PATIENT_GROWTH_SQL = '''
+    SELECT strftime('%Y-%m', registration_date) AS registration_date, COUNT(*) AS "New Patients"
+    FROM Patients
+    GROUP BY strftime('%Y-%m', registration_date)
+    ORDER BY 1
+'''
+
+APPOINTMENT_STATUS_SQL = "SELECT status, COUNT(*) AS count FROM Appointments GROUP BY status"
+
+BUSY_DOCTORS_SQL = '''
+    SELECT Doctors.name, busy.count
+    FROM (SELECT doc_id, COUNT(*) AS count FROM Appointments
+          GROUP BY doc_id ORDER BY count DESC LIMIT 5) AS busy
+    JOIN Doctors ON Doctors.doc_id = busy.doc_id
+    ORDER BY busy.count DESC
+'''
+
+MONTHLY_REVENUE_SQL = '''
+    SELECT strftime('%Y-%m', bill_date) AS bill_date, SUM(amount) AS amount
+    FROM Billings
+    GROUP BY strftime('%Y-%m', bill_date)
+    ORDER BY 1
+'''
+
+# Aggregating queries behind the Home page (see check_query_plans.py). The CRUD
+# pages list whole tables, so a scan there is the result itself, not a missed index.
+PAGE_QUERIES = {
+    "Home totals": (HOME_TOTALS_SQL, ()),
+    "Home patients growth": (PATIENT_GROWTH_SQL, ()),
+    "Home appointments by status": (APPOINTMENT_STATUS_SQL, ()),
+    "Home busy doctors": (BUSY_DOCTORS_SQL, ()),
+    "Home monthly revenue": (MONTHLY_REVENUE_SQL, ()),
+}
@@ -0,0 +1,272 @@
+# instrumentation.py - where a page's time goes: SQL, sections, slow-query log, admin panel
+#
+# The connection pools build InstrumentedConnection objects, so every conn.execute()
+# and every pd.read_sql() on a pooled connection is timed, with its row count. A
+# Streamlit run is bracketed by begin_run() / end_run(); section() and @timed add
+# named wall-clock spans inside it. Queries slower than SLOW_QUERY_MS go to
+# SLOW_QUERY_LOG as JSON lines when their run ends. st.rerun() and st.stop() end a
+# run before it reaches end_run(), so begin_run() closes such leftovers: the one on
+# its own thread and any whose thread has finished. The admin panel (sidebar, opened with ?admin=1 or
+# ADMIN_PANEL=1) shows the current run.
+#
+# Environment:  SQL_INSTRUMENTATION=off   plain sqlite3 connections, nothing recorded
+#               SLOW_QUERY_MS=200         slow-query threshold in milliseconds
+#               SLOW_QUERY_LOG=slow_queries.log
+#
+# Recording is a perf_counter() pair and an append per statement, cheap enough to
+# leave on in production; query lists are only rendered when the panel is open.
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+ENABLED = os.environ.get("SQL_INSTRUMENTATION", "on").lower() != "off"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "slow_queries.log")
+MAX_QUERIES_PER_RUN = 500
+
+_local = threading.local()
+_log_lock = threading.Lock()
+recent_runs = deque(maxlen=50)
+_open_runs = {}  # thread ident -> (thread, run) begun and not yet closed
+_open_lock = threading.Lock()
+
+
+class QueryRecord:
+    __slots__ = ("db", "sql", "section", "ms", "rows", "logged")
+
+    def __init__(self, db, sql, section, ms):
+        self.db, self.sql, self.section, self.ms, self.rows, self.logged = db, sql, section, ms, None, False
+
+
+class Run:
+    def __init__(self, app, page):
+        self.app, self.page = app, page
+        self.started = time.perf_counter()
+        self.queries = []
+        self.sections = []  # (name, ms), in completion order
+        self.stack = []
+        self.total_ms = None  # stays None for a run cut short by st.rerun() / st.stop()
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+def one_line(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def log_slow(record, run=None):
+    if record.logged or record.ms < SLOW_QUERY_MS:
+        return
+    record.logged = True
+    entry = {"time": datetime.now().isoformat(timespec="seconds"), "db": record.db, "ms": round(record.ms, 2),
+             "rows": record.rows, "sql": one_line(record.sql)}
+    if run is not None:
+        entry.update(app=run.app, page=run.page, section=record.section)
+    with _log_lock, open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times execute() and the fetch calls that follow it, and counts fetched rows."""
+
+    _record = None
+
+    def _start(self, sql, started):
+        ms = (time.perf_counter() - started) * 1000
+        run = current_run()
+        record = QueryRecord(os.path.basename(self.connection.path), sql,
+                             run.stack[-1] if run and run.stack else None, ms)
+        self._record = record
+        if run is not None:
+            if len(run.queries) < MAX_QUERIES_PER_RUN:
+                run.queries.append(record)
+        else:
+            log_slow(record)
+
+    def _fetched(self, rows, started):
+        record = self._record
+        if record is not None:
+            record.ms += (time.perf_counter() - started) * 1000
+            record.rows = (record.rows or 0) + rows
+            if current_run() is None:
+                log_slow(record)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._start(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._start(sql, started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(row is not None, started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), started)
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute() builds a plain cursor internally, so route it through cursor().
+    path = ""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path, **kwargs):
+    """sqlite3.connect() with instrumentation, unless SQL_INSTRUMENTATION=off."""
+    if not ENABLED:
+        return sqlite3.connect(path, **kwargs)
+    conn = sqlite3.connect(path, factory=InstrumentedConnection, **kwargs)
+    conn.path = path
+    return conn
+
+
+# ---- runs and sections ----
+def close_run(run):
+    """Log a run's slow queries and keep it for the admin panel."""
+    for record in run.queries:
+        log_slow(record, run)
+    recent_runs.append(run)
+
+
+def begin_run(app, page):
+    thread = threading.current_thread()
+    leftovers = []
+    with _open_lock:
+        for ident, (owner, run) in list(_open_runs.items()):
+            if ident == thread.ident or not owner.is_alive():
+                del _open_runs[ident]
+                leftovers.append(run)
+        run = _local.run = Run(app, page)
+        _open_runs[thread.ident] = (thread, run)
+    for leftover in leftovers:
+        close_run(leftover)
+    return run
+
+
+def end_run():
+    """Close the current run, log its slow queries and keep it for the admin panel."""
+    run = current_run()
+    if run is None:
+        return None
+    run.total_ms = (time.perf_counter() - run.started) * 1000
+    with _open_lock:
+        _open_runs.pop(threading.get_ident(), None)
+    close_run(run)
+    _local.run = None
+    return run
+
+
+@contextmanager
+def section(name):
+    run = current_run()
+    if run is None:
+        yield
+        return
+    run.stack.append(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.stack.pop()
+        run.sections.append((name, (time.perf_counter() - started) * 1000))
+
+
+def timed(function):
+    """Decorator: time every call as a section named after the function."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with section(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def summary(run):
+    sql_ms = sum(q.ms for q in run.queries)
+    sections = {}
+    for name, ms in run.sections:
+        calls, total = sections.get(name, (0, 0.0))
+        sections[name] = (calls + 1, total + ms)
+    section_sql = {}
+    for q in run.queries:
+        section_sql[q.section] = section_sql.get(q.section, 0.0) + q.ms
+    return sql_ms, [{"section": name, "calls": calls, "ms": round(ms, 2), "sql_ms": round(section_sql.get(name, 0), 2)}
+                    for name, (calls, ms) in sections.items()]
+
+
+def slow_log_tail(n=20):
+    try:
+        with open(SLOW_QUERY_LOG, encoding="utf-8") as f:
+            lines = deque(f, maxlen=n)
+    except FileNotFoundError:
+        return []
+    return [json.loads(line) for line in reversed(lines)]
+
+
+def admin_panel():
+    """Sidebar panel for the run in progress; call it last, just before end_run()."""
+    import pandas as pd
+    import streamlit as st
+
+    run = current_run()
+    if run is None or not (os.environ.get("ADMIN_PANEL") == "1" or st.query_params.get("admin") == "1"):
+        return
+    with st.sidebar:
+        st.markdown("---")
+        if not st.toggle("🛠️ Instrumentation", key="instrumentation_panel"):
+            return
+        if not ENABLED:
+            st.caption("SQL_INSTRUMENTATION=off — nothing is being recorded.")
+            return
+        elapsed = (time.perf_counter() - run.started) * 1000
+        sql_ms, sections = summary(run)
+        st.metric("This run", f"{elapsed:.0f} ms", f"SQL {sql_ms:.0f} ms · other {elapsed - sql_ms:.0f} ms",
+                  delta_color="off")
+        if sections:
+            st.caption("Sections")
+            st.dataframe(pd.DataFrame(sections), hide_index=True, use_container_width=True)
+        st.caption(f"Queries ({len(run.queries)})")
+        st.dataframe(pd.DataFrame([{"ms": round(q.ms, 2), "rows": q.rows, "db": q.db, "section": q.section,
+                                    "sql": one_line(q.sql)[:200]} for q in run.queries]),
+                     hide_index=True, use_container_width=True)
+        st.caption(f"Slow queries ≥ {SLOW_QUERY_MS:g} ms ({SLOW_QUERY_LOG})")
+        slow = slow_log_tail()
+        if slow:
+            st.dataframe(pd.DataFrame(slow), hide_index=True, use_container_width=True)
+        else:
+            st.caption("None logged yet.")
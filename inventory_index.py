@@ -0,0 +1,281 @@
+# inventory_index.py - available bags per blood type as compact in-memory expiry heaps
+#
+# Usage:  python inventory_index.py          load the index, print counts, memory and timings
+#
+# Each available bag is one 64-bit key, expiry day << 44 | bag_id << 12 | volume_ml
+# (blood_db.bag_key computes the same in SQL), in an array('q') min-heap for its
+# blood type. Comparing keys orders bags by expiry date, then bag_id, so the heap
+# top is the bag to issue next and taking it is an O(log n) pop. Bags, millilitres
+# and bags per expiry day are kept per type alongside, so counts are O(1). That is
+# 8 bytes a bag, plus the array's spare capacity.
+#
+# sync(conn) applies the inventory_changes rows written since the last one it saw;
+# the triggers log every writer (forms, API, bulk import, allocation, sweeper), so
+# nothing has to call into the index. A bag that leaves the stock is not searched
+# for in its heap: its key goes on the type's `removed` heap, and the two are popped
+# together when it reaches the top. Bags handed out by take() are held aside until
+# the write that issues them comes back through sync(), or restore() returns them.
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+import blood_db
+
+DAY_SHIFT = 44
+ID_SHIFT = 12
+ID_MASK = (1 << (DAY_SHIFT - ID_SHIFT)) - 1
+VOLUME_MASK = (1 << ID_SHIFT) - 1
+EPOCH = date(1970, 1, 1)
+
+# idx_inventory_status_expiry reads only the available bags, in (expiry_date, bag_id)
+# order, which is key order: appended per type, each array is sorted, and so a heap.
+LOAD_SQL = f"""
+    SELECT blood_type, {blood_db.bag_key("blood_inventory")}
+    FROM blood_inventory
+    WHERE status = 'available'
+    ORDER BY expiry_date, bag_id
+"""
+LAST_CHANGE_SQL = "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'inventory_changes'), 0)"
+FIRST_CHANGE_SQL = """
+    SELECT COALESCE(MIN(change_id), (SELECT seq FROM sqlite_sequence WHERE name = 'inventory_changes') + 1, 1)
+    FROM inventory_changes
+"""
+CHANGES_SQL = """
+    SELECT change_id, removed_type, removed_key, added_type, added_key
+    FROM inventory_changes WHERE change_id > ? ORDER BY change_id
+"""
+
+
+def pack(day, bag_id, volume_ml):
+    return day << DAY_SHIFT | bag_id << ID_SHIFT | volume_ml
+
+
+def unpack(key):
+    """(expiry day, bag_id, volume_ml)"""
+    return key >> DAY_SHIFT, key >> ID_SHIFT & ID_MASK, key & VOLUME_MASK
+
+
+def day_number(d):
+    return (d - EPOCH).days
+
+
+def to_date(day):
+    return EPOCH + timedelta(days=day)
+
+
+def utc_today():
+    # date('now') in SQLite, which the schema's expiry checks use.
+    return datetime.now(timezone.utc).date()
+
+
+# ---- binary heap on an array('q') ----
+def heap_push(heap, key):
+    heap.append(key)
+    i = len(heap) - 1
+    while i:
+        parent = (i - 1) >> 1
+        if heap[parent] <= key:
+            break
+        heap[i] = heap[parent]
+        i = parent
+    heap[i] = key
+
+
+def heap_pop(heap):
+    last = heap.pop()
+    if not heap:
+        return last
+    top, n, i = heap[0], len(heap), 0
+    while (child := 2 * i + 1) < n:
+        if child + 1 < n and heap[child + 1] < heap[child]:
+            child += 1
+        if heap[child] >= last:
+            break
+        heap[i] = heap[child]
+        i = child
+    heap[i] = last
+    return top
+
+
+class ExpiryHeap:
+    """The available bags of one blood type."""
+
+    __slots__ = ("keys", "removed", "bags", "ml", "by_day")
+
+    def __init__(self, keys=None):
+        self.keys = keys if keys is not None else array("q")
+        self.removed = array("q")
+        self.by_day = Counter(key >> DAY_SHIFT for key in self.keys)
+        self.bags = len(self.keys)
+        self.ml = sum(key & VOLUME_MASK for key in self.keys)
+
+    def add(self, key):
+        heap_push(self.keys, key)
+        self.bags += 1
+        self.ml += key & VOLUME_MASK
+        self.by_day[key >> DAY_SHIFT] += 1
+
+    def count_removed(self, key):
+        self.bags -= 1
+        self.ml -= key & VOLUME_MASK
+        day = key >> DAY_SHIFT
+        self.by_day[day] -= 1
+        if not self.by_day[day]:
+            del self.by_day[day]
+
+    def _settle(self):
+        # Keys are unique, so a removed key below the top is not in the heap (any more),
+        # and one equal to the top is the top.
+        keys, removed = self.keys, self.removed
+        while removed and (not keys or removed[0] <= keys[0]):
+            if keys and removed[0] == keys[0]:
+                heap_pop(keys)
+            heap_pop(removed)
+
+    def peek(self):
+        self._settle()
+        return self.keys[0] if self.keys else None
+
+    def pop(self):
+        self._settle()
+        return heap_pop(self.keys)
+
+    def expiring_by(self, day):
+        """Bags whose expiry day is `day` or earlier."""
+        return sum(n for d, n in self.by_day.items() if d <= day)
+
+    def memory(self):
+        return self.keys.buffer_info()[1] * self.keys.itemsize + self.removed.buffer_info()[1] * self.removed.itemsize
+
+
+class InventoryIndex:
+    """Process-wide index of the available bags, one ExpiryHeap per blood type."""
+
+    def __init__(self):
+        self.heaps = {}
+        self.last = None   # newest inventory_changes row applied
+        self._taken = {}   # key -> blood type, handed out by take() and not yet seen leaving
+        self._lock = threading.RLock()
+
+    def load(self, conn):
+        """Read every available bag, as of one snapshot, and start following changes from there."""
+        with self._lock:
+            own = not conn.in_transaction
+            if own:
+                conn.execute("BEGIN")
+            try:
+                last = conn.execute(LAST_CHANGE_SQL).fetchone()[0]
+                keys = {t: array("q") for t in blood_db.BLOOD_TYPES}
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                for blood_type, key in cursor.execute(LOAD_SQL):
+                    if blood_type not in keys:
+                        keys[blood_type] = array("q")
+                    keys[blood_type].append(key)
+            finally:
+                if own:
+                    conn.rollback()
+            self.heaps = {t: ExpiryHeap(k) for t, k in keys.items()}
+            self.last, self._taken = last, {}
+
+    def _heap(self, blood_type):
+        heap = self.heaps.get(blood_type)
+        if heap is None:
+            heap = self.heaps[blood_type] = ExpiryHeap()
+        return heap
+
+    def sync(self, conn):
+        """Apply the changes committed since the last sync; returns how many (or -1 after a reload)."""
+        with self._lock:
+            if self.last is None or conn.execute(FIRST_CHANGE_SQL).fetchone()[0] > self.last + 1:
+                # First use, or entries this index never saw were pruned: start over.
+                self.load(conn)
+                return -1
+            changes = conn.execute(CHANGES_SQL, (self.last,)).fetchall()
+            for _, removed_type, removed_key, added_type, added_key in changes:
+                if removed_key is not None:
+                    heap = self._heap(removed_type)
+                    heap.count_removed(removed_key)
+                    if self._taken.pop(removed_key, None) is None:
+                        heap_push(heap.removed, removed_key)
+                if added_key is not None:
+                    self._heap(added_type).add(added_key)
+            if changes:
+                self.last = changes[-1][0]
+            return len(changes)
+
+    def take(self, blood_types, limit=1, min_day=None):
+        """Hand out up to `limit` bags, earliest expiry first across `blood_types`.
+
+        Bags that expire before `min_day` (expired, not yet swept) are left in place.
+        Returns (blood_type, key) pairs; issue them and the next sync() settles them,
+        or give them back with restore().
+        """
+        with self._lock:
+            taken, skipped = [], []
+            heaps = [(t, self._heap(t)) for t in blood_types]
+            while len(taken) < limit:
+                if len(heaps) == 1:
+                    best_type, heap = heaps[0]
+                    best = heap.peek()
+                else:
+                    best_type, heap, best = None, None, None
+                    for blood_type, candidate in heaps:
+                        key = candidate.peek()
+                        if key is not None and (best is None or key < best):
+                            best_type, heap, best = blood_type, candidate, key
+                if best is None:
+                    break
+                heap_pop(heap.keys)
+                if min_day is not None and best >> DAY_SHIFT < min_day:
+                    skipped.append((heap, best))
+                    continue
+                self._taken[best] = best_type
+                taken.append((best_type, best))
+            for heap, key in skipped:
+                heap_push(heap.keys, key)
+            return taken
+
+    def restore(self, taken):
+        """Put back bags from take() that were not issued after all."""
+        with self._lock:
+            for blood_type, key in taken:
+                if self._taken.pop(key, None) is not None:
+                    heap_push(self._heap(blood_type).keys, key)
+
+    def summary(self, expiring_day):
+        """{blood type: (bags, total ml, bags expiring by `expiring_day`)}"""
+        with self._lock:
+            return {t: (heap.bags, heap.ml, heap.expiring_by(expiring_day)) for t, heap in self.heaps.items()}
+
+    def memory(self):
+        """Bytes held by the heaps' arrays."""
+        with self._lock:
+            return sum(heap.memory() for heap in self.heaps.values())
+
+
+# Shared by the API and the allocation runs of this process.
+inventory = InventoryIndex()
+
+
+if __name__ == "__main__":
+    with blood_db.connection() as conn:
+        started = time.perf_counter()
+        inventory.sync(conn)
+        loaded = time.perf_counter() - started
+        bags = sum(heap.bags for heap in inventory.heaps.values())
+        horizon = day_number(utc_today()) + 7
+        for blood_type, (n, ml, expiring) in inventory.summary(horizon).items():
+            print(f"{blood_type:4} {n:>10,} bags {ml:>14,} ml {expiring:>8,} expiring within 7 days")
+        print(f"{bags:,} bags loaded in {loaded:.2f}s, {inventory.memory() / max(bags, 1):.1f} bytes per bag")
+        started = time.perf_counter()
+        for _ in range(1000):
+            inventory.sync(conn)
+        print(f"sync with nothing new: {(time.perf_counter() - started) / 1000 * 1e6:.1f} µs")
+        started = time.perf_counter()
+        taken = inventory.take(blood_db.BLOOD_TYPES, 1000, day_number(utc_today()))
+        took = time.perf_counter() - started
+        inventory.restore(taken)
+        print(f"take earliest of any type: {took * 1e6 / max(len(taken), 1):.1f} µs per bag")
@@ -0,0 +1,157 @@
+# live.py - live mode for the Urgent Requests and Expiring Soon pages: poll for deltas only
+#
+# change_log (see blood_db.CHANGE_LOG) gets a row from triggers whenever a request
+# enters, changes inside or leaves the urgent list, and whenever a bag inside the
+# 7-day expiry window changes. A live table remembers the last change_id it applied;
+# each tick reads the change_log entries after it, re-reads only those rows by
+# primary key and patches the frame kept in session_state. Bags entering the window
+# because the calendar moved on are one index range on expiry_date. So a tick costs
+# in proportion to what changed, not to the size of the backlog.
+#
+# Environment:  LIVE_REFRESH_SECONDS=5   default polling interval
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import blood_db
+
+REFRESH_SECONDS = float(os.environ.get("LIVE_REFRESH_SECONDS", 5))
+EXPIRY_WINDOW_DAYS = 7
+
+# Same rows as blood_db.URGENT_REQUESTS_SQL / EXPIRING_SOON_SQL, plus the key, minus the clock.
+VIEWS = {
+    "urgent": {
+        "table": "hospital_requests",
+        "key": "request_id",
+        "sql": """
+            SELECT request_id, hospital_name, blood_type, quantity_needed, urgency, request_date
+            FROM hospital_requests
+            WHERE status = 'pending' AND urgency IN ('urgent', 'emergency')
+        """,
+    },
+    "expiring": {
+        "table": "blood_inventory",
+        "key": "bag_id",
+        "sql": """
+            SELECT bag_id, blood_type, donation_date, expiry_date
+            FROM blood_inventory
+            WHERE status = 'available' AND expiry_date <= :edge
+        """,
+    },
+}
+
+# The newest change_id handed out so far, even if the sweeper has pruned it since.
+LAST_CHANGE_SQL = "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)"
+# The oldest one still kept; a gap before it means entries were pruned unseen.
+FIRST_CHANGE_SQL = """
+    SELECT COALESCE(MIN(change_id), (SELECT seq FROM sqlite_sequence WHERE name = 'change_log') + 1, 1)
+    FROM change_log
+"""
+CHANGES_SQL = "SELECT change_id, row_id FROM change_log WHERE change_id > ? AND table_name = ? ORDER BY change_id"
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def window_edge(now):
+    """Last expiry date inside the window, as SQLite's date('now', '+7 days') would give it."""
+    return (now.date() + timedelta(days=EXPIRY_WINDOW_DAYS)).isoformat()
+
+
+def read(conn, sql, params):
+    # A plain cursor: tuples into a frame, without the pool's row factory.
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    try:
+        cursor.execute(sql, params)
+        return pd.DataFrame(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+    finally:
+        cursor.close()
+
+
+def load(conn, view, now):
+    """Full read; the change position is taken first, so nothing committed meanwhile is missed."""
+    spec = VIEWS[view]
+    last = conn.execute(LAST_CHANGE_SQL).fetchone()[0]
+    edge = window_edge(now)
+    return {"df": read(conn, spec["sql"], {"edge": edge}), "last": last, "edge": edge}
+
+
+def refresh(conn, view, state, now):
+    """Apply the changes since state["last"] to state["df"]; returns the number of rows re-read."""
+    spec = VIEWS[view]
+    if conn.execute(FIRST_CHANGE_SQL).fetchone()[0] > state["last"] + 1:
+        # Entries this table never saw were pruned (the page sat idle for a day): start over.
+        state.update(load(conn, view, now))
+        return len(state["df"])
+    changes = conn.execute(CHANGES_SQL, (state["last"], spec["table"])).fetchall()
+
+    edge = window_edge(now)
+    patches, reread = [], 0
+    if changes:
+        state["last"] = changes[-1][0]
+        ids = sorted({row[1] for row in changes})
+        rows = read(conn, spec["sql"] + f" AND {spec['key']} IN (SELECT value FROM json_each(:ids))",
+                    {"edge": edge, "ids": json.dumps(ids)})
+        state["df"] = state["df"][~state["df"][spec["key"]].isin(ids)]
+        patches.append(rows)
+        reread += len(ids)
+    if view == "expiring" and edge > state["edge"]:
+        # Bags the calendar brought into the window; the edge only ever moves forward.
+        rows = read(conn, spec["sql"] + " AND expiry_date > :previous", {"edge": edge, "previous": state["edge"]})
+        patches.append(rows)
+        reread += len(rows)
+    state["edge"] = edge
+    if patches:
+        state["df"] = pd.concat([state["df"], *patches], ignore_index=True).drop_duplicates(spec["key"], keep="last")
+    return reread
+
+
+def presented(view, df, now):
+    """The on-screen frame: page order, and for bags the days left as of `now`."""
+    if view == "urgent":
+        rank = (df["urgency"] != "emergency").astype(int)
+        return df.assign(_rank=rank).sort_values(["_rank", "request_id"]).drop(columns=["_rank", "request_id"])
+    df = df.sort_values(["expiry_date", "bag_id"])
+    # ROUND(julianday(expiry_date) - julianday('now')), as in blood_db.EXPIRING_SOON_SQL
+    days = (pd.to_datetime(df["expiry_date"]) - pd.Timestamp(now)) / pd.Timedelta(days=1)
+    return df.assign(days_left=np.sign(days) * np.floor(np.abs(days) + 0.5) + 0.0)
+
+
+def live_table(view, empty_message, interval=None, annotate=None):
+    """Render `view` in an st.fragment that re-polls every `interval` seconds.
+
+    annotate(conn, df), if given, runs on each tick before the table is drawn; it may
+    draw above the table and returns the frame to show, e.g. with flag columns added.
+    """
+    state_key = f"live_{view}"
+
+    @st.fragment(run_every=interval or REFRESH_SECONDS)
+    def show():
+        now = utc_now()
+        with blood_db.connection() as conn:
+            if state_key not in st.session_state:
+                st.session_state[state_key] = load(conn, view, now)
+                reread = len(st.session_state[state_key]["df"])
+            else:
+                reread = refresh(conn, view, st.session_state[state_key], now)
+            df = st.session_state[state_key]["df"]
+            if annotate is not None:
+                df = annotate(conn, df)
+        if df.empty:
+            st.success(empty_message)
+        else:
+            st.dataframe(presented(view, df, now), use_container_width=True, hide_index=True)
+        st.caption(f"🔴 Live — checked {now:%H:%M:%S} UTC, {reread} row(s) re-read.")
+
+    show()
+
+
+def stop(view):
+    """Forget the live state, so the next live session starts from a full read."""
+    st.session_state.pop(f"live_{view}", None)
@@ -0,0 +1,54 @@
+# migrations.py - numbered, run-once schema migrations for the SQLite apps
+#
+# Each app keeps an ordered list of migrations (see blood_db.MIGRATIONS and
+# hms_db.MIGRATIONS). Migration N is applied once, in its own transaction,
+# and PRAGMA user_version records the last one applied.
+import sqlite3
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def split_script(script):
+    """Split an SQL script into statements (trigger bodies stay in one piece)."""
+    statements, buf = [], ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip())
+            buf = ""
+    if buf.strip():
+        statements.append(buf.strip())
+    return statements
+
+
+def run_script(conn, script):
+    # Unlike executescript(), this does not commit, so it can run inside a migration.
+    for statement in split_script(script):
+        conn.execute(statement)
+
+
+def migrate(conn, migrations):
+    """Bring the database up to version len(migrations).
+
+    A migration is either an SQL script or a callable taking the connection.
+    The write lock is taken before the version is re-checked, so two processes
+    starting at once never apply the same step twice.
+    """
+    for version, step in enumerate(migrations, start=1):
+        if schema_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < version:
+                if callable(step):
+                    step(conn)
+                else:
+                    run_script(conn, step)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
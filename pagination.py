@@ -0,0 +1,74 @@
+# pagination.py - paged, server-side filtered st.dataframe views (see blood_db.LISTINGS)
+from datetime import date
+
+import streamlit as st
+
+import blood_db
+from instrumentation import section
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def paginated_table(conn, listing, empty_message):
+    """Render filters, one page of `listing` and Previous / Next buttons.
+
+    Only the rows on screen are read and sent to the browser, as an Arrow table
+    (arrow_tables.py). The position is a stack of page start keys in session_state,
+    reset when a filter changes.
+    """
+    spec = blood_db.LISTINGS[listing]
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        blood_type = st.selectbox("🩸 Blood Type", ["All"] + blood_db.BLOOD_TYPES, key=f"{listing}_blood_type")
+    with col2:
+        status = st.selectbox("📌 Status", ["All"] + spec["statuses"], key=f"{listing}_status",
+                              disabled=not spec["statuses"])
+    with col3:
+        date_from = st.date_input("📅 From", value=None, key=f"{listing}_date_from")
+    with col4:
+        date_to = st.date_input("📅 To", value=None, key=f"{listing}_date_to")
+    with col5:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{listing}_page_size")
+
+    filters = {
+        "blood_type": None if blood_type == "All" else blood_type,
+        "status": None if status == "All" else status,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    signature = (tuple(filters.values()), page_size)
+    if st.session_state.get(f"{listing}_signature") != signature:
+        st.session_state[f"{listing}_signature"] = signature
+        st.session_state[f"{listing}_starts"] = [None]
+    starts = st.session_state[f"{listing}_starts"]
+
+    sql, params = blood_db.listing_query(listing, after=starts[-1], limit=page_size, **filters)
+    with section(f"{listing}: query"):
+        table = blood_db.cache.read_arrow(conn, sql, params, blood_db.DISPLAY_TYPES)
+    has_next = table.num_rows > page_size
+    table = table.slice(0, page_size)
+
+    if table.num_rows == 0:
+        if len(starts) == 1 and not any(filters.values()):
+            st.info(empty_message)
+        else:
+            st.info("No rows match these filters.")
+        return
+
+    with section(f"{listing}: render"):
+        st.dataframe(table.select(spec["columns"]), use_container_width=True)
+
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        if st.button("⬅️ Previous", key=f"{listing}_prev", disabled=len(starts) == 1):
+            starts.pop()
+            st.rerun()
+    with page_col:
+        st.markdown(f"<p style='text-align: center;'>Page {len(starts)}</p>", unsafe_allow_html=True)
+    with next_col:
+        if st.button("Next ➡️", key=f"{listing}_next", disabled=not has_next):
+            # Dates go back to the ISO text they are stored (and compared) as.
+            last = table.select(spec["sort"]).slice(table.num_rows - 1).to_pylist()[0]
+            starts.append(tuple(v.isoformat() if isinstance(v, date) else v for v in last.values()))
+            st.rerun()
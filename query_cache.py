@@ -0,0 +1,199 @@
+# query_cache.py - per-process cache of read-query results, invalidated by table versions
+#
+# track_table_versions() is a migration step: every table gets a row in table_versions
+# and INSERT / UPDATE / DELETE triggers that bump it. The triggers fire for every writer
+# (the apps' CRUD helpers, the summary-table triggers, bulk imports, the API, the expiry
+# sweeper), so nothing has to remember to invalidate anything.
+#
+# A cached result carries the versions of the tables its SQL names and is served while
+# they are unchanged; when a table's version moves, exactly the entries that read it are
+# dropped. Checking costs one PRAGMA data_version per call - table_versions itself is
+# only re-read when another connection has committed or this one has written.
+#
+# Environment:  QUERY_CACHE_MB=64          memory cap, by DataFrame.memory_usage(deep=True) / Table.nbytes
+#               QUERY_CACHE_ENTRIES=256    entry cap; least recently used go first
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+
+from arrow_tables import read_arrow
+
+MAX_BYTES = int(float(os.environ.get("QUERY_CACHE_MB", 64)) * 2**20)
+MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_ENTRIES", 256))
+
+VERSIONS_SQL = "SELECT name, version FROM table_versions"
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+TABLE_VERSIONS = """
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID
+"""
+
+
+def track_table_versions(conn):
+    """Migration step: version rows and bump triggers for every ordinary table.
+
+    Idempotent; append it to MIGRATIONS again after a migration that adds tables.
+    Virtual tables and their shadow tables are skipped (see QueryCache's `derived`).
+    """
+    conn.execute(TABLE_VERSIONS)
+    virtual = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'")]
+    tables = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND name != 'table_versions' AND sql NOT LIKE 'CREATE VIRTUAL TABLE%'")
+        if not any(name.startswith(v + "_") for v in virtual)]
+    for table in tables:
+        conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS "{table}_version_{event.lower()}" AFTER {event} ON "{table}"
+                BEGIN UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END
+            """)
+
+
+def result_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pa.Table):
+        return value.nbytes
+    return sys.getsizeof(value) + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in value)
+
+
+class QueryCache:
+    """LRU cache of read results for one database, shared by all of its pooled connections.
+
+    `derived` maps tables the triggers cannot track (FTS indexes) to the tables they
+    are kept in sync with. SQL naming a view or any other untracked table, and reads
+    inside an open transaction, bypass the cache.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, derived=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.derived = {name.lower(): [t.lower() for t in tables] for name, tables in (derived or {}).items()}
+        self.hits = self.misses = self.bypassed = 0
+        self._entries = OrderedDict()  # key -> (tables, stamp, value, size)
+        self._bytes = 0
+        self._versions = {}            # table -> newest version seen
+        self._checked = {}             # id(conn) -> (conn, data_version, total_changes)
+        self._names = None             # every table and view in the schema
+        self._dependencies = {}        # sql -> tuple of tables, or None when uncacheable
+        self._lock = threading.Lock()
+
+    # ---- versions ----
+    def _refresh(self, conn):
+        state = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        checked = self._checked.get(id(conn))
+        if checked is not None and checked[0] is conn and checked[1:] == state:
+            return
+        try:
+            rows = conn.execute(VERSIONS_SQL).fetchall()
+        except sqlite3.OperationalError:
+            # A database from before track_table_versions, opened read-only: nothing is cacheable.
+            rows = []
+        with self._lock:
+            changed = set()
+            for name, version in rows:
+                name = name.lower()
+                if version > self._versions.get(name, -1):
+                    self._versions[name] = version
+                    changed.add(name)
+            if changed and self._entries:
+                self._invalidate(changed)
+            # The connection is kept referenced, so its id cannot be reused by another one.
+            self._checked[id(conn)] = (conn, *state)
+
+    def _invalidate(self, tables):
+        for key, (deps, *_rest, size) in list(self._entries.items()):
+            if not tables.isdisjoint(deps):
+                del self._entries[key]
+                self._bytes -= size
+
+    def invalidate(self, *tables):
+        """Drop the entries reading any of `tables` now rather than at the next check."""
+        with self._lock:
+            self._invalidate({t.lower() for t in tables})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _tables(self, conn, sql):
+        deps = self._dependencies.get(sql, False)
+        if deps is not False:
+            return deps
+        if self._names is None:
+            self._names = {name.lower() for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        mentioned = {word.lower() for word in IDENTIFIER.findall(sql)} & self._names
+        deps = set()
+        for name in mentioned:
+            deps.update(self.derived.get(name, [name]))
+        deps = tuple(sorted(deps)) if deps and deps <= self._versions.keys() else None
+        self._dependencies[sql] = deps
+        return deps
+
+    # ---- lookups ----
+    def _get(self, conn, kind, sql, params, load):
+        if conn.in_transaction:
+            # Uncommitted versions could be rolled back and later reused for other data.
+            self.bypassed += 1
+            return load()
+        self._refresh(conn)
+        deps = self._tables(conn, sql)
+        if deps is None:
+            self.bypassed += 1
+            return load()
+        key = (kind, sql, tuple(sorted(params.items())) if isinstance(params, dict) else tuple(params))
+        if "'now'" in sql:
+            # Results that depend on the clock as well as the data expire on the hour.
+            key += (time.strftime("%Y-%m-%d %H"),)
+        stamp = tuple(self._versions[t] for t in deps)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+        value = load()
+        size = result_size(value)
+        with self._lock:
+            self.misses += 1
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            if size <= self.max_bytes // 4:
+                self._entries[key] = (deps, stamp, value, size)
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    self._bytes -= self._entries.popitem(last=False)[1][3]
+        return value
+
+    def read_sql(self, conn, sql, params=()):
+        """pd.read_sql through the cache. The frame is a copy-on-write view: mutate freely."""
+        df = self._get(conn, "frame", sql, params, lambda: pd.read_sql(sql, conn, params=params))
+        return df.copy(deep=False)
+
+    def read_arrow(self, conn, sql, params=(), types=None):
+        """arrow_tables.read_arrow through the cache. Arrow tables are immutable, so no copy."""
+        kind = ("arrow", tuple(sorted((types or {}).items())))
+        return self._get(conn, kind, sql, params, lambda: read_arrow(conn, sql, params, types))
+
+    def fetchall(self, conn, sql, params=()):
+        return list(self._get(conn, "rows", sql, params, lambda: conn.execute(sql, params).fetchall()))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+                    "misses": self.misses, "bypassed": self.bypassed}
@@ -0,0 +1,80 @@
+# recall.py - eligible-donor recall lists: who to call back when a blood type runs short
+#
+# Usage:  python recall.py O-                          eligible donors per type, and the first rows
+#         python recall.py AB+ --output recall.csv     the whole list, written in chunks (.csv / .parquet)
+#
+# A donor is eligible for a short type when their blood type can be given to it
+# (blood_compatibility, parsed from blood_types.can_donate_to) and their last donation
+# was at least DEFERRAL_DAYS ago. Every donor this app records has a donation date;
+# donors without one are left out. idx_donors_type_last_donation turns each compatible
+# type into one index range, so counts come from the index alone and the on-screen
+# list reads PAGE_ROWS rows per type, whatever the number of donors.
+import argparse
+from datetime import date, timedelta
+
+import pandas as pd
+
+import blood_db
+from compatibility import get_compatibility
+from export import CHUNK_SIZE, table_columns, temp_export, write_rows
+
+# Whole-blood donors wait 8 weeks between donations.
+DEFERRAL_DAYS = 56
+PAGE_ROWS = 100
+
+
+def cutoff(today=None):
+    """The latest last-donation date that makes a donor eligible today."""
+    return ((today or date.today()) - timedelta(days=DEFERRAL_DAYS)).isoformat()
+
+
+def recall_counts(conn, recipient_type, today=None):
+    """{donor blood type: eligible donors} for every type `recipient_type` can receive."""
+    rows = blood_db.cache.fetchall(conn, blood_db.RECALL_COUNTS_SQL,
+                                   {"cutoff": cutoff(today), "recipient_type": recipient_type})
+    counts = dict.fromkeys(get_compatibility().donors_for(recipient_type), 0)
+    counts.update({row[0]: row[1] for row in rows})
+    return counts
+
+
+def recall_list(conn, recipient_type, limit=PAGE_ROWS, today=None):
+    """The `limit` most recently eligible donors, across all compatible types."""
+    frames = [blood_db.cache.read_sql(conn, blood_db.RECALL_TOP_SQL,
+                                      {"blood_type": blood_type, "cutoff": cutoff(today), "limit": limit})
+              for blood_type in get_compatibility().donors_for(recipient_type)]
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values(["last_donation_date", "donor_id"], ascending=False).head(limit).reset_index(drop=True)
+
+
+def export_recall(recipient_type, out, fmt, chunk_size=CHUNK_SIZE, today=None):
+    """Write the whole recall list to `out` (a path or a file object); returns the row count."""
+    with blood_db.connection() as conn:
+        types = dict(table_columns(conn, "donors"))
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(blood_db.RECALL_SQL, {"cutoff": cutoff(today), "recipient_type": recipient_type})
+        columns = [d[0] for d in cursor.description]
+        try:
+            return write_rows(cursor, columns, [types[c] for c in columns], out, fmt, chunk_size)
+        finally:
+            cursor.close()
+
+
+def recall_file(recipient_type, fmt):
+    return temp_export(lambda out: export_recall(recipient_type, out, fmt), fmt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List donors eligible to give blood for a short blood type.")
+    parser.add_argument("blood_type", choices=blood_db.BLOOD_TYPES, help="the type that is running short")
+    parser.add_argument("--output", help="write the whole list here (.csv or .parquet)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per fetch / row group")
+    args = parser.parse_args()
+    if args.output:
+        fmt = "parquet" if args.output.endswith(".parquet") else "csv"
+        print(f"{export_recall(args.blood_type, args.output, fmt, args.chunk_size)} donor(s) written to {args.output}")
+    else:
+        with blood_db.connection() as conn:
+            for blood_type, donors in recall_counts(conn, args.blood_type).items():
+                print(f"{blood_type:4} {donors:>10,}")
+            print(recall_list(conn, args.blood_type, limit=20).to_string(index=False))
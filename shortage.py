@@ -0,0 +1,157 @@
+# shortage.py - can the stock on hand cover the pending requests? Deficits per blood type
+#
+# Usage:  python shortage.py        print demand vs compatible stock, the deficits and the requests at risk
+#
+# Demand is pending_demand (units still owed per blood type and urgency) and supply
+# is available_stock (bags not yet expired per type); triggers keep both current as
+# donations, requests and allocations are written, so a check reads a few dozen
+# summary rows and never the requests or bags themselves.
+#
+# Bags are matched to demand as a max flow over the compatibility graph, one urgency
+# at a time (emergency, urgent, routine), the order allocation.py serves them in. A
+# later tier may move an earlier tier's bags to another compatible type to free the
+# one it needs, but never takes them. What stays unmatched is short: no allocation
+# of today's stock can cover it. Where types compete for the same substitutes, the
+# most constrained recipient types (O- first) are matched first, so a deficit lands
+# on the types with the most alternatives. Within a type and urgency the allocator
+# serves the oldest requests first, so the newest ones covering the deficit are the
+# requests at risk.
+import time
+from collections import deque
+
+import pandas as pd
+
+import blood_db
+from allocation import substitution_order
+from compatibility import get_compatibility
+from instrumentation import timed
+
+URGENCIES = ["emergency", "urgent", "routine"]
+# The Urgent Requests page lists, and flags, these.
+FLAGGED = ("emergency", "urgent")
+
+
+def augmenting_path(recipient, orders, left, flow, users):
+    """Shortest way to find `recipient` one more bag: [(donor, recipient), ...] edges to
+    gain a unit, alternating with edges to give one up, ending at a donor with bags left."""
+    parent = {recipient: None}
+    queue = deque([recipient])
+    while queue:
+        current = queue.popleft()
+        for donor in orders[current]:
+            if left[donor] > 0:
+                path, node, via = [], current, donor
+                while True:
+                    path.append((via, node))
+                    if parent[node] is None:
+                        return path[::-1]
+                    node, via = parent[node]
+                    path.append((via, None))
+            # Another recipient holding bags of this donor type could switch to a different one.
+            for other in users[donor]:
+                if other not in parent and flow[donor, other] > 0:
+                    parent[other] = (current, donor)
+                    queue.append(other)
+    return None
+
+
+def match(demand, supply, compat):
+    """Serve demand from supply, urgency by urgency.
+
+    `demand` maps (urgency, recipient type) -> units, `supply` donor type -> bags.
+    Returns (urgency, recipient type) -> units served.
+    """
+    types = compat.types
+    orders = {t: substitution_order(compat, t) for t in types}
+    users = {d: compat.recipients_for(d) for d in types}
+    left = {t: max(supply.get(t, 0), 0) for t in types}
+    flow = {(d, r): 0 for d in types for r in types}
+    served = {}
+    # Fewest compatible donor types first.
+    by_constraint = sorted(types, key=lambda t: (bin(compat.receive_mask[t]).count("1"), compat.index[t]))
+    for urgency in URGENCIES:
+        for recipient in by_constraint:
+            need = demand.get((urgency, recipient), 0)
+            got = 0
+            while got < need:
+                path = augmenting_path(recipient, orders, left, flow, users)
+                if path is None:
+                    break
+                # Edges alternate: gain (donor, recipient), give up (donor, holder), gain, ..., last donor pays.
+                gains, losses = path[0::2], path[1::2]
+                holders = [gains[i + 1][1] for i in range(len(losses))]
+                amount = min([need - got, left[gains[-1][0]]] +
+                             [flow[donor, holder] for (donor, _), holder in zip(losses, holders)])
+                for donor, taker in gains:
+                    flow[donor, taker] += amount
+                for (donor, _), holder in zip(losses, holders):
+                    flow[donor, holder] -= amount
+                left[gains[-1][0]] -= amount
+                got += amount
+            if need:
+                served[urgency, recipient] = got
+    return served
+
+
+def requests_at_risk(conn, short):
+    """Ids of the FLAGGED requests that make up each deficit, newest first per type."""
+    ids = set()
+    for (urgency, blood_type), units in short.items():
+        if urgency not in FLAGGED:
+            continue
+        for request_id, outstanding in blood_db.cache.fetchall(conn, blood_db.REQUESTS_AT_RISK_SQL,
+                                                               {"blood_type": blood_type, "urgency": urgency}):
+            if outstanding <= 0:
+                continue
+            ids.add(request_id)
+            units -= outstanding
+            if units <= 0:
+                break
+    return ids
+
+
+@timed
+def detect(conn):
+    """Check pending demand against compatible stock.
+
+    Returns {"by_type": one row per blood type with stock, compatible stock, units
+    pending and units short per urgency; "short": {(urgency, blood type): units};
+    "at_risk": ids of the urgent/emergency requests that would go unfilled}.
+    """
+    compat = get_compatibility()
+    demand = {}
+    for blood_type, urgency, _, units in blood_db.cache.fetchall(conn, blood_db.PENDING_DEMAND_SQL):
+        if units > 0:
+            demand[urgency, blood_type] = units
+    supply = {row[0]: row[1] for row in blood_db.cache.fetchall(conn, blood_db.USABLE_STOCK_SQL)}
+    served = match(demand, supply, compat)
+    short = {key: units - served.get(key, 0) for key, units in demand.items() if units > served.get(key, 0)}
+
+    columns = {
+        "blood_type": compat.types,
+        "bags": [supply.get(t, 0) for t in compat.types],
+        "compatible_bags": compat.compatible_supply(compat.types, supply),
+    }
+    columns.update({f"{u}_units": [demand.get((u, t), 0) for t in compat.types] for u in URGENCIES})
+    columns.update({f"{u}_short": [short.get((u, t), 0) for t in compat.types] for u in URGENCIES})
+    by_type = pd.DataFrame(columns)
+    return {"by_type": by_type, "short": short, "at_risk": requests_at_risk(conn, short)}
+
+
+if __name__ == "__main__":
+    with blood_db.connection() as conn:
+        started = time.perf_counter()
+        report = detect(conn)
+        first = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(100):
+            detect(conn)
+        again = (time.perf_counter() - started) / 100
+    print(report["by_type"].to_string(index=False))
+    if report["short"]:
+        for (urgency, blood_type), units in sorted(report["short"].items(), key=lambda kv: URGENCIES.index(kv[0][0])):
+            print(f"short {units} unit(s) of {blood_type} for {urgency} requests")
+        print(f"{len(report['at_risk'])} urgent/emergency request(s) at risk")
+    else:
+        print("stock on hand covers every pending request")
+    print(f"checked in {first * 1000:.2f} ms, {again * 1000:.2f} ms when cached")
@@ -0,0 +1,75 @@
+# sweeper.py - marks available bags past their expiry date as 'expired'
+#
+# Usage:  python sweeper.py               sweep once and print how many bags expired
+#         python sweeper.py --every 3600  keep sweeping every hour
+#
+# Blood.py also runs start_background() so a running app sweeps on its own.
+# Every run is recorded in expiry_sweeps, including runs that found nothing.
+import argparse
+import threading
+import time
+
+import blood_db
+
+SWEEP_INTERVAL = 3600
+
+# idx_inventory_status_expiry makes this a range scan over the expired bags only;
+# the available_stock triggers drop their rows from the dashboard summary.
+SWEEP_SQL = "UPDATE blood_inventory SET status = 'expired' WHERE status = 'available' AND expiry_date < date('now')"
+
+LAST_SWEEP_SQL = "SELECT swept_at, bags FROM expiry_sweeps ORDER BY sweep_id DESC LIMIT 1"
+
+
+def sweep(conn):
+    """Expire overdue bags in one UPDATE and log the run; returns the number of bags."""
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        bags = conn.execute(SWEEP_SQL).rowcount
+        # Live pages and the inventory index only ever look a few seconds back; keep a day of changes.
+        conn.execute(blood_db.PRUNE_CHANGE_LOG_SQL)
+        conn.execute(blood_db.PRUNE_INVENTORY_CHANGES_SQL)
+        conn.execute("INSERT INTO expiry_sweeps (bags, seconds) VALUES (?, ?)",
+                     (bags, round(time.perf_counter() - started, 3)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return bags
+
+
+def run_forever(interval):
+    while True:
+        try:
+            with blood_db.connection() as conn:
+                sweep(conn)
+        except Exception as e:
+            # A locked database or a bad run must not kill the thread; try again next time.
+            print(f"expiry sweep failed: {e}", flush=True)
+        time.sleep(interval)
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def start_background(interval=SWEEP_INTERVAL):
+    """Start the sweeper thread once per process (Streamlit reruns call this every time)."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_forever, args=(interval,), name="expiry-sweeper", daemon=True)
+            _thread.start()
+    return _thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mark available blood bags past their expiry date as expired.")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="repeat on this interval")
+    args = parser.parse_args()
+    while True:
+        with blood_db.connection() as conn:
+            print(f"{sweep(conn)} bag(s) expired", flush=True)
+        if not args.every:
+            break
+        time.sleep(args.every)
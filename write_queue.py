@@ -0,0 +1,123 @@
+# write_queue.py - group commit: one writer thread commits queued writes in shared transactions
+#
+# The Add Donation and Add Hospital Request forms and the API's POSTs hand their
+# write to intake.submit(function, *args) instead of committing it themselves.
+# One writer thread takes the first queued item and everything queued behind it
+# (up to MAX_BATCH), then runs them all in one BEGIN IMMEDIATE transaction, each
+# item function(conn, *args) inside its own SAVEPOINT so a bad one fails alone.
+# Each caller's Future resolves once the transaction holding its item has committed.
+# Whatever arrives during that commit is the next batch, so batches grow with the
+# load by themselves: a lone form is committed at once, a blood drive with many
+# tablets submitting together costs one write lock and one fsync per batch rather
+# than per form, and submitters wait in memory instead of contending for SQLite's
+# lock. The writer has its own connection with synchronous = FULL: a confirmation
+# means the batch is on disk. See benchmark_intake.py.
+#
+# Environment:  WRITE_QUEUE_DELAY_MS=0     extra time a batch waits for more items (e.g. 50 on slow disks)
+#               WRITE_QUEUE_BATCH=500      most items per transaction
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import blood_db
+import instrumentation
+from db_pool import PRAGMAS, write_transaction
+
+MAX_DELAY = float(os.environ.get("WRITE_QUEUE_DELAY_MS", 0)) / 1000
+MAX_BATCH = int(os.environ.get("WRITE_QUEUE_BATCH", 500))
+
+
+def apply_items(conn, items):
+    """Run (function, args) items in the caller's transaction; returns one (ok, result) per item."""
+    outcomes = []
+    for i, (function, args) in enumerate(items):
+        conn.execute(f"SAVEPOINT item_{i}")
+        try:
+            outcomes.append((True, function(conn, *args)))
+            conn.execute(f"RELEASE item_{i}")
+        except Exception as e:
+            conn.execute(f"ROLLBACK TO item_{i}")
+            conn.execute(f"RELEASE item_{i}")
+            outcomes.append((False, e))
+    return outcomes
+
+
+def connect_writer():
+    """The writer's own connection to the blood bank database: pool PRAGMAs, but durable commits."""
+    blood_db.get_pool()  # migrations run first
+    conn = instrumentation.connect(blood_db.DB_FILE)
+    for pragma in PRAGMAS + ("PRAGMA synchronous = FULL",):
+        conn.execute(pragma)
+    return conn
+
+
+class WriteQueue:
+    """Writes submitted from any thread, committed in batches by one writer thread.
+
+    `connect` opens the writer's connection; it is called from the writer thread.
+    """
+
+    def __init__(self, connect, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = self.items = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def submit(self, function, *args):
+        """Queue function(conn, *args); the Future gets its result once the batch commits."""
+        self.start()
+        future = Future()
+        self._queue.put((function, args, future))
+        return future
+
+    def call(self, function, *args, timeout=None):
+        """submit() and wait for the commit; raises what the function raised."""
+        return self.submit(function, *args).result(timeout)
+
+    def _collect(self):
+        # Past the deadline, only what is already queued is taken.
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                conn = conn or self.connect()
+                outcomes = write_transaction(conn, lambda conn: apply_items(conn, [(f, args) for f, args, _ in batch]))
+            except Exception as e:
+                # The transaction itself failed (say the lock stayed busy): nothing in it was written.
+                outcomes = [(False, e)] * len(batch)
+            self.batches += 1
+            self.items += len(batch)
+            for (_, _, future), (ok, result) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+
+# The blood bank's intake queue, shared by every Streamlit session and the API in this process.
+intake = WriteQueue(connect_writer)